@@ -1,12 +1,18 @@
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.animation import FuncAnimation
+import os
 import socket
-import json
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+import wire  # noqa: E402
 
 socket_client = socket.socket(family=socket.AF_INET)
 socket_client.connect(("192.168.4.1", 80))
-socket_client.sendall("GET /stream HTTPS".encode())
+socket_client.sendall("GET /stream?format=binary HTTP/1.1\r\n\r\n".encode())
+
+decoder = wire.Decoder()
 
 plt.style.use('fast')
 
@@ -50,22 +56,21 @@ def animate(i):
     global index
 
     try:
-        data = socket_client.recv(1024)
-        data = json.loads(data)
-        print(data, end="\r")
+        for timestamp, gyro, accel, t in decoder.feed(socket_client.recv(1024)):
+            print(timestamp, gyro, accel, t, end="\r")
 
-        x[index] = index
-        gyro_x[index] = data["gyro"][0]
-        gyro_y[index] = data["gyro"][1]
-        gyro_z[index] = data["gyro"][2]
+            x[index] = index
+            gyro_x[index] = gyro[0]
+            gyro_y[index] = gyro[1]
+            gyro_z[index] = gyro[2]
 
-        accel_x[index] = data["accel"][0]
-        accel_y[index] = data["accel"][1]
-        accel_z[index] = data["accel"][2]
+            accel_x[index] = accel[0]
+            accel_y[index] = accel[1]
+            accel_z[index] = accel[2]
 
-        temp[index] = data["temp"]
+            temp[index] = t
 
-        index = (index + 1) % 100
+            index = (index + 1) % 100
     except:
         pass
     finally:
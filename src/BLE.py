@@ -19,6 +19,14 @@ pbt.off()
 _IRQ_CENTRAL_CONNECT = const(1)
 _IRQ_CENTRAL_DISCONNECT = const(2)
 _IRQ_GATTS_WRITE = const(3)
+_IRQ_MTU_EXCHANGED = const(21)
+_IRQ_CONNECTION_UPDATE = const(27)
+
+# ATT header of a notification, the payload is MTU - 3 bytes
+_ATT_HEADER_SIZE = const(3)
+_DEFAULT_MTU = const(23)
+# assumed until the central reports the connection interval
+_DEFAULT_INTERVAL_MS = const(30)
 
 _FLAG_WRITE = const(0x0008)
 _FLAG_NOTIFY = const(0x0010)
@@ -41,15 +49,24 @@ _ADV_APPEARANCE_GENERIC_COMPUTER = const(128)
 
 
 class BLEUART:
-    def __init__(self, ble, name, rxbuf=1000):
+    def __init__(self, ble, name, rxbuf=1000, mtu=247):
         self._ble = ble
         self._ble.active(True)
+        # preferred MTU, the central agrees to it (or less) in the exchange after connecting
+        self._ble.config(mtu=mtu)
         self._ble.irq(self._irq)
         ((self._tx_handle, self._rx_handle),
          ) = self._ble.gatts_register_services((_UART_SERVICE,))
         # Increase the size of the rx buffer and enable append mode.
         self._ble.gatts_set_buffer(self._rx_handle, rxbuf, True)
         self._connections = set()
+        # conn_handle -> negotiated MTU / connection interval in ms
+        self._mtu = {}
+        self._interval_ms = {}
+        # notifications refused because the stack's queue was full
+        self.congested = 0
+        # connections the last notify() could not send to
+        self._failed = set()
         self._rx_buffer = bytearray()
         self._handler = None
         # Optionally add services=[_UART_UUID], but this is likely to make the payload too large.
@@ -67,12 +84,20 @@ class BLEUART:
             print("_IRQ_CENTRAL_CONNECT")
             pbt.on()
             self._connections.add(conn_handle)
+
+            try:
+                self._ble.gattc_exchange_mtu(conn_handle)
+            except OSError:
+                # the central starts the exchange itself or stays at 23
+                pass
         elif event == _IRQ_CENTRAL_DISCONNECT:
             conn_handle, _, _ = data
             pbt.off()
             print('_IRQ_CENTRAL_DISCONNECT')
             if conn_handle in self._connections:
                 self._connections.remove(conn_handle)
+            self._mtu.pop(conn_handle, None)
+            self._interval_ms.pop(conn_handle, None)
             # Start advertising again to allow a new connection.
             self._advertise()
         elif event == _IRQ_GATTS_WRITE:
@@ -81,6 +106,14 @@ class BLEUART:
                 self._rx_buffer += self._ble.gatts_read(self._rx_handle)
                 if self._handler:
                     self._handler()
+        elif event == _IRQ_MTU_EXCHANGED:
+            conn_handle, mtu = data
+            self._mtu[conn_handle] = mtu
+        elif event == _IRQ_CONNECTION_UPDATE:
+            conn_handle, conn_interval, _, _, status = data
+            if status == 0:
+                # in units of 1.25 ms
+                self._interval_ms[conn_handle] = conn_interval * 5 // 4
 
     def any(self):
         return len(self._rx_buffer)
@@ -96,6 +129,49 @@ class BLEUART:
         for conn_handle in self._connections:
             self._ble.gatts_notify(conn_handle, self._tx_handle, data)
 
+    def connected(self):
+        return bool(self._connections)
+
+    def payload_size(self):
+        """Largest notification payload all connections accept."""
+        mtu = min((self._mtu.get(c, _DEFAULT_MTU) for c in self._connections),
+                  default=_DEFAULT_MTU)
+        return mtu - _ATT_HEADER_SIZE
+
+    def interval_ms(self):
+        """Longest connection interval of the connections."""
+        return max((self._interval_ms.get(c, _DEFAULT_INTERVAL_MS) for c in self._connections),
+                   default=_DEFAULT_INTERVAL_MS)
+
+    def notify(self, data, retry=False):
+        """
+        Sends data as one notification to every connection.
+
+        Args:
+            data (bytes): Notification payload.
+            retry (bool, optional): Only send to the connections the previous call failed on, with the same data. Defaults to False.
+
+        Returns:
+            bool: False if the stack's queue was full for any connection, the
+            data was not sent to it and should be offered again later with retry.
+        """
+        connections = self._connections
+        failed = set()
+
+        for conn_handle in self._failed if retry else connections:
+            if conn_handle not in connections:
+                # disconnected meanwhile
+                continue
+
+            try:
+                self._ble.gatts_notify(conn_handle, self._tx_handle, data)
+            except OSError:
+                self.congested += 1
+                failed.add(conn_handle)
+
+        self._failed = failed
+        return not failed
+
     def close(self):
         for conn_handle in self._connections:
             self._ble.gap_disconnect(conn_handle)
@@ -136,7 +212,7 @@ def advertising_payload(limited_disc=False, br_edr=False, name=None, services=No
     )
 
     if name:
-        _append(_ADV_TYPE_NAME, name)
+        _append(_ADV_TYPE_NAME, name.encode() if isinstance(name, str) else name)
 
     if services:
         for uuid in services:
@@ -12,6 +12,7 @@ THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR I
 """
 
 import machine
+import struct
 from time import sleep
 
 ACCEL_RANGE_2G = 2
@@ -56,6 +57,53 @@ LPF_RANGES_TO_HEX = {
     260: 0x06
 }
 
+# LSB per unit for each range, used to convert raw readings
+ACCEL_RANGES_TO_SCALE = {
+    2: 16384.0,
+    4: 8192.0,
+    8: 4096.0,
+    16: 2048.0
+}
+
+GYRO_RANGES_TO_SCALE = {
+    250: 131.0,
+    500: 65.5,
+    1000: 32.8,
+    2000: 16.4
+}
+
+# accel xyz, temp, gyro xyz as big-endian int16 starting at ACCEL_XOUT_H (0x3B)
+RAW_DATA_FORMAT = ">hhhhhhh"
+RAW_DATA_SIZE = 14
+
+# FIFO registers and bits
+FIFO_SIZE = 1024
+FIFO_EN_TEMP = 0x80
+FIFO_EN_GYRO = 0x70
+FIFO_EN_ACCEL = 0x08
+USER_CTRL_FIFO_EN = 0x40
+USER_CTRL_FIFO_RESET = 0x04
+INT_FIFO_OFLOW = 0x10
+INT_DATA_RDY = 0x01
+
+# offset registers, XA_OFFS_H (factory trimmed, bit 0 of each low byte is
+# reserved) and XG_OFFS_USRH, in LSB of the +-16 g and +-1000 deg/s ranges
+ACCEL_OFFSET_REG = 0x06
+GYRO_OFFSET_REG = 0x13
+ACCEL_OFFSET_SCALE = 2048.0
+GYRO_OFFSET_SCALE = 32.8
+
+# configuration registers mirrored in RAM, see _read_config
+SMPLRT_DIV = 0x19
+CONFIG = 0x1A
+GYRO_CONFIG = 0x1B
+ACCEL_CONFIG = 0x1C
+
+# INT_PIN_CFG bits
+INT_PIN_ACTIVE_LOW = 0x80
+INT_PIN_LATCH = 0x20
+INT_PIN_RD_CLEAR = 0x10
+
 ACCEL_RANGES_TO_VALUE = {v: k for k, v in ACCEL_RANGES_TO_HEX.items()}
 GYRO_RANGES_TO_VALUE = {v: k for k, v in GYRO_RANGES_TO_HEX.items()}
 LPF_RANGES_TO_VALUE = {v: k for k, v in LPF_RANGES_TO_HEX.items()}
@@ -76,10 +124,56 @@ class MPU6050:
         self.accel_offset = (0, 0, 0)
         self.gyro_offset = (0, 0, 0)
 
+        self._raw = bytearray(RAW_DATA_SIZE)
+        # register -> last value written or read, only for the configuration registers
+        self._shadow = {}
+
+        # scale factors are cached by write_*_range so reads never touch the
+        # range registers; seeded from the chip, which keeps its ranges over
+        # a soft reboot of the ESP32. A chip that does not answer yet gets
+        # the power-on scales, as before the seeding, until write_*_range
+        try:
+            self.accel_scale = ACCEL_RANGES_TO_SCALE[self.read_accel_range()]
+            self.gyro_scale = GYRO_RANGES_TO_SCALE[self.read_gyro_range()]
+        except OSError:
+            self.accel_scale = ACCEL_RANGES_TO_SCALE[ACCEL_RANGE_2G]
+            self.gyro_scale = GYRO_RANGES_TO_SCALE[GYRO_RANGE_250DPS]
+        # (accel, gyro) bytes last written to the offset registers, for restore()
+        self._offsets = None
+
+        self._fifo_frame = 0
+        self._fifo_buf = None
+        # INT_FIFO_OFLOW as INT_ENABLE had it before enable_fifo, disable_fifo puts it back
+        self._fifo_oflow_int = 0
+
     def wake(self) -> None:
         """Wake up the MPU-6050."""
         self.i2c.writeto_mem(self.address, 0x6B, bytes([0x01]))
 
+    def reset(self) -> None:
+        """Resets all registers, including the offset registers, to their power-on values. Call wake() afterwards."""
+        self.i2c.writeto_mem(self.address, 0x6B, bytes([0x80]))
+        sleep(0.1)
+        self._shadow.clear()
+        self._offsets = None
+        self.accel_scale = ACCEL_RANGES_TO_SCALE[ACCEL_RANGE_2G]
+        self.gyro_scale = GYRO_RANGES_TO_SCALE[GYRO_RANGE_250DPS]
+
+    def restore(self) -> None:
+        """
+        Wakes the MPU-6050 and writes back the configuration and offset
+        registers set through this driver, after the chip lost them (brown-out)
+        or stopped answering. Interrupts and the FIFO are left to their users.
+        """
+        self.wake()
+
+        for register, value in self._shadow.items():
+            self.i2c.writeto_mem(self.address, register, bytes([value]))
+
+        if self._offsets:
+            self.i2c.writeto_mem(self.address, ACCEL_OFFSET_REG, self._offsets[0])
+            self.i2c.writeto_mem(self.address, GYRO_OFFSET_REG, self._offsets[1])
+
     def sleep(self) -> None:
         """Places MPU-6050 in sleep mode (low power consumption). Stops the internal reading of new data. Any calls to get gyro or accel data while in sleep mode will remain unchanged - the data is not being updated internally within the MPU-6050!"""
         self.i2c.writeto_mem(self.address, 0x6B, bytes([0x40]))
@@ -97,29 +191,18 @@ class MPU6050:
 
     def read_gyro_range(self) -> int:
         """Reads the gyroscope range setting."""
-        value = (self.i2c.readfrom_mem(self.address, 0x1B, 1)[0])
-        return GYRO_RANGES_TO_VALUE[value]
+        # the self-test bits share the register
+        return GYRO_RANGES_TO_VALUE[self._read_config(GYRO_CONFIG) & 0x18]
 
     def write_gyro_range(self, range: int) -> None:
         """Sets the gyroscope range setting."""
-        self.i2c.writeto_mem(self.address, 0x1B, bytes(
-            [GYRO_RANGES_TO_HEX[range]]))
+        self._write_config(GYRO_CONFIG, GYRO_RANGES_TO_HEX[range])
+        self.gyro_scale = GYRO_RANGES_TO_SCALE[range]
 
     def read_gyro_data(self) -> tuple[float, float, float]:
         """Read the gyroscope data, in a (x, y, z) tuple."""
 
-        # set the modified based on the gyro range (need to divide to calculate)
-        gr: int = self.read_gyro_range()
-        modifier: float = None
-
-        if gr == 250:
-            modifier = 131.0
-        elif gr == 500:
-            modifier = 65.5
-        elif gr == 1000:
-            modifier = 32.8
-        elif gr == 2000:
-            modifier = 16.4
+        modifier: float = self.gyro_scale
 
         # read data
         # read 6 bytes (gyro data)
@@ -136,29 +219,17 @@ class MPU6050:
 
     def read_accel_range(self) -> int:
         """Reads the accelerometer range setting."""
-        value = self.i2c.readfrom_mem(self.address, 0x1C, 1)[0]
-        return ACCEL_RANGES_TO_VALUE[value]
+        return ACCEL_RANGES_TO_VALUE[self._read_config(ACCEL_CONFIG) & 0x18]
 
     def write_accel_range(self, range: int) -> None:
         """Sets the gyro accelerometer setting."""
-        value = ACCEL_RANGES_TO_HEX[range]
-        self.i2c.writeto_mem(self.address, 0x1C, bytes([value]))
+        self._write_config(ACCEL_CONFIG, ACCEL_RANGES_TO_HEX[range])
+        self.accel_scale = ACCEL_RANGES_TO_SCALE[range]
 
     def read_accel_data(self) -> tuple[float, float, float]:
         """Read the accelerometer data, in a (x, y, z) tuple."""
 
-        # set the modified based on the gyro range (need to divide to calculate)
-        ar: int = self.read_accel_range()
-        modifier: float = None
-
-        if ar == 2:
-            modifier = 16384.0
-        elif ar == 4:
-            modifier = 8192.0
-        elif ar == 8:
-            modifier = 4096.0
-        elif ar == 16:
-            modifier = 2048.0
+        modifier: float = self.accel_scale
 
         # read data
         # read 6 bytes (accel data)
@@ -173,17 +244,322 @@ class MPU6050:
 
         return (x, y, z)
 
+    def read_raw_into(self, buf) -> None:
+        """
+        Reads accel, temperature and gyro registers (0x3B-0x48) in a single
+        I2C transaction into buf. No scaling or offsets are applied.
+
+        Args:
+            buf (bytearray): Preallocated buffer of at least 14 bytes.
+        """
+        self.i2c.readfrom_mem_into(self.address, 0x3B, buf)
+
+    def decode_raw(self, buf, offset: int = 0) -> tuple:
+        """
+        Converts a raw 14-byte block, as read by read_raw_into, into
+        calibrated values.
+
+        Returns:
+            tuple: ((gx, gy, gz), (ax, ay, az), temp)
+        """
+        ax, ay, az, t, gx, gy, gz = struct.unpack_from(
+            RAW_DATA_FORMAT, buf, offset)
+
+        gs = self.gyro_scale
+        go = self.gyro_offset
+        acs = self.accel_scale
+        ao = self.accel_offset
+
+        return (
+            (gx / gs - go[0], gy / gs - go[1], gz / gs - go[2]),
+            (ax / acs - ao[0], ay / acs - ao[1], az / acs - ao[2]),
+            t / 340.0 + 36.53,
+        )
+
+    def decode_raw_into(self, buf, out, offset: int = 0) -> None:
+        """
+        Like decode_raw, without allocating tuples.
+
+        Args:
+            buf (bytearray): Raw block, as read by read_raw_into.
+            out (array): array("f") of at least 7 values, receives gx, gy, gz, ax, ay, az, temp.
+            offset (int, optional): Start of the block in buf. Defaults to 0.
+        """
+        gs = self.gyro_scale
+        go = self.gyro_offset
+        acs = self.accel_scale
+        ao = self.accel_offset
+
+        for i in range(7):
+            v = (buf[offset] << 8) | buf[offset + 1]
+            if v & 0x8000:
+                v -= 0x10000
+            offset += 2
+
+            # register order is accel, temp, gyro
+            if i < 3:
+                out[3 + i] = v / acs - ao[i]
+            elif i == 3:
+                out[6] = v / 340.0 + 36.53
+            else:
+                out[i - 4] = v / gs - go[i - 4]
+
+    def decode_counts_into(self, buf, out, offset: int = 0) -> None:
+        """
+        Like decode_raw_into, but leaves the values in raw counts, uncalibrated.
+
+        Args:
+            buf (bytearray): Raw block, as read by read_raw_into.
+            out (array): array("i") of at least 7 values, receives gx, gy, gz, ax, ay, az, temp.
+            offset (int, optional): Start of the block in buf. Defaults to 0.
+        """
+        for i in range(7):
+            v = (buf[offset] << 8) | buf[offset + 1]
+            if v & 0x8000:
+                v -= 0x10000
+            offset += 2
+
+            # register order is accel, temp, gyro
+            if i < 3:
+                out[3 + i] = v
+            elif i == 3:
+                out[6] = v
+            else:
+                out[i - 4] = v
+
+    def read_all(self) -> tuple:
+        """
+        Reads gyro, accel and temperature with one burst read.
+
+        Returns:
+            tuple: ((gx, gy, gz), (ax, ay, az), temp), same units as
+            read_gyro_data, read_accel_data and read_temperature.
+        """
+        self.i2c.readfrom_mem_into(self.address, 0x3B, self._raw)
+        return self.decode_raw(self._raw)
+
+    def enable_data_ready_interrupt(self, active_low: bool = False, latch: bool = False) -> None:
+        """
+        Drives the INT pin every time a new sample is written to the data registers.
+
+        Args:
+            active_low (bool, optional): Whether INT is active low. Defaults to False.
+            latch (bool, optional): Hold INT until the next register read instead of a 50 us pulse. Defaults to False.
+        """
+        cfg = INT_PIN_RD_CLEAR
+
+        if active_low:
+            cfg |= INT_PIN_ACTIVE_LOW
+        if latch:
+            cfg |= INT_PIN_LATCH
+
+        self.i2c.writeto_mem(self.address, 0x37, bytes([cfg]))
+        int_enable = self.i2c.readfrom_mem(self.address, 0x38, 1)[0]
+        self.i2c.writeto_mem(self.address, 0x38, bytes(
+            [int_enable | INT_DATA_RDY]))
+
+    def disable_data_ready_interrupt(self) -> None:
+        """Stops driving the INT pin on new samples."""
+        int_enable = self.i2c.readfrom_mem(self.address, 0x38, 1)[0]
+        self.i2c.writeto_mem(self.address, 0x38, bytes(
+            [int_enable & ~INT_DATA_RDY & 0xFF]))
+
+    def write_sample_rate_divider(self, divider: int) -> None:
+        """
+        Sets SMPLRT_DIV. Sample rate = gyro output rate / (1 + divider), where
+        the gyro output rate is 8 kHz with the DLPF disabled and 1 kHz otherwise.
+        """
+        self._write_config(SMPLRT_DIV, divider & 0xFF)
+
+    def read_sample_rate_divider(self) -> int:
+        return self._read_config(SMPLRT_DIV)
+
+    def read_sample_rate(self) -> float:
+        """Reads the sample rate, in Hz, from SMPLRT_DIV and the DLPF setting."""
+        divider = self._read_config(SMPLRT_DIV)
+        dlpf = self._read_config(CONFIG) & 0x07
+        base = 8000 if dlpf in (0, 7) else 1000
+        return base / (1 + divider)
+
+    def write_sample_rate(self, rate_hz: int) -> None:
+        """Sets the closest sample rate to rate_hz for the current DLPF setting."""
+        if not rate_hz > 0:
+            raise ValueError("sample rate must be above 0 Hz")
+
+        dlpf = self._read_config(CONFIG) & 0x07
+        base = 8000 if dlpf in (0, 7) else 1000
+        divider = min(255, max(0, round(base / rate_hz) - 1))
+        self.write_sample_rate_divider(divider)
+
+    def enable_fifo(self, temp: bool = True) -> None:
+        """
+        Enables the FIFO for accel and gyro data, and optionally temperature.
+        The FIFO is reset, so any previously buffered data is discarded.
+
+        Args:
+            temp (bool, optional): Whether to include temperature in each frame. Defaults to True.
+        """
+        fifo_en = FIFO_EN_ACCEL | FIFO_EN_GYRO
+
+        if temp:
+            fifo_en |= FIFO_EN_TEMP
+
+        self.i2c.writeto_mem(self.address, 0x23, bytes([fifo_en]))
+        int_enable = self.i2c.readfrom_mem(self.address, 0x38, 1)[0]
+
+        if not self._fifo_frame:
+            # keeps the value from before the first call when enabled again
+            self._fifo_oflow_int = int_enable & INT_FIFO_OFLOW
+
+        self.i2c.writeto_mem(self.address, 0x38, bytes(
+            [int_enable | INT_FIFO_OFLOW]))
+
+        self._fifo_frame = RAW_DATA_SIZE if temp else RAW_DATA_SIZE - 2
+        # largest whole number of frames the FIFO can hold
+        self._fifo_buf = bytearray(
+            (FIFO_SIZE // self._fifo_frame) * self._fifo_frame)
+        self.reset_fifo()
+
+    def disable_fifo(self) -> None:
+        """Stops writing samples to the FIFO, and the overflow interrupt enable_fifo turned on."""
+        self.i2c.writeto_mem(self.address, 0x6A, bytes([0x00]))
+        self.i2c.writeto_mem(self.address, 0x23, bytes([0x00]))
+
+        if self._fifo_frame:
+            # the other interrupts (data ready) may have changed since, only the overflow bit goes back
+            int_enable = self.i2c.readfrom_mem(self.address, 0x38, 1)[0]
+            self.i2c.writeto_mem(self.address, 0x38, bytes(
+                [(int_enable & ~INT_FIFO_OFLOW & 0xFF) | self._fifo_oflow_int]))
+
+        self._fifo_frame = 0
+        self._fifo_buf = None
+
+    def reset_fifo(self) -> None:
+        """Clears the FIFO and keeps it enabled."""
+        self.i2c.writeto_mem(self.address, 0x6A, bytes(
+            [USER_CTRL_FIFO_RESET]))
+        self.i2c.writeto_mem(self.address, 0x6A, bytes([USER_CTRL_FIFO_EN]))
+
+    def read_fifo_count(self) -> int:
+        """Returns the number of bytes currently stored in the FIFO."""
+        data = self.i2c.readfrom_mem(self.address, 0x72, 2)
+        return (data[0] << 8) | data[1]
+
+    def read_fifo_into(self, buf) -> tuple:
+        """
+        Drains whole frames from the FIFO into buf using bulk reads.
+
+        On overflow the FIFO no longer starts on a frame boundary, so it is
+        reset and no frames are returned.
+
+        Args:
+            buf (bytearray): Destination buffer, a multiple of the frame size is best.
+
+        Returns:
+            tuple: (frames read, overflow)
+        """
+        frame = self._fifo_frame
+        status = self.i2c.readfrom_mem(self.address, 0x3A, 1)[0]
+        count = self.read_fifo_count()
+
+        if status & INT_FIFO_OFLOW or count >= FIFO_SIZE:
+            self.reset_fifo()
+            return 0, True
+
+        frames = min(count, len(buf)) // frame
+
+        if frames:
+            self.i2c.readfrom_mem_into(
+                self.address, 0x74, memoryview(buf)[:frames * frame])
+
+        return frames, False
+
+    def read_fifo(self) -> tuple:
+        """
+        Drains the FIFO and decodes every frame.
+
+        Returns:
+            tuple: (samples, overflow) where samples is a list of
+            ((gx, gy, gz), (ax, ay, az), temp) tuples, oldest first. temp is
+            None when the FIFO was enabled without temperature.
+        """
+        buf = self._fifo_buf
+        frame = self._fifo_frame
+        frames, overflow = self.read_fifo_into(buf)
+        samples = []
+
+        for i in range(frames):
+            if frame == RAW_DATA_SIZE:
+                samples.append(self.decode_raw(buf, i * frame))
+            else:
+                samples.append(self._decode_frame_no_temp(buf, i * frame))
+
+        return samples, overflow
+
+    def _decode_frame_no_temp(self, buf, offset: int) -> tuple:
+        ax, ay, az, gx, gy, gz = struct.unpack_from(">hhhhhh", buf, offset)
+
+        gs = self.gyro_scale
+        go = self.gyro_offset
+        acs = self.accel_scale
+        ao = self.accel_offset
+
+        return (
+            (gx / gs - go[0], gy / gs - go[1], gz / gs - go[2]),
+            (ax / acs - ao[0], ay / acs - ao[1], az / acs - ao[2]),
+            None,
+        )
+
+    def read_offset_registers(self) -> tuple:
+        """
+        Reads the chip's own offset registers, which are added to every reading.
+
+        Returns:
+            tuple: ((ax, ay, az), (gx, gy, gz)) raw int16 values, see ACCEL_OFFSET_SCALE and GYRO_OFFSET_SCALE.
+        """
+        accel = struct.unpack(">hhh", self.i2c.readfrom_mem(
+            self.address, ACCEL_OFFSET_REG, 6))
+        gyro = struct.unpack(">hhh", self.i2c.readfrom_mem(
+            self.address, GYRO_OFFSET_REG, 6))
+        return accel, gyro
+
+    def write_offset_registers(self, accel: tuple, gyro: tuple) -> None:
+        """Writes raw int16 values to the accel and gyro offset registers, bit 0 of the accel values is kept as read."""
+        current, _ = self.read_offset_registers()
+        accel = [(a & ~1) | (c & 1) for a, c in zip(accel, current)]
+        self._offsets = (struct.pack(">hhh", *accel), struct.pack(">hhh", *gyro))
+
+        self.i2c.writeto_mem(self.address, ACCEL_OFFSET_REG, self._offsets[0])
+        self.i2c.writeto_mem(self.address, GYRO_OFFSET_REG, self._offsets[1])
+
     def read_lpf_range(self) -> int:
-        value = self.i2c.readfrom_mem(self.address, 0x1A, 1)[0]
-        return LPF_RANGES_TO_VALUE[value]
+        # EXT_SYNC_SET shares the register
+        return LPF_RANGES_TO_VALUE[self._read_config(CONFIG) & 0x07]
 
     def write_lpf_range(self, range: int) -> None:
         """
         Sets low pass filter range.
         """
 
-        value = LPF_RANGES_TO_HEX[range]
-        self.i2c.writeto_mem(self.address, 0x1A, bytes([value]))
+        self._write_config(CONFIG, LPF_RANGES_TO_HEX[range])
+
+    def _read_config(self, register: int) -> int:
+        """
+        Reads a configuration register from the RAM shadow, the bus is only
+        used the first time. Every write goes through _write_config, which
+        keeps the shadow current.
+        """
+        value = self._shadow.get(register)
+
+        if value is None:
+            value = self.i2c.readfrom_mem(self.address, register, 1)[0]
+            self._shadow[register] = value
+
+        return value
+
+    def _write_config(self, register: int, value: int) -> None:
+        self.i2c.writeto_mem(self.address, register, bytes([value]))
+        self._shadow[register] = value
 
     def _translate_pair(self, high: int, low: int) -> int:
         """Converts a byte pair to a usable value. Borrowed from https://github.com/m-rtijn/mpu6050/blob/0626053a5e1182f4951b78b8326691a9223a5f7d/mpu6050/mpu6050.py#L76C39-L76C39."""
@@ -208,6 +584,7 @@ class MPU6050:
     def calibrate(self, total_samples: int = 100, delay_ms: int = 100, az_0: bool = True) -> None:
         """
         Calibrates the gyroscope and accelerometer.
+        calibration.calibrate does the same at the hardware rate, with early stopping.
 
         Args:
             total_samples (int, optional): Number of samples to take. Defaults to 100.
@@ -222,8 +599,7 @@ class MPU6050:
         ax, ay, az = 0, 0, 0
 
         for _ in range(total_samples):
-            gyro = self.read_gyro_data()
-            accel = self.read_accel_data()
+            gyro, accel, _ = self.read_all()
 
             gx, gy, gz = gx + gyro[0], gy + gyro[1], gz + gyro[2]
             ax, ay, az = ax + accel[0], ay + accel[1], az + accel[2]
@@ -0,0 +1,250 @@
+"""
+Sample streaming over the BLE UART, a low-power alternative to /stream.
+
+A central (phone) writes "stream" or "stream <rate>" to the UART RX
+characteristic to start, "stop" to end; disconnecting also ends it. The
+commands arrive in the BLE IRQ, they are only recorded there and applied
+by process() from the main loop, which owns the streaming state. The
+samples are then sent on the TX characteristic in the binary wire format
+(see wire.py): a SCHEMA message first, then SAMPLE messages packed
+back to back, as many whole messages per notification as the negotiated
+MTU allows, so wire.Decoder reads the notifications as one byte stream.
+
+A notification is sent at most once per connection interval, more are
+only queued in the stack, which holds a few before gatts_notify fails.
+When it fails the packed notification is kept and offered again in the
+next interval, only to the connections that refused it. Samples wait in
+the ring meanwhile. When more than two notifications' worth are waiting,
+the oldest ones are skipped and counted as dropped, so latency stays
+bounded on a slow link.
+
+At the default MTU of 23 one sample fits per notification, which is too
+few for 100 Hz at common connection intervals; ask for a lower rate
+there (samples are then averaged, see decimate.py).
+"""
+
+import wire
+from decimate import Decimator, factor_for
+from MPU6050 import RAW_DATA_SIZE
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+# notifications' worth of samples kept waiting before the oldest are dropped
+MAX_BACKLOG = 2
+# pending command that stops the stream, any other is a rate to start at
+STOP = "stop"
+REPORT_INTERVAL_MS = 5000
+
+
+class BLEStreamer:
+    def __init__(self, uart, ring, mpu, sample_rate_hz: float = 100,
+                 rate_hz: float = 50):
+        """
+        Args:
+            uart (BLEUART): Connection to notify on.
+            ring (SampleRing): Source of the samples.
+            mpu (MPU6050): Scales and offsets for the SCHEMA message.
+            sample_rate_hz (float, optional): Rate the ring is filled at. Defaults to 100.
+            rate_hz (float, optional): Rate streamed when "stream" has no rate. Defaults to 50.
+        """
+        self.uart = uart
+        self.ring = ring
+        self.mpu = mpu
+        self.sample_rate_hz = sample_rate_hz
+        self.rate_hz = rate_hz
+        self.active = False
+        self._rate_hz = rate_hz
+        # STOP or the rate of a "stream" command, set by command(), applied by process()
+        self._pending = None
+
+        self.notifications = 0
+        self.bytes_sent = 0
+        self.samples_sent = 0
+        self.dropped = 0
+
+        self._cursor = ring.reader()
+        self._decimator = None
+        self._raw = bytearray(RAW_DATA_SIZE)
+        # sized for the largest MTU, only payload_size() bytes are used
+        self._packet = bytearray(512)
+        self._packet_mv = memoryview(self._packet)
+        # packed but not yet sent, bytes and samples
+        self._length = 0
+        self._samples = 0
+        # the packet was refused by some connections, resend it only to them
+        self._retry = False
+        # schema bytes still to send ahead of the samples
+        self._schema = None
+        self._last_notify = 0
+        self._last_report = 0
+        self._reported_drops = 0
+
+    def command(self, text: str) -> bool:
+        """
+        Handles a line received on the UART, called from the BLE IRQ. A
+        stream command is only recorded, the next process() applies it.
+
+        Returns:
+            bool: True if it was a stream command.
+        """
+        words = text.split()
+
+        if not words:
+            return False
+
+        if words[0] == "stream":
+            try:
+                rate = float(words[1]) if len(words) > 1 else self.rate_hz
+            except ValueError:
+                return False
+
+            self._pending = rate
+            return True
+
+        if words[0] == "stop":
+            self._pending = STOP
+            return True
+
+        return False
+
+    def reconfigure(self, sample_rate_hz: float) -> None:
+        """Resends the schema and follows the new rate after a change of the sensor settings."""
+        self.sample_rate_hz = sample_rate_hz
+
+        if self.active:
+            self.start(self._rate_hz)
+
+    def start(self, rate_hz: float) -> None:
+        self._rate_hz = rate_hz
+        factor = factor_for(self.sample_rate_hz, rate_hz)
+        self._decimator = Decimator(factor) if factor > 1 else None
+        self._cursor.seq = self.ring.head
+        self._schema = memoryview(wire.encode_schema(self.mpu))
+        self._length = 0
+        self._retry = False
+        self.active = True
+
+    def stop(self) -> None:
+        self.active = False
+        self._decimator = None
+        self._schema = None
+
+    def process(self) -> int:
+        """
+        Sends at most one notification if a connection interval has passed.
+
+        Returns:
+            int: Number of samples sent.
+        """
+        ring = self.ring
+        cursor = self._cursor
+        pending = self._pending
+
+        if pending is not None:
+            self._pending = None
+
+            if pending == STOP:
+                self.stop()
+            else:
+                self.start(pending)
+
+        if not self.active or not self.uart.connected():
+            if self.active:
+                self.stop()
+            cursor.seq = ring.head
+            return 0
+
+        now = ticks_ms()
+
+        if ticks_diff(now, self._last_notify) < self.uart.interval_ms():
+            return 0
+
+        if self._length == 0:
+            self._samples = self._pack(self.uart.payload_size())
+
+        if self._length == 0:
+            return 0
+
+        self._last_notify = now
+        self._report(now)
+
+        if not self.uart.notify(self._packet_mv[:self._length], self._retry):
+            # the stack is congested, offer the same packet next interval
+            self._retry = True
+            return 0
+
+        self._retry = False
+        self.notifications += 1
+        self.bytes_sent += self._length
+        self.samples_sent += self._samples
+        self._length = 0
+        return self._samples
+
+    def _pack(self, size: int) -> int:
+        """Fills the packet with the schema and whole SAMPLE messages, returns the samples packed."""
+        packet = self._packet
+        size = min(size, len(packet))
+        length = 0
+
+        if self._schema is not None:
+            # the only message that may span notifications, the decoder reassembles it
+            length = min(size, len(self._schema))
+            packet[:length] = self._schema[:length]
+            self._schema = self._schema[length:] if length < len(self._schema) else None
+
+        ring = self.ring
+        cursor = self._cursor
+        raw = self._raw
+        decimator = self._decimator
+        factor = decimator.factor if decimator else 1
+        per_packet = max(1, size // wire.SAMPLE_SIZE)
+        backlog = ring.available(cursor) - MAX_BACKLOG * per_packet * factor
+
+        if backlog > 0:
+            cursor.seq += backlog
+            self.dropped += backlog
+
+        samples = 0
+
+        while length + wire.SAMPLE_SIZE <= size:
+            timestamp = ring.read_into(cursor, raw)
+
+            if timestamp is None:
+                break
+
+            if decimator is None:
+                wire.encode_sample(raw, timestamp, self._packet_mv[length:])
+            elif decimator.add(raw, timestamp):
+                wire.encode_sample(decimator.out, decimator.timestamp,
+                                   self._packet_mv[length:])
+            else:
+                continue
+
+            length += wire.SAMPLE_SIZE
+            samples += 1
+
+        self.dropped += cursor.dropped
+        cursor.dropped = 0
+        self._length = length
+        return samples
+
+    def _report(self, now: int) -> None:
+        if self.dropped == self._reported_drops:
+            return
+
+        if ticks_diff(now, self._last_report) < REPORT_INTERVAL_MS:
+            return
+
+        print("BLE stream: {} samples dropped, {} notifications refused".format(
+            self.dropped - self._reported_drops, self.uart.congested))
+        self._reported_drops = self.dropped
+        self._last_report = now
@@ -1 +1,9 @@
 # boot.py -- run on boot-up
+import boottime
+import config
+import machine
+
+if config.CPU_FREQ_HZ:
+    machine.freq(config.CPU_FREQ_HZ)
+
+boottime.mark("boot.py")
@@ -0,0 +1,33 @@
+"""
+Boot phase timing.
+
+mark() is called at the end of every startup phase (boot.py, imports,
+Wi-Fi, BLE, sensor, calibration, server, ...) and prints the time since
+reset together with the time the phase took. ticks_ms starts at zero on
+reset, so the first mark includes the firmware's own startup.
+"""
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    from time import monotonic
+
+    _start = monotonic()
+
+    def ticks_ms():
+        return int((monotonic() - _start) * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+# (phase, ms since reset) in the order they were marked
+phases = []
+
+
+def mark(phase: str) -> int:
+    """Records the end of a startup phase, returns the ms since reset."""
+    now = ticks_ms()
+    took = ticks_diff(now, phases[-1][1]) if phases else now
+    phases.append((phase, now))
+    print("[boot] {:>6} ms  {:>+6} ms  {}".format(now, took, phase))
+    return now
@@ -0,0 +1,560 @@
+"""
+Serialize-once fan-out of ring samples to /stream subscribers.
+
+Each new sample is encoded at most once per format (JSON text, binary
+wire message) and the same immutable buffer is offered to every
+subscriber of that format, together with a WebSocket frame header that is
+also built once.
+
+Every subscriber has a bounded queue of those shared buffers, drained by
+its own task. When the queue is full the client's overflow policy decides
+what is lost:
+
+    drop_oldest  keep the newest samples (default, lowest latency)
+    drop_newest  keep the queued samples, refuse new ones
+    downsample   halve the queued samples and only accept every 2nd, 4th, ...
+                 sample until the client catches up again
+
+A client whose socket has not drained for max_lag_ms is disconnected.
+Closed clients are flagged during a pass and pruned once it is over.
+
+Clients pick a rate and a channel subset (/stream?rate=30&ch=accel,gyro).
+Clients below the full sample rate are fed from a Decimator (see
+decimate.py) shared by every client with the same decimation factor, and
+each decimated sample is again encoded once per format and channel set.
+
+Clients of the delta format (?format=delta) get DELTA frames of about
+delta_frame_ms worth of samples from one DeltaEncoder (see codec.py) per
+decimation factor, trading that much latency for less data: about 60 %
+of the SAMPLE messages and a tenth of the JSON text on a noisy trace,
+less on a quiet sensor (tools/bench_codec.py).
+
+Clients of the attitude channel get the fused orientation from the
+attached AttitudeEstimator instead of samples, at most once per publish
+pass and no faster than their rate.
+
+Everything above streams the first sensor. With several sensors (see
+sensorarray.py) a client can ask for a selection of them
+(/stream?sensors=all or ?sensors=0,1) and then gets one SENSOR message or
+JSON object, with the sensor id, per sensor of every record, at the full
+rate and with all channels.
+"""
+
+import json
+import websocket
+import wire
+from codec import DeltaEncoder
+from decimate import Decimator, factor_for
+from MPU6050 import RAW_DATA_SIZE
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter_ns
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DOWNSAMPLE = "downsample"
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST, DOWNSAMPLE)
+
+MAX_STRIDE = 64
+
+CHANNEL_IMU = "imu"
+CHANNEL_ATTITUDE = "attitude"
+
+BINARY_HEADER = websocket.frame_header(websocket.OP_BINARY, wire.SAMPLE_SIZE)
+SCHEMA_HEADER = websocket.frame_header(websocket.OP_BINARY, wire.SCHEMA_SIZE)
+SENSOR_HEADER = websocket.frame_header(websocket.OP_BINARY, wire.SENSOR_SIZE)
+ATTITUDE_HEADER = websocket.frame_header(
+    websocket.OP_BINARY, wire.ATTITUDE_SIZE)
+
+
+class StreamClient:
+    """A /stream subscriber, its send queue and its send counters."""
+
+    def __init__(self, writer, fmt: str, ws=None, queue_size: int = 32,
+                 policy: str = DROP_OLDEST, max_lag_ms: int = 5000,
+                 channel: str = CHANNEL_IMU, mask: int = wire.CH_ALL,
+                 rate_hz: float = 0, sensors: int = 0):
+        """
+        Args:
+            writer (StreamWriter): Client connection.
+            fmt (str): wire.FORMAT_JSON, wire.FORMAT_BINARY or wire.FORMAT_DELTA.
+            ws (WebSocket, optional): Set for WebSocket clients. Defaults to None.
+            queue_size (int, optional): Frames queued at most. Defaults to 32.
+            policy (str, optional): Overflow policy, one of POLICIES. Defaults to DROP_OLDEST.
+            max_lag_ms (int, optional): Stall time after which the client is dropped. Defaults to 5000.
+            channel (str, optional): CHANNEL_IMU or CHANNEL_ATTITUDE. Defaults to CHANNEL_IMU.
+            mask (int, optional): wire.CH_* bits of the IMU channels to send. Defaults to wire.CH_ALL.
+            rate_hz (float, optional): Requested rate, 0 for the full sample rate. Defaults to 0.
+            sensors (int, optional): Bit mask of the sensor ids to stream as SENSOR messages, 0 for the first sensor's samples. Defaults to 0.
+        """
+        if policy not in POLICIES:
+            raise ValueError("unknown overflow policy {}".format(policy))
+        if channel not in (CHANNEL_IMU, CHANNEL_ATTITUDE):
+            raise ValueError("unknown channel {}".format(channel))
+        if fmt == wire.FORMAT_DELTA and mask != wire.CH_ALL:
+            raise ValueError("the delta format carries all channels")
+        if sensors and (fmt == wire.FORMAT_DELTA or channel != CHANNEL_IMU
+                        or mask != wire.CH_ALL or rate_hz):
+            raise ValueError("several sensors stream at the full rate with all channels, as binary or JSON")
+
+        self.writer = writer
+        self.ws = ws
+        self.format = fmt
+        self.channel = channel
+        self.mask = mask
+        self.rate_hz = rate_hz
+        self.sensors = sensors
+        # set by Broadcaster.add
+        self.factor = 1
+        self._next_attitude = 0
+        self.policy = policy
+        self.max_lag_ms = max_lag_ms
+        self.settings = {}
+
+        self.bytes_sent = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        # time from the first queued frame of a batch until drain() returned
+        self.last_send_us = 0
+        # metrics.Histogram of last_send_us, None to skip it
+        self.send_time = None
+
+        self.busy = False
+        self.closed = False
+
+        # fixed-size ring of (header, payload) references
+        self._size = queue_size
+        self._headers = [None] * queue_size
+        self._payloads = [None] * queue_size
+        self._first = 0
+        self._count = 0
+
+        self._stride = 1
+        self._offered = 0
+        self._send_start = 0
+
+    def queued(self) -> int:
+        return self._count
+
+    def offer(self, header, payload) -> None:
+        """Queues one frame without blocking, applying the overflow policy."""
+        now = ticks_us()
+
+        if self._count and ticks_diff(now, self._send_start) > self.max_lag_ms * 1000:
+            print("Client too slow: {}\n".format(self.peername()))
+            self.closed = True
+            return
+
+        self._offered += 1
+
+        if self._offered % self._stride:
+            self.frames_dropped += 1
+            return
+
+        if self._count == self._size:
+            if self.policy == DROP_NEWEST:
+                self.frames_dropped += 1
+                return
+            elif self.policy == DROP_OLDEST:
+                self._pop()
+                self.frames_dropped += 1
+            else:
+                self._halve()
+
+        if not self._count:
+            self._send_start = now
+
+        index = (self._first + self._count) % self._size
+        self._headers[index] = header
+        self._payloads[index] = payload
+        self._count += 1
+
+    def _pop(self) -> None:
+        self._headers[self._first] = None
+        self._payloads[self._first] = None
+        self._first = (self._first + 1) % self._size
+        self._count -= 1
+
+    def _halve(self) -> None:
+        """Keeps every second queued frame and halves the accepted rate."""
+        kept = 0
+
+        for i in range(0, self._count, 2):
+            src = (self._first + i) % self._size
+            dst = (self._first + kept) % self._size
+            self._headers[dst] = self._headers[src]
+            self._payloads[dst] = self._payloads[src]
+            kept += 1
+
+        for i in range(kept, self._count):
+            index = (self._first + i) % self._size
+            self._headers[index] = None
+            self._payloads[index] = None
+
+        self.frames_dropped += self._count - kept
+        self._count = kept
+        self._stride = min(MAX_STRIDE, self._stride * 2)
+
+    async def flush(self) -> None:
+        """Writes the queued frames and waits, at most max_lag_ms, for them to drain."""
+        if not self._count:
+            return
+
+        start = self._send_start
+
+        while self._count:
+            header = self._headers[self._first]
+            payload = self._payloads[self._first]
+            self._pop()
+
+            if header and self.ws:
+                self.writer.write(header)
+                self.bytes_sent += len(header)
+
+            self.writer.write(payload)
+            self.bytes_sent += len(payload)
+            self.frames_sent += 1
+
+        self.busy = True
+
+        try:
+            # a WebSocket's reader task writes pongs and closes too, its drain serialises them
+            drain = self.ws.drain() if self.ws else self.writer.drain()
+            await asyncio.wait_for(drain, self.max_lag_ms / 1000)
+        except asyncio.TimeoutError:
+            print("Client too slow: {}\n".format(self.peername()))
+            self.closed = True
+        finally:
+            self.busy = False
+
+        self.last_send_us = ticks_diff(ticks_us(), start)
+
+        if self.send_time:
+            self.send_time.observe(self.last_send_us)
+
+        if self._stride > 1:
+            # caught up, accept twice as many samples again
+            self._stride //= 2
+
+    def peername(self):
+        return self.writer.get_extra_info("peername")
+
+
+class Broadcaster:
+    def __init__(self, ring, mpu, sample_rate_hz: float = 100,
+                 delta_frame_ms: int = 100, sensors=None):
+        self.ring = ring
+        self.mpu = mpu
+        # every sensor of a ring record, mpu first
+        self.sensors = sensors if sensors else [mpu]
+        self.sample_rate_hz = sample_rate_hz
+        self.delta_frame_ms = delta_frame_ms
+        self.clients = []
+        self.estimator = None
+
+        # decimation factor -> shared Decimator, None for full rate
+        self.decimators = {}
+        # decimation factor -> DeltaEncoder, only while delta clients exist
+        self.encoders = {}
+
+        self._cursor = ring.reader()
+        # a whole record, the per-sensor encoders only look at the first block
+        self._raw = bytearray(ring.record_size)
+        self._packet = bytearray(wire.SAMPLE_SIZE)
+        self._sensor_packet = bytearray(wire.SENSOR_SIZE)
+        self._packed = bytearray(wire.PACKED_HEADER_SIZE + RAW_DATA_SIZE)
+        self._packed_mv = memoryview(self._packed)
+        self._attitude_packet = bytearray(wire.ATTITUDE_SIZE)
+        self._attitude_updates = 0
+        self._euler = [0.0, 0.0, 0.0]
+        # (format, mask) key -> (header, payload) for the sample being sent
+        self._encoded = {}
+        # (format, sensor) key -> (header, payload) for the record being sent
+        self._encoded_sensors = {}
+
+    def add(self, client: StreamClient) -> None:
+        client.factor = factor_for(self.sample_rate_hz, client.rate_hz)
+
+        if client.channel == CHANNEL_IMU and client.factor not in self.decimators:
+            self.decimators[client.factor] = Decimator(
+                client.factor) if client.factor > 1 else None
+
+        if (client.channel == CHANNEL_IMU and client.format == wire.FORMAT_DELTA
+                and client.factor not in self.encoders):
+            rate = self.sample_rate_hz / client.factor
+            samples = int(rate * self.delta_frame_ms / 1000 + 0.5)
+            self.encoders[client.factor] = DeltaEncoder(
+                min(255, max(1, samples)))
+
+        self.clients.append(client)
+
+    def remove(self, client: StreamClient) -> None:
+        if client in self.clients:
+            self.clients.remove(client)
+
+        self._prune_decimators()
+
+    def reconfigure(self, sample_rate_hz: float) -> None:
+        """
+        Follows a change of the sensor ranges or sample rate, once the ring
+        holds no samples taken before it.
+
+        Partial delta frames go out first, then binary clients get a new
+        SCHEMA message and every client is decimated for the new rate.
+        """
+        for factor, encoder in self.encoders.items():
+            length = encoder.flush()
+
+            if not length:
+                continue
+
+            header, payload = self._encode_delta(encoder, length)
+
+            for client in self.clients:
+                if (not client.closed and client.channel == CHANNEL_IMU
+                        and client.format == wire.FORMAT_DELTA and client.factor == factor):
+                    client.offer(header, payload)
+
+        self.sample_rate_hz = sample_rate_hz
+        self.decimators = {}
+        self.encoders = {}
+        schemas = [bytes(wire.encode_schema(mpu, None, i))
+                   for i, mpu in enumerate(self.sensors)]
+        clients = self.clients
+        self.clients = []
+
+        for client in clients:
+            if client.closed:
+                continue
+
+            if client.format != wire.FORMAT_JSON:
+                for sensor in self.selected(client):
+                    client.offer(SCHEMA_HEADER, schemas[sensor])
+
+            self.add(client)
+
+    def selected(self, client: StreamClient) -> list:
+        """Ids of the sensors client streams, [0] for a client of the first sensor's samples."""
+        if not client.sensors:
+            return [0]
+
+        return [i for i in range(len(self.sensors)) if client.sensors & (1 << i)]
+
+    def _prune_decimators(self) -> None:
+        used = set(c.factor for c in self.clients if c.channel == CHANNEL_IMU)
+
+        for factor in list(self.decimators):
+            if factor not in used:
+                del self.decimators[factor]
+
+        used = set(c.factor for c in self.clients if c.channel ==
+                   CHANNEL_IMU and c.format == wire.FORMAT_DELTA)
+
+        for factor in list(self.encoders):
+            if factor not in used:
+                del self.encoders[factor]
+
+    def publish(self) -> int:
+        """
+        Queues every sample written to the ring since the last call for all clients.
+
+        Returns:
+            int: Number of samples read from the ring.
+        """
+        ring = self.ring
+        cursor = self._cursor
+
+        if not self.clients:
+            cursor.seq = ring.head
+            return 0
+
+        raw = self._raw
+        count = 0
+        dead = False
+        multiplexed = False
+
+        for client in self.clients:
+            if client.sensors:
+                multiplexed = True
+
+        while True:
+            timestamp = ring.read_into(cursor, raw)
+
+            if timestamp is None:
+                break
+
+            count += 1
+
+            if multiplexed:
+                self._publish_sensors(raw, timestamp)
+
+            for factor, decimator in self.decimators.items():
+                if decimator is None:
+                    sample, sample_ts = raw, timestamp
+                elif decimator.add(raw, timestamp):
+                    sample, sample_ts = decimator.out, decimator.timestamp
+                else:
+                    continue
+
+                encoded = self._encoded
+                encoded.clear()
+                delta = None
+                encoder = self.encoders.get(factor)
+
+                if encoder:
+                    length = encoder.add(sample, sample_ts)
+                    if length:
+                        delta = self._encode_delta(encoder, length)
+
+                for client in self.clients:
+                    if client.closed:
+                        dead = True
+                        continue
+
+                    if (client.channel != CHANNEL_IMU or client.factor != factor
+                            or client.sensors):
+                        continue
+
+                    if client.format == wire.FORMAT_DELTA:
+                        if delta:
+                            client.offer(delta[0], delta[1])
+                        continue
+
+                    key = (client.format, client.mask)
+                    entry = encoded.get(key)
+
+                    if entry is None:
+                        entry = self._encode(sample, sample_ts,
+                                             client.format, client.mask)
+                        encoded[key] = entry
+
+                    client.offer(entry[0], entry[1])
+
+        self._publish_attitude()
+
+        if dead:
+            self.clients = [c for c in self.clients if not c.closed]
+            self._prune_decimators()
+
+        return count
+
+    def _publish_sensors(self, raw, timestamp) -> None:
+        """Queues every selected sensor's block of a record for the clients of several sensors."""
+        encoded = self._encoded_sensors
+        encoded.clear()
+        sensors = self.sensors
+
+        for client in self.clients:
+            if not client.sensors or client.closed:
+                continue
+
+            for sensor in range(len(sensors)):
+                if not client.sensors & (1 << sensor):
+                    continue
+
+                key = (client.format, sensor)
+                entry = encoded.get(key)
+
+                if entry is None:
+                    entry = self._encode_sensor(raw, timestamp, sensor, client.format)
+                    encoded[key] = entry
+
+                client.offer(entry[0], entry[1])
+
+    def _encode_sensor(self, raw, timestamp, sensor, fmt) -> tuple:
+        """Encodes the block of one sensor in a record, returns (WebSocket header, payload)."""
+        offset = sensor * RAW_DATA_SIZE
+
+        if fmt == wire.FORMAT_BINARY:
+            wire.encode_sensor(raw, offset, sensor, timestamp, self._sensor_packet)
+            return SENSOR_HEADER, bytes(self._sensor_packet)
+
+        gyro, accel, temp = self.sensors[sensor].decode_raw(raw, offset)
+        text = json.dumps({"sensor": sensor, "gyro": gyro, "accel": accel,
+                           "temp": temp}).encode("utf-8")
+        return websocket.frame_header(websocket.OP_TEXT, len(text)), text
+
+    def _encode_delta(self, encoder, length) -> tuple:
+        """Wraps a completed encoder frame in a DELTA message, returns (WebSocket header, payload)."""
+        payload = bytearray(wire.DELTA_HEADER_SIZE + length)
+        wire.encode_delta_header(encoder.count, length, payload)
+        payload[wire.DELTA_HEADER_SIZE:] = memoryview(encoder.body)[:length]
+        return websocket.frame_header(websocket.OP_BINARY, len(payload)), payload
+
+    def _encode(self, raw, timestamp, fmt, mask) -> tuple:
+        """Encodes one raw block, returns (WebSocket header, payload)."""
+        if fmt == wire.FORMAT_BINARY:
+            if mask == wire.CH_ALL:
+                wire.encode_sample(raw, timestamp, self._packet)
+                return BINARY_HEADER, bytes(self._packet)
+
+            n = wire.encode_packed(raw, timestamp, mask, self._packed)
+            return websocket.frame_header(websocket.OP_BINARY, n), bytes(self._packed_mv[:n])
+
+        gyro, accel, temp = self.mpu.decode_raw(raw)
+        data = {}
+
+        if mask & wire.CH_GYRO:
+            data["gyro"] = gyro
+        if mask & wire.CH_ACCEL:
+            data["accel"] = accel
+        if mask & wire.CH_TEMP:
+            data["temp"] = temp
+
+        text = json.dumps(data).encode("utf-8")
+        return websocket.frame_header(websocket.OP_TEXT, len(text)), text
+
+    def _publish_attitude(self) -> None:
+        estimator = self.estimator
+
+        if not estimator or estimator.updates == self._attitude_updates:
+            return
+
+        updates = estimator.updates
+        self._attitude_updates = updates
+        q = estimator.filter.q
+        binary = None
+        text = None
+        text_header = None
+
+        for client in self.clients:
+            if client.closed or client.channel != CHANNEL_ATTITUDE:
+                continue
+
+            if updates < client._next_attitude:
+                continue
+
+            client._next_attitude = updates + client.factor
+
+            if client.format != wire.FORMAT_JSON:
+                if binary is None:
+                    wire.encode_attitude(
+                        q, estimator.timestamp, self._attitude_packet)
+                    binary = bytes(self._attitude_packet)
+
+                client.offer(ATTITUDE_HEADER, binary)
+            else:
+                if text is None:
+                    estimator.filter.euler_into(self._euler)
+                    text = json.dumps({
+                        "q": [q[0], q[1], q[2], q[3]],
+                        "euler": self._euler,
+                    }).encode("utf-8")
+                    text_header = websocket.frame_header(
+                        websocket.OP_TEXT, len(text))
+
+                client.offer(text_header, text)
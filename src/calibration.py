@@ -0,0 +1,370 @@
+"""
+Fast gyro/accel offset calibration, and offsets that survive a reboot.
+
+calibrate() takes samples at the chip's output rate from the FIFO (or
+burst reads) instead of one every 100 ms, keeps a running mean and
+variance per axis (Welford) and stops once the standard error of every
+mean is below the tolerance, a few hundred milliseconds on a still board.
+A standard deviation above the stillness limits means the board moved
+during calibration, CalibrationError is raised then rather than storing
+a biased offset.
+
+Offsets are stored as JSON, keyed by gyro range, accel range and DLPF
+setting together with the die temperature they were measured at. load()
+picks the entry closest in temperature, so boot normally skips the
+calibration altogether.
+
+apply_to_registers() moves the offsets into the chip's offset registers,
+after which the raw readings, the log and the wire format are already
+offset-free. The registers keep their value over an ESP32 reset, call
+MPU6050.reset() before applying them again.
+
+The offsets only hold at the temperature they were measured at. A
+temperature model (fitted offline by tools/fit_temp_bias.py) describes
+the bias of each axis as a polynomial in the die temperature;
+TempCompensator turns it into a lookup table of raw corrections relative
+to the calibration temperature and subtracts them from every raw block
+before it reaches the ring, so no polynomial is evaluated per sample.
+"""
+
+import json
+import struct
+from array import array
+from math import sqrt
+from time import sleep
+from MPU6050 import (ACCEL_OFFSET_SCALE, FIFO_SIZE, GYRO_OFFSET_SCALE,
+                     RAW_DATA_FORMAT, RAW_DATA_SIZE)
+
+try:
+    import micropython
+except ImportError:
+    class micropython:
+        """Stand-in so the decorators below work on CPython."""
+
+        @staticmethod
+        def native(func):
+            return func
+
+# FIFO frames without temperature: accel x/y/z, gyro x/y/z
+FRAME_FORMAT = ">hhhhhh"
+FRAME_SIZE = 12
+
+# entries kept in the calibration file
+MAX_ENTRIES = 16
+
+# byte offsets of accel x/y/z and gyro x/y/z in a raw block, temperature is at 6
+AXIS_POSITIONS = (0, 2, 4, 8, 10, 12)
+TEMP_LSB_PER_C = 340.0
+TEMP_OFFSET_C = 36.53
+
+
+class CalibrationError(Exception):
+    pass
+
+
+class RunningStats:
+    """Running mean and variance of the 6 axes (Welford)."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = array("f", [0.0] * 6)
+        self.m2 = array("f", [0.0] * 6)
+
+    def add(self, values) -> None:
+        self.n += 1
+        n = self.n
+        mean = self.mean
+        m2 = self.m2
+
+        for i in range(6):
+            delta = values[i] - mean[i]
+            mean[i] += delta / n
+            m2[i] += delta * (values[i] - mean[i])
+
+    def std(self, i: int) -> float:
+        return sqrt(self.m2[i] / (self.n - 1)) if self.n > 1 else 0.0
+
+    def std_error(self, i: int) -> float:
+        return self.std(i) / sqrt(self.n) if self.n else 0.0
+
+
+def calibrate(mpu, az_0: bool = True, use_fifo: bool = True, rate_hz: int = 1000,
+              min_samples: int = 200, max_samples: int = 2000,
+              gyro_tolerance: float = 0.01, accel_tolerance: float = 0.0005,
+              still_gyro: float = 1.0, still_accel: float = 0.02,
+              timeout_ms: int = 3000) -> dict:
+    """
+    Measures the offsets of a still board and sets them on mpu.
+
+    Args:
+        mpu (MPU6050): Sensor with the ranges and DLPF already configured.
+        az_0 (bool, optional): Whether to set the accelerometer z-axis offset to zero, as in MPU6050.calibrate. Defaults to True.
+        use_fifo (bool, optional): Read the FIFO, else burst reads paced to rate_hz. Defaults to True.
+        rate_hz (int, optional): Sample rate while calibrating, restored afterwards. Defaults to 1000.
+        min_samples (int, optional): Samples before convergence and stillness are judged. Defaults to 200.
+        max_samples (int, optional): Samples at most. Defaults to 2000.
+        gyro_tolerance (float, optional): Standard error of the gyro means to reach, deg/s. Defaults to 0.01.
+        accel_tolerance (float, optional): Standard error of the accel means to reach, g. Defaults to 0.0005.
+        still_gyro (float, optional): Gyro standard deviation above which the board is moving, deg/s. Defaults to 1.0.
+        still_accel (float, optional): Accel standard deviation above which the board is moving, g. Defaults to 0.02.
+        timeout_ms (int, optional): Time without new samples after which calibration fails. Defaults to 3000.
+
+    Returns:
+        dict: {"gyro", "accel", "temp", "samples", "converged"}.
+
+    Raises:
+        CalibrationError: The board moved or no samples arrived.
+    """
+    mpu.gyro_offset = (0, 0, 0)
+    mpu.accel_offset = (0, 0, 0)
+
+    divider = mpu.read_sample_rate_divider()
+    mpu.write_sample_rate(rate_hz)
+
+    stats = RunningStats()
+    converged = False
+    gs = mpu.gyro_scale
+    acs = mpu.accel_scale
+
+    if use_fifo:
+        buf = bytearray(FIFO_SIZE // FRAME_SIZE * FRAME_SIZE)
+        mpu.enable_fifo(temp=False)
+    else:
+        buf = bytearray(RAW_DATA_SIZE)
+
+    try:
+        idle_ms = 0
+
+        while stats.n < max_samples:
+            if use_fifo:
+                frames, overflow = mpu.read_fifo_into(buf)
+
+                for i in range(frames):
+                    stats.add(struct.unpack_from(FRAME_FORMAT, buf, i * FRAME_SIZE))
+
+                if not frames:
+                    sleep(0.005)
+                    idle_ms += 5
+                else:
+                    idle_ms = 0
+            else:
+                mpu.read_raw_into(buf)
+                ax, ay, az, _, gx, gy, gz = struct.unpack(RAW_DATA_FORMAT, buf)
+                stats.add((ax, ay, az, gx, gy, gz))
+                sleep(1 / rate_hz)
+
+            if idle_ms > timeout_ms:
+                raise CalibrationError("no samples from the sensor")
+
+            if stats.n < min_samples:
+                continue
+
+            for i in range(3):
+                if stats.std(i) / acs > still_accel or stats.std(i + 3) / gs > still_gyro:
+                    raise CalibrationError("board moved during calibration")
+
+            converged = True
+
+            for i in range(3):
+                if (stats.std_error(i) / acs > accel_tolerance
+                        or stats.std_error(i + 3) / gs > gyro_tolerance):
+                    converged = False
+                    break
+
+            if converged:
+                break
+    finally:
+        if use_fifo:
+            mpu.disable_fifo()
+        mpu.write_sample_rate_divider(divider)
+
+    mean = stats.mean
+    mpu.gyro_offset = (mean[3] / gs, mean[4] / gs, mean[5] / gs)
+    az = mean[2] / acs
+
+    if not az_0:
+        az -= 1
+
+    mpu.accel_offset = (mean[0] / acs, mean[1] / acs, az)
+
+    return {
+        "gyro": mpu.gyro_offset,
+        "accel": mpu.accel_offset,
+        "temp": mpu.read_temperature(),
+        "samples": stats.n,
+        "converged": converged,
+    }
+
+
+def settings_key(mpu) -> str:
+    return "{}/{}/{}".format(mpu.read_gyro_range(), mpu.read_accel_range(),
+                             mpu.read_lpf_range())
+
+
+def _read_entries(path: str) -> list:
+    try:
+        with open(path) as file:
+            return json.load(file).get("entries", [])
+    except (OSError, ValueError):
+        return []
+
+
+def load(path: str, mpu, temp: float, max_temp_delta: float = 5.0):
+    """
+    Sets the stored offsets measured with the current settings closest to temp.
+
+    Args:
+        max_temp_delta (float, optional): Largest temperature difference accepted, None for any. Defaults to 5.0.
+
+    Returns:
+        dict: The entry used, with the temperature it was measured at, None
+        if there is no matching entry, the offsets are unchanged then.
+    """
+    key = settings_key(mpu)
+    best = None
+
+    for entry in _read_entries(path):
+        if entry.get("key") != key:
+            continue
+
+        delta = abs(entry["temp"] - temp)
+
+        if max_temp_delta is not None and delta > max_temp_delta:
+            continue
+
+        if best is None or delta < abs(best["temp"] - temp):
+            best = entry
+
+    if best is None:
+        return None
+
+    mpu.gyro_offset = tuple(best["gyro"])
+    mpu.accel_offset = tuple(best["accel"])
+    return best
+
+
+def save(path: str, mpu, temp: float) -> None:
+    """Stores the offsets of mpu for the current settings at temp, replacing an entry within 1 C."""
+    key = settings_key(mpu)
+    entries = [e for e in _read_entries(path)
+               if not (e.get("key") == key and abs(e["temp"] - temp) < 1.0)]
+
+    entries.append({
+        "key": key,
+        "temp": temp,
+        "gyro": list(mpu.gyro_offset),
+        "accel": list(mpu.accel_offset),
+    })
+
+    with open(path, "w") as file:
+        json.dump({"entries": entries[-MAX_ENTRIES:]}, file)
+
+
+def apply_to_registers(mpu) -> None:
+    """Subtracts the software offsets of mpu in the chip's offset registers and clears them."""
+    accel, gyro = mpu.read_offset_registers()
+
+    accel = [_clamp16(round(a - o * ACCEL_OFFSET_SCALE))
+             for a, o in zip(accel, mpu.accel_offset)]
+    gyro = [_clamp16(round(g - o * GYRO_OFFSET_SCALE))
+            for g, o in zip(gyro, mpu.gyro_offset)]
+
+    mpu.write_offset_registers(accel, gyro)
+    mpu.gyro_offset = (0, 0, 0)
+    mpu.accel_offset = (0, 0, 0)
+
+
+def _clamp16(value: int) -> int:
+    return max(-32768, min(32767, value))
+
+
+def load_temp_model(path: str):
+    """Reads a model written by tools/fit_temp_bias.py, None if there is none."""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def evaluate(coefficients, x: float) -> float:
+    """Polynomial with coefficients lowest order first."""
+    value = 0.0
+
+    for c in reversed(coefficients):
+        value = value * x + c
+
+    return value
+
+
+class TempCompensator:
+    """Subtracts the temperature dependent bias change from raw blocks via a lookup table."""
+
+    def __init__(self, model: dict, mpu, calibration_temp: float, step: float = 0.5):
+        """
+        Args:
+            model (dict): {"t0", "range": [min, max], "gyro": 3 coefficient lists (deg/s), "accel": 3 lists (g)}.
+            mpu (MPU6050): Its current scales convert the model to raw LSB.
+            calibration_temp (float): Temperature the offsets were measured at, the table is zero there.
+            step (float, optional): Table resolution, degrees C. Defaults to 0.5.
+        """
+        self.model = model
+        self.step = step
+        t_min, t_max = model["range"]
+
+        self.bins = max(1, int((t_max - t_min) / step) + 1)
+        self.table = array("h", [0] * (self.bins * 6))
+        self.rescale(mpu, calibration_temp)
+
+        # raw temperature of the lower table edge and per bin
+        self._t_min_raw = int((t_min - TEMP_OFFSET_C) * TEMP_LSB_PER_C)
+        self._step_raw = max(1, int(step * TEMP_LSB_PER_C))
+
+    def rescale(self, mpu, calibration_temp: float) -> None:
+        """Refills the table for the current ranges of mpu, after they or the calibration changed."""
+        model = self.model
+        step = self.step
+        t0 = model["t0"]
+        t_min = model["range"][0]
+        polys = model["accel"] + model["gyro"]
+        scales = (mpu.accel_scale,) * 3 + (mpu.gyro_scale,) * 3
+        reference = [evaluate(p, calibration_temp - t0) for p in polys]
+
+        for i in range(self.bins):
+            x = t_min + (i + 0.5) * step - t0
+
+            for axis in range(6):
+                bias = (evaluate(polys[axis], x) - reference[axis]) * scales[axis]
+                self.table[i * 6 + axis] = max(-32768, min(32767, int(round(bias))))
+
+    @micropython.native
+    def apply(self, raw) -> None:
+        """Corrects a raw block in place, temperatures outside the model use its edge."""
+        t = (raw[6] << 8) | raw[7]
+        if t & 0x8000:
+            t -= 0x10000
+
+        i = (t - self._t_min_raw) // self._step_raw
+        if i < 0:
+            i = 0
+        elif i >= self.bins:
+            i = self.bins - 1
+
+        table = self.table
+        base = i * 6
+
+        for axis in range(6):
+            pos = AXIS_POSITIONS[axis]
+            value = (raw[pos] << 8) | raw[pos + 1]
+            if value & 0x8000:
+                value -= 0x10000
+
+            value -= table[base + axis]
+            if value > 32767:
+                value = 32767
+            elif value < -32768:
+                value = -32768
+
+            value &= 0xFFFF
+            raw[pos] = value >> 8
+            raw[pos + 1] = value & 0xFF
@@ -0,0 +1,187 @@
+"""
+Delta/varint compression of raw MPU6050 samples.
+
+At high rates consecutive readings differ by a few LSB, so a DELTA frame
+(see wire.py) carries N samples as one keyframe followed by deltas:
+
+    I timestamp, 7h raw block             first sample, as read
+    varint dt_us, 7 zigzag varints        every further sample, relative
+                                          to the sample before it
+
+Varints are little-endian base-128 (7 bits per byte, high bit set on all
+but the last byte), zigzag maps signed deltas to unsigned (0, -1, 1, -2,
+... -> 0, 1, 2, 3, ...) so small deltas of either sign take one byte.
+
+Every frame starts with a keyframe, so frames decode on their own and a
+frame dropped by a client's send queue does not corrupt the next ones;
+the keyframe period is the frame length.
+"""
+
+import struct
+
+try:
+    import micropython
+except ImportError:
+    class micropython:
+        """Stand-in so the decorators below work on CPython."""
+
+        @staticmethod
+        def native(func):
+            return func
+
+# MPU6050.RAW_DATA_SIZE, not imported so the tools can use this module on a PC
+RAW_DATA_SIZE = 14
+CHANNELS = RAW_DATA_SIZE // 2
+
+KEYFRAME_FORMAT = ">I7h"
+KEYFRAME_SIZE = 4 + RAW_DATA_SIZE
+# dt_us takes at most 5 bytes, a zigzagged int16 delta at most 3
+MAX_DELTA_SIZE = 5 + 3 * CHANNELS
+
+
+def max_body_size(samples: int) -> int:
+    return KEYFRAME_SIZE + (samples - 1) * MAX_DELTA_SIZE
+
+
+class DeltaEncoder:
+    """
+    Packs raw blocks into DELTA frame bodies, without allocating per sample.
+
+    add() writes into body and returns the body length once `samples`
+    samples are in it, count then holds the number of samples of the frame
+    until the next add(), which starts a new frame in the same buffer.
+    flush() ends a partial frame.
+    """
+
+    def __init__(self, samples: int = 10):
+        if not 1 <= samples <= 255:
+            raise ValueError("samples per frame must be 1..255")
+
+        self.samples = samples
+        self.body = bytearray(max_body_size(samples))
+        # number of samples in the frame in body
+        self.count = 0
+
+        self._done = True
+        self._length = 0
+        self._prev = [0] * CHANNELS
+        self._prev_ts = 0
+
+    def add(self, raw, timestamp: int) -> int:
+        """
+        Adds one raw block.
+
+        Returns:
+            int: Body length when the frame is complete, else 0.
+        """
+        if self._done:
+            self.count = 0
+            self._done = False
+
+        if self.count == 0:
+            self._length = self._keyframe(raw, timestamp)
+        else:
+            self._length = self._delta(raw, timestamp, self._length)
+
+        self.count += 1
+        self._prev_ts = timestamp
+
+        if self.count == self.samples:
+            self._done = True
+            return self._length
+
+        return 0
+
+    def flush(self) -> int:
+        """Ends the current frame early, returns its body length or 0 if there is none."""
+        if self._done or self.count == 0:
+            return 0
+
+        self._done = True
+        return self._length
+
+    def _keyframe(self, raw, timestamp: int) -> int:
+        body = self.body
+        prev = self._prev
+        struct.pack_into(">I", body, 0, timestamp & 0xFFFFFFFF)
+
+        for i in range(CHANNELS):
+            hi = raw[2 * i]
+            lo = raw[2 * i + 1]
+            body[4 + 2 * i] = hi
+            body[5 + 2 * i] = lo
+            value = (hi << 8) | lo
+            prev[i] = value - 0x10000 if value & 0x8000 else value
+
+        return KEYFRAME_SIZE
+
+    @micropython.native
+    def _delta(self, raw, timestamp, n):
+        body = self.body
+        prev = self._prev
+        n = _put_varint(body, n, (timestamp - self._prev_ts) & 0xFFFFFFFF)
+
+        for i in range(CHANNELS):
+            value = (raw[2 * i] << 8) | raw[2 * i + 1]
+            if value & 0x8000:
+                value -= 0x10000
+            delta = value - prev[i]
+            prev[i] = value
+            n = _put_varint(body, n, (delta << 1) if delta >= 0 else ((-delta << 1) - 1))
+
+        return n
+
+
+@micropython.native
+def _put_varint(buf, n, value):
+    while value > 0x7F:
+        buf[n] = (value & 0x7F) | 0x80
+        value >>= 7
+        n += 1
+
+    buf[n] = value
+    return n + 1
+
+
+def decode(body, count: int, offset: int = 0) -> list:
+    """
+    Decodes `count` samples of a DELTA frame body.
+
+    Returns:
+        list: (timestamp_us, [ax, ay, az, temp, gx, gy, gz]) tuples with raw int16 values.
+    """
+    values = struct.unpack_from(KEYFRAME_FORMAT, body, offset)
+    timestamp = values[0]
+    raw = list(values[1:])
+    samples = [(timestamp, raw)]
+    n = offset + KEYFRAME_SIZE
+
+    for _ in range(count - 1):
+        dt, n = _get_varint(body, n)
+        timestamp = (timestamp + dt) & 0xFFFFFFFF
+        raw = raw[:]
+
+        for i in range(CHANNELS):
+            z, n = _get_varint(body, n)
+            value = raw[i] + ((z >> 1) ^ -(z & 1))
+            # keep int16 wrap-around identical to the encoder's input
+            raw[i] = ((value + 0x8000) & 0xFFFF) - 0x8000
+
+        samples.append((timestamp, raw))
+
+    return samples
+
+
+def _get_varint(buf, n: int) -> tuple:
+    value = 0
+    shift = 0
+
+    while True:
+        byte = buf[n]
+        n += 1
+        value |= (byte & 0x7F) << shift
+
+        if not byte & 0x80:
+            return value, n
+
+        shift += 7
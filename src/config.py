@@ -1,8 +1,67 @@
+# boot.py sets this clock, 240 MHz shortens boot and the sample path, None keeps the default
+CPU_FREQ_HZ = 240000000
+
 WIFI_SSID = "your ssid"
 WIFI_PASSWD = "your password"
+# print the networks in range before connecting as a station, takes about 2 s
+WIFI_SCAN = False
 
 WIFI_SSID_AP = "ESP32 Access Point"
 WIFI_PASSWD_AP = "12345678"
 
 HOST_IP = ""
 HOST_PORT = 80
+
+# stored offsets, see calibration.py; recalibrates when no entry is this close in temperature
+CALIBRATION_FILE = "calibration.json"
+CALIBRATION_MAX_TEMP_DELTA = 5.0
+# move the offsets into the MPU6050's own offset registers
+CALIBRATION_HW_OFFSETS = False
+# bias vs temperature model from tools/fit_temp_bias.py, None to disable
+TEMP_MODEL_FILE = "temp_model.json"
+
+# sensor buses, see i2cbus.py: (hardware peripheral 0 or 1 or None for SoftI2C only, SCL, SDA)
+I2C_BUSES = ((0, 22, 21),)
+# 400 kHz is the MPU6050's rating, 1 MHz works with most modules and falls back if not
+I2C_FREQ_HZ = 400000
+
+# MPU6050s as (index in I2C_BUSES, address), 0x69 with AD0 high; read as one array, see sensorarray.py
+SENSORS = ((0, 0x68),)
+# GPIO wired to the first MPU6050's INT output, None to trigger reads from a timer
+MPU_INT_PIN = None
+SAMPLE_RATE_HZ = 100
+# no sample for this long is a sensor fault too, and the time between recovery attempts
+SENSOR_TIMEOUT_MS = 1000
+# number of samples buffered for slow consumers
+SAMPLE_BUFFER_SIZE = 256
+
+# per stream client send queue, see broadcast.py for the overflow policies
+STREAM_QUEUE_SIZE = 32
+STREAM_OVERFLOW_POLICY = "drop_oldest"
+STREAM_MAX_LAG_MS = 5000
+# time span of a ?format=delta frame, longer frames compress better but add latency
+STREAM_DELTA_FRAME_MS = 100
+
+# sample streaming over the BLE UART, see blestream.py; MTU asked for from the central
+BLE_MTU = 247
+# rate of "stream" without a rate, 0 for the full sample rate
+BLE_STREAM_RATE_HZ = 50
+
+# flash sample log, see logger.py, None to disable
+LOG_DIR = "/log"
+LOG_SEGMENT_SIZE = 65536
+LOG_SEGMENTS = 8
+# flash erase block size, the log is written in chunks of this size
+LOG_BLOCK_SIZE = 4096
+
+# print the newest sample on the console at most this often, 0 to disable
+DEBUG_PRINT_MS = 0
+# heap allocated between two batches after which the loop collects, see metrics.py
+GC_BUDGET = 16384
+
+# idle keep-alive connections are closed after this many seconds
+HTTP_KEEPALIVE_S = 10
+
+# on-device attitude estimation: "complementary", "madgwick", "mahony", the
+# fixed-point "complementary_fixed", "madgwick_fixed" (no allocation per sample) or None
+FUSION_FILTER = "madgwick_fixed"
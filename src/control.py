@@ -0,0 +1,236 @@
+"""
+Runtime changes of the sensor ranges, DLPF and sample rate.
+
+The dashboard's settings dialog sends {"accelerometerRange", "gyroRange",
+"filterBand", "delay"} over its stream WebSocket (pages/index.js), as
+strings; "delay" is the sample period in ms. request() validates such a
+message and keeps it pending. The main loop calls apply() between two
+batches: the sampler is stopped, drain() lets every consumer take the
+samples still in the ring, the registers are written and the sampler
+starts again. A consumer thus never decodes a sample with the scales of
+another setting.
+
+Offsets are kept in deg/s and g (or in the chip's offset registers, whose
+units do not depend on the range), so they hold across ranges and are
+not measured again. The stored entry for the new settings is used if
+there is one close enough in temperature, else the current offsets are
+stored for them. Everything that holds raw-unit or rate-dependent state
+(stream schema and decimation, log segment, BLE stream, temperature
+table) registers a listener, called with the new sample rate.
+
+recover() brings the sensor back the same way when the sampler hit an
+I2C error: the bus is cleared and set up again (see i2cbus.py), the chip
+woken and its registers written back from the driver's shadow, and the
+sampler restarted with the current settings. The loop keeps running
+meanwhile and retries until the sensor answers.
+
+With a sensor array (see sensorarray.py) every sensor gets the same
+settings and its own offsets file (sensor_file), and recover() clears
+every bus and restores every sensor, one fault stalls the whole record.
+"""
+
+from MPU6050 import (ACCEL_RANGES_TO_HEX, GYRO_RANGES_TO_HEX,
+                     LPF_RANGES_TO_HEX)
+from sensorarray import sensor_file
+
+# settings message key -> (setting, allowed values)
+SETTINGS = {
+    "accelerometerRange": ("accel_range", ACCEL_RANGES_TO_HEX),
+    "gyroRange": ("gyro_range", GYRO_RANGES_TO_HEX),
+    "filterBand": ("lpf_range", LPF_RANGES_TO_HEX),
+}
+
+# sample periods the dashboard offers; beyond the divider's reach (256 ms with
+# the DLPF on, 32 ms without) the sampler's timer paces the reads
+MIN_DELAY_MS = 1
+MAX_DELAY_MS = 1000
+
+
+class SensorControl:
+    def __init__(self, mpu, sampler, pin=None, sample_rate_hz: float = 100,
+                 calibration_file: str = None, calibration_temp: float = None,
+                 max_temp_delta: float = 5.0, sensors=None):
+        """
+        Args:
+            mpu (MPU6050): Sensor to reconfigure, the first one of an array.
+            sampler (DataReadySampler): Stopped and restarted around the change.
+            pin (machine.Pin, optional): INT pin the sampler was started with. Defaults to None.
+            sample_rate_hz (float, optional): Current sample rate. Defaults to 100.
+            calibration_file (str, optional): Offsets file of calibration.py, None to keep the offsets as they are. Defaults to None.
+            calibration_temp (float, optional): Temperature the current offsets were measured at. Defaults to None.
+            max_temp_delta (float, optional): As in calibration.load. Defaults to 5.0.
+            sensors (list, optional): Every sensor of the array, mpu first. Defaults to [mpu].
+        """
+        self.mpu = mpu
+        self.sensors = sensors if sensors else [mpu]
+        self.sampler = sampler
+        self.pin = pin
+        self.sample_rate_hz = sample_rate_hz
+        self.calibration_file = calibration_file
+        self.calibration_temp = calibration_temp
+        self.max_temp_delta = max_temp_delta
+
+        # called with the new sample rate after every change
+        self.listeners = []
+        # setting -> value, waiting for apply()
+        self.pending = None
+        self.changes = 0
+        self.recoveries = 0
+
+    def settings(self) -> dict:
+        """Current settings in the keys of the settings message."""
+        mpu = self.mpu
+
+        return {
+            "accelerometerRange": mpu.read_accel_range(),
+            "gyroRange": mpu.read_gyro_range(),
+            "filterBand": mpu.read_lpf_range(),
+            "delay": 1000 / self.sample_rate_hz,
+        }
+
+    def request(self, message: dict) -> None:
+        """
+        Validates a settings message and queues its valid keys for apply(). Unknown keys are ignored.
+
+        Raises:
+            ValueError: Some values are not valid settings, the other keys are queued all the same.
+        """
+        changes = {}
+        errors = []
+
+        for key, (setting, allowed) in SETTINGS.items():
+            if key not in message:
+                continue
+
+            try:
+                value = int(message[key])
+            except (TypeError, ValueError):
+                value = None
+
+            if value not in allowed:
+                errors.append("invalid {} {}".format(key, message[key]))
+                continue
+
+            changes[setting] = value
+
+        if "delay" in message:
+            try:
+                delay = float(message["delay"])
+            except (TypeError, ValueError):
+                delay = None
+
+            # also false for nan
+            if delay is not None and MIN_DELAY_MS <= delay <= MAX_DELAY_MS:
+                changes["rate_hz"] = 1000 / delay
+            else:
+                errors.append("delay must be {} to {} ms".format(
+                    MIN_DELAY_MS, MAX_DELAY_MS))
+
+        if changes:
+            if self.pending is None:
+                self.pending = {}
+            self.pending.update(changes)
+
+        if errors:
+            raise ValueError(", ".join(errors))
+
+    def apply(self, drain=None) -> bool:
+        """
+        Applies the pending settings, call it from the loop between batches.
+
+        Args:
+            drain (callable, optional): Called with the sampler stopped, before the registers change, to consume the ring. Defaults to None.
+
+        Returns:
+            bool: True if settings were applied.
+        """
+        changes = self.pending
+
+        if changes is None:
+            return False
+
+        self.pending = None
+        self.sampler.stop()
+
+        if drain:
+            drain()
+
+        for mpu in self.sensors:
+            if "accel_range" in changes:
+                mpu.write_accel_range(changes["accel_range"])
+            if "gyro_range" in changes:
+                mpu.write_gyro_range(changes["gyro_range"])
+            if "lpf_range" in changes:
+                mpu.write_lpf_range(changes["lpf_range"])
+
+        # the rate the divider gives with the new DLPF setting, or the timer's below it
+        self.sample_rate_hz = self.sampler.configure(
+            changes.get("rate_hz", self.sample_rate_hz))
+        self._update_offsets()
+
+        for listener in self.listeners:
+            listener(self.sample_rate_hz)
+
+        self.sampler.start(self.pin, self.sample_rate_hz)
+        self.changes += 1
+        print("Sensor settings:", self.settings())
+        return True
+
+    def recover(self, buses) -> bool:
+        """
+        Restarts sampling after the sampler's reads failed, call it from the loop between batches.
+
+        Args:
+            buses (list): I2CBus of every sensor, each cleared and set up again.
+
+        Returns:
+            bool: True if the sensor answers and samples again, else call it again later.
+        """
+        fault = self.sampler.fault
+
+        try:
+            for bus in buses:
+                old = bus.i2c
+                i2c = bus.recover()
+
+                for mpu in self.sensors:
+                    if mpu.i2c is old:
+                        mpu.i2c = i2c
+
+            self.sampler.stop()
+
+            for mpu in self.sensors:
+                mpu.restore()
+
+            self.sampler.start(self.pin, self.sample_rate_hz)
+        except OSError as e:
+            print("I2C recovery failed:", e)
+            return False
+
+        self.recoveries += 1
+        print("I2C recovered from {}, {}".format(
+            repr(fault) if fault else "a sample timeout",
+            "; ".join(str(bus) for bus in buses)))
+        return True
+
+    def _update_offsets(self) -> None:
+        if not self.calibration_file:
+            return
+
+        import calibration
+
+        for i, mpu in enumerate(self.sensors):
+            path = sensor_file(self.calibration_file, i)
+            temp = mpu.read_temperature()
+            entry = calibration.load(path, mpu, temp, self.max_temp_delta)
+
+            if entry:
+                if not i:
+                    self.calibration_temp = entry["temp"]
+                continue
+
+            if self.calibration_temp is None:
+                self.calibration_temp = temp
+
+            # the offsets carry over, next boot with these settings skips calibrating
+            calibration.save(path, mpu, self.calibration_temp)
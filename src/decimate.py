@@ -0,0 +1,90 @@
+"""
+Anti-aliased decimation of raw MPU6050 samples.
+
+Decimator averages `factor` consecutive raw blocks (a boxcar, i.e. a first
+order CIC filter) and emits one raw block per window, so the output can
+go through the same decode/encode paths as full-rate samples. Sums are
+kept as integers in a preallocated array, nothing is allocated per
+sample.
+
+The boxcar has its first null at the output rate, which removes most of
+the energy that would otherwise fold back into the band; the sensor's own
+DLPF (write_lpf_range) should be set below half the full sample rate.
+"""
+
+from array import array
+from math import isfinite
+from MPU6050 import RAW_DATA_SIZE
+
+CHANNELS = RAW_DATA_SIZE // 2
+
+
+def factor_for(sample_rate_hz, rate_hz) -> int:
+    """Decimation factor that brings sample_rate_hz closest to rate_hz, at least 1."""
+    if not rate_hz or rate_hz >= sample_rate_hz:
+        return 1
+
+    return max(1, int(sample_rate_hz / rate_hz + 0.5))
+
+
+def parse_rate(value) -> float:
+    """
+    Reads a ?rate= query value in Hz, empty for the full rate (0).
+
+    Raises:
+        ValueError: The rate is not a finite number above 0.
+    """
+    if not value:
+        return 0.0
+
+    rate = float(value)
+
+    if not (isfinite(rate) and rate > 0):
+        raise ValueError("rate must be a number above 0, not {}".format(value))
+
+    return rate
+
+
+class Decimator:
+    def __init__(self, factor: int):
+        self.factor = factor
+        self.out = bytearray(RAW_DATA_SIZE)
+        # timestamp of the last sample of the window emitted in out
+        self.timestamp = 0
+
+        self._sums = array("i", [0] * CHANNELS)
+        self._count = 0
+
+    def add(self, raw, timestamp: int) -> bool:
+        """
+        Adds one raw block.
+
+        Returns:
+            bool: True when a window completed and out holds its average.
+        """
+        sums = self._sums
+
+        for i in range(CHANNELS):
+            value = (raw[2 * i] << 8) | raw[2 * i + 1]
+            if value & 0x8000:
+                value -= 0x10000
+            sums[i] += value
+
+        self._count += 1
+
+        if self._count < self.factor:
+            return False
+
+        factor = self.factor
+        half = factor >> 1
+        out = self.out
+
+        for i in range(CHANNELS):
+            value = ((sums[i] + half) // factor) & 0xFFFF
+            out[2 * i] = value >> 8
+            out[2 * i + 1] = value & 0xFF
+            sums[i] = 0
+
+        self._count = 0
+        self.timestamp = timestamp
+        return True
@@ -0,0 +1,818 @@
+"""
+Attitude estimation from the MPU6050 gyro/accel stream.
+
+Three filters share one interface:
+
+    complementary  gyro integration blended with the accelerometer tilt
+    madgwick       gradient-descent quaternion filter (Madgwick 2010, IMU form)
+    mahony         PI-corrected quaternion filter (Mahony 2008)
+
+update() takes scalars (deg/s, g, seconds) and keeps its state in
+preallocated array('f') buffers, and AttitudeEstimator decodes each sample
+into one (MPU6050.decode_raw_into), so the inner loop creates no tuples or
+lists. Float temporaries are still boxed on builds without immediate
+floats like the ESP32's, every update allocates a few of them.
+
+complementary_fixed and madgwick_fixed run the same algorithms in
+fixed-point ints on the raw counts (update_counts, which the estimator
+calls with MPU6050.decode_counts_into). Products are shifted back before
+they leave the 31 bit small int range, so the update allocates nothing
+as long as the board turns less than about 3.5 degrees between samples
+(350 deg/s at 100 Hz); beyond that the ints are still exact, only
+slower. They stay within a few hundredths of a degree of the float
+filters. The "fusion" stage on /metrics shows what each costs on the
+board, tools/bench_fusion.py the accuracy and updates per second on the
+host.
+
+Without a magnetometer yaw is the integrated gyro rate, it drifts.
+"""
+
+from array import array
+from math import asin, atan2, cos, pi, sin, sqrt
+
+try:
+    import micropython
+except ImportError:
+    class micropython:
+        """Stand-in so the decorators below work on CPython."""
+
+        @staticmethod
+        def native(func):
+            return func
+
+DEG_TO_RAD = pi / 180.0
+RAD_TO_DEG = 180.0 / pi
+
+# fixed-point formats: QN holds x as round(x * 2**N)
+Q14 = 1 << 14
+# quaternion components
+Q28 = 1 << 28
+# angles in radians
+PI_Q26 = 210828714
+HALF_PI_Q26 = PI_Q26 >> 1
+
+
+class AttitudeFilter:
+    """
+    Base class, keeps the orientation as a unit quaternion (w, x, y, z).
+
+    Its update() integrates the gyro alone, the subclasses correct the
+    drift with the accelerometer.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.q = array("f", [1.0, 0.0, 0.0, 0.0])
+
+    def reset(self) -> None:
+        q = self.q
+        q[0], q[1], q[2], q[3] = 1.0, 0.0, 0.0, 0.0
+
+    def update(self, gx, gy, gz, ax, ay, az, dt) -> None:
+        """
+        Advances the estimate by one sample.
+
+        Args:
+            gx, gy, gz (float): Angular rate in degrees/sec.
+            ax, ay, az (float): Acceleration in g.
+            dt (float): Seconds since the previous sample.
+        """
+        q = self.q
+        q0, q1, q2, q3 = q[0], q[1], q[2], q[3]
+        k = 0.5 * DEG_TO_RAD * dt
+        gx *= k
+        gy *= k
+        gz *= k
+
+        a, b, c = q0, q1, q2
+        q0 += -b * gx - c * gy - q3 * gz
+        q1 += a * gx + c * gz - q3 * gy
+        q2 += a * gy - b * gz + q3 * gx
+        q3 += a * gz + b * gy - c * gx
+
+        norm = sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+        q[0] = q0 / norm
+        q[1] = q1 / norm
+        q[2] = q2 / norm
+        q[3] = q3 / norm
+
+    def euler_into(self, out) -> None:
+        """Writes roll, pitch, yaw in degrees into out[0:3]."""
+        q = self.q
+        w, x, y, z = q[0], q[1], q[2], q[3]
+
+        out[0] = atan2(2.0 * (w * x + y * z), 1.0 - 2.0 *
+                       (x * x + y * y)) * RAD_TO_DEG
+        s = 2.0 * (w * y - z * x)
+        out[1] = asin(1.0 if s > 1.0 else (-1.0 if s < -1.0 else s)) * RAD_TO_DEG
+        out[2] = atan2(2.0 * (w * z + x * y), 1.0 - 2.0 *
+                       (y * y + z * z)) * RAD_TO_DEG
+
+    def euler(self) -> tuple:
+        """Returns (roll, pitch, yaw) in degrees."""
+        out = [0.0, 0.0, 0.0]
+        self.euler_into(out)
+        return tuple(out)
+
+    def quaternion(self) -> tuple:
+        q = self.q
+        return (q[0], q[1], q[2], q[3])
+
+
+class ComplementaryFilter(AttitudeFilter):
+    name = "complementary"
+
+    def __init__(self, alpha: float = 0.98):
+        """
+        Args:
+            alpha (float, optional): Weight of the integrated gyro against the accelerometer tilt. Defaults to 0.98.
+        """
+        super().__init__()
+        self.alpha = alpha
+        # roll, pitch, yaw in radians
+        self.angles = array("f", [0.0, 0.0, 0.0])
+        self._initialized = False
+
+    def reset(self) -> None:
+        super().reset()
+        a = self.angles
+        a[0], a[1], a[2] = 0.0, 0.0, 0.0
+        self._initialized = False
+
+    @micropython.native
+    def update(self, gx, gy, gz, ax, ay, az, dt) -> None:
+        a = self.angles
+        accel_roll = atan2(ay, az)
+        accel_pitch = atan2(-ax, sqrt(ay * ay + az * az))
+
+        if not self._initialized:
+            a[0] = accel_roll
+            a[1] = accel_pitch
+            self._initialized = True
+        else:
+            k = self.alpha
+            a[0] = k * (a[0] + gx * DEG_TO_RAD * dt) + (1.0 - k) * accel_roll
+            a[1] = k * (a[1] + gy * DEG_TO_RAD * dt) + (1.0 - k) * accel_pitch
+            a[2] = a[2] + gz * DEG_TO_RAD * dt
+
+        # quaternion from roll/pitch/yaw (ZYX)
+        cr = cos(a[0] * 0.5)
+        sr = sin(a[0] * 0.5)
+        cp = cos(a[1] * 0.5)
+        sp = sin(a[1] * 0.5)
+        cy = cos(a[2] * 0.5)
+        sy = sin(a[2] * 0.5)
+
+        q = self.q
+        q[0] = cr * cp * cy + sr * sp * sy
+        q[1] = sr * cp * cy - cr * sp * sy
+        q[2] = cr * sp * cy + sr * cp * sy
+        q[3] = cr * cp * sy - sr * sp * cy
+
+
+class MadgwickFilter(AttitudeFilter):
+    name = "madgwick"
+
+    def __init__(self, beta: float = 0.1):
+        """
+        Args:
+            beta (float, optional): Gradient descent gain, higher trusts the accelerometer more. Defaults to 0.1.
+        """
+        super().__init__()
+        self.beta = beta
+
+    @micropython.native
+    def update(self, gx, gy, gz, ax, ay, az, dt) -> None:
+        q = self.q
+        q0, q1, q2, q3 = q[0], q[1], q[2], q[3]
+        gx *= DEG_TO_RAD
+        gy *= DEG_TO_RAD
+        gz *= DEG_TO_RAD
+
+        # rate of change of the quaternion from the gyroscope
+        qd0 = 0.5 * (-q1 * gx - q2 * gy - q3 * gz)
+        qd1 = 0.5 * (q0 * gx + q2 * gz - q3 * gy)
+        qd2 = 0.5 * (q0 * gy - q1 * gz + q3 * gx)
+        qd3 = 0.5 * (q0 * gz + q1 * gy - q2 * gx)
+
+        norm = sqrt(ax * ax + ay * ay + az * az)
+
+        if norm > 0.0:
+            ax /= norm
+            ay /= norm
+            az /= norm
+
+            _2q0 = 2.0 * q0
+            _2q1 = 2.0 * q1
+            _2q2 = 2.0 * q2
+            _2q3 = 2.0 * q3
+            _4q0 = 4.0 * q0
+            _4q1 = 4.0 * q1
+            _4q2 = 4.0 * q2
+            _8q1 = 8.0 * q1
+            _8q2 = 8.0 * q2
+            q0q0 = q0 * q0
+            q1q1 = q1 * q1
+            q2q2 = q2 * q2
+            q3q3 = q3 * q3
+
+            # gradient of the objective function
+            s0 = _4q0 * q2q2 + _2q2 * ax + _4q0 * q1q1 - _2q1 * ay
+            s1 = _4q1 * q3q3 - _2q3 * ax + 4.0 * q0q0 * q1 - _2q0 * ay - \
+                _4q1 + _8q1 * q1q1 + _8q1 * q2q2 + _4q1 * az
+            s2 = 4.0 * q0q0 * q2 + _2q0 * ax + _4q2 * q3q3 - _2q3 * ay - \
+                _4q2 + _8q2 * q1q1 + _8q2 * q2q2 + _4q2 * az
+            s3 = 4.0 * q1q1 * q3 - _2q1 * ax + 4.0 * q2q2 * q3 - _2q2 * ay
+
+            norm = sqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3)
+
+            if norm > 0.0:
+                beta = self.beta / norm
+                qd0 -= beta * s0
+                qd1 -= beta * s1
+                qd2 -= beta * s2
+                qd3 -= beta * s3
+
+        q0 += qd0 * dt
+        q1 += qd1 * dt
+        q2 += qd2 * dt
+        q3 += qd3 * dt
+
+        norm = sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+        q[0] = q0 / norm
+        q[1] = q1 / norm
+        q[2] = q2 / norm
+        q[3] = q3 / norm
+
+
+class MahonyFilter(AttitudeFilter):
+    name = "mahony"
+
+    def __init__(self, kp: float = 1.0, ki: float = 0.0):
+        """
+        Args:
+            kp (float, optional): Proportional gain on the accelerometer error. Defaults to 1.0.
+            ki (float, optional): Integral gain, estimates the gyro bias. Defaults to 0.0.
+        """
+        super().__init__()
+        self.kp = kp
+        self.ki = ki
+        # integral of the error, rad/s
+        self.integral = array("f", [0.0, 0.0, 0.0])
+
+    def reset(self) -> None:
+        super().reset()
+        i = self.integral
+        i[0], i[1], i[2] = 0.0, 0.0, 0.0
+
+    @micropython.native
+    def update(self, gx, gy, gz, ax, ay, az, dt) -> None:
+        q = self.q
+        q0, q1, q2, q3 = q[0], q[1], q[2], q[3]
+        gx *= DEG_TO_RAD
+        gy *= DEG_TO_RAD
+        gz *= DEG_TO_RAD
+
+        norm = sqrt(ax * ax + ay * ay + az * az)
+
+        if norm > 0.0:
+            ax /= norm
+            ay /= norm
+            az /= norm
+
+            # gravity direction estimated from the quaternion
+            vx = q1 * q3 - q0 * q2
+            vy = q0 * q1 + q2 * q3
+            vz = q0 * q0 - 0.5 + q3 * q3
+
+            # error is the cross product between measured and estimated gravity
+            ex = ay * vz - az * vy
+            ey = az * vx - ax * vz
+            ez = ax * vy - ay * vx
+
+            if self.ki > 0.0:
+                i = self.integral
+                i[0] += 2.0 * self.ki * ex * dt
+                i[1] += 2.0 * self.ki * ey * dt
+                i[2] += 2.0 * self.ki * ez * dt
+                gx += i[0]
+                gy += i[1]
+                gz += i[2]
+
+            gx += 2.0 * self.kp * ex
+            gy += 2.0 * self.kp * ey
+            gz += 2.0 * self.kp * ez
+
+        gx *= 0.5 * dt
+        gy *= 0.5 * dt
+        gz *= 0.5 * dt
+
+        a, b, c = q0, q1, q2
+        q0 += -b * gx - c * gy - q3 * gz
+        q1 += a * gx + c * gz - q3 * gy
+        q2 += a * gy - b * gz + q3 * gx
+        q3 += a * gz + b * gy - c * gx
+
+        norm = sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+        q[0] = q0 / norm
+        q[1] = q1 / norm
+        q[2] = q2 / norm
+        q[3] = q3 / norm
+
+
+@micropython.native
+def _isqrt(n):
+    """Integer square root of 0 <= n < 2**30."""
+    root = 0
+    bit = 1 << 28
+
+    while bit > n:
+        bit >>= 2
+
+    while bit:
+        if n >= root + bit:
+            n -= root + bit
+            root = (root >> 1) + bit
+        else:
+            root >>= 1
+        bit >>= 2
+
+    return root
+
+
+@micropython.native
+def _atan_q14(z):
+    """atan(z) for -1 <= z <= 1, both Q14 (Abramowitz & Stegun 4.4.49)."""
+    z2 = (z * z) >> 14
+    p = 341
+    p = ((p * z2) >> 14) - 1395
+    p = ((p * z2) >> 14) + 2951
+    p = ((p * z2) >> 14) - 5412
+    p = ((p * z2) >> 14) + 16382
+    return (p * z) >> 14
+
+
+@micropython.native
+def _atan2_q26(y, x):
+    """atan2(y, x) in Q26 radians, |x| and |y| below 2**15."""
+    if y == 0 and x == 0:
+        return 0
+
+    if abs(y) <= abs(x):
+        angle = _atan_q14((y << 14) // x) << 12
+
+        if x < 0:
+            angle += PI_Q26 if y >= 0 else -PI_Q26
+
+        return angle
+
+    angle = _atan_q14((x << 14) // y) << 12
+    return (HALF_PI_Q26 if y > 0 else -HALF_PI_Q26) - angle
+
+
+@micropython.native
+def _sin_q14(x):
+    """sin(x) for |x| <= pi/2, both Q14."""
+    x2 = (x * x) >> 14
+    p = Q14 - ((x2 * 228) >> 14)
+    p = Q14 - ((((x2 * p) >> 14) * 390) >> 14)
+    p = Q14 - ((((x2 * p) >> 14) * 819) >> 14)
+    p = Q14 - ((((x2 * p) >> 14) * 2731) >> 14)
+    return (x * p) >> 14
+
+
+@micropython.native
+def _cos_q14(x):
+    """cos(x) for |x| <= pi/2, both Q14."""
+    x2 = (x * x) >> 14
+    p = Q14 - ((x2 * 293) >> 14)
+    p = Q14 - ((((x2 * p) >> 14) * 546) >> 14)
+    p = Q14 - ((((x2 * p) >> 14) * 1365) >> 14)
+    return Q14 - ((x2 * p) >> 15)
+
+
+class FixedPointFilter(AttitudeFilter):
+    """
+    Base class of the fixed-point filters, update_counts() takes raw counts.
+
+    The orientation is kept as a Q28 quaternion, q converts it to floats
+    when read (the publishers do that once per sent packet, not per sample).
+    update() is the float interface of the other filters, for the tools.
+    """
+
+    # Q format of the gyro steps _gyro_steps writes and the bits below it
+    # carried between samples, so slow rates are not rounded away
+    STEP_BITS = None
+    STEP_EXTRA_BITS = None
+
+    def __init__(self, gyro_scale: float = 131.0, accel_scale: float = 16384.0):
+        """
+        Args:
+            gyro_scale (float, optional): Counts per deg/s, MPU6050.gyro_scale. Defaults to 131.0 (250 deg/s).
+            accel_scale (float, optional): Counts per g, only used by update(). Defaults to 16384.0 (2 g).
+        """
+        self._q = array("i", [Q28, 0, 0, 0])
+        self._qf = array("f", [1.0, 0.0, 0.0, 0.0])
+        # gyro steps of the update and what rounding left of them
+        self._steps = array("i", [0, 0, 0])
+        self._remainders = array("i", [0, 0, 0])
+        self.accel_scale = accel_scale
+        self.set_gyro_scale(gyro_scale)
+
+    @property
+    def q(self):
+        q = self._q
+        qf = self._qf
+
+        for i in range(4):
+            qf[i] = q[i] / Q28
+
+        return qf
+
+    def reset(self) -> None:
+        q = self._q
+        q[0], q[1], q[2], q[3] = Q28, 0, 0, 0
+        r = self._remainders
+        r[0], r[1], r[2] = 0, 0, 0
+
+    def set_gyro_scale(self, gyro_scale: float) -> None:
+        """Sets the counts per deg/s of the rates update_counts gets."""
+        self.gyro_scale = gyro_scale
+        # radians per count and microsecond in STEP_BITS + STEP_EXTRA_BITS,
+        # kept as a 15 bit int and a shift so it does not lose precision
+        k = DEG_TO_RAD / gyro_scale / 1000000 * (1 << (self.STEP_BITS + self.STEP_EXTRA_BITS))
+        shift = 0
+
+        while k * (1 << (shift + 1)) < 32768:
+            shift += 1
+
+        self._gyro_k = int(round(k * (1 << shift)))
+        self._gyro_shift = shift
+
+    def update(self, gx, gy, gz, ax, ay, az, dt) -> None:
+        gs = self.gyro_scale
+        acs = self.accel_scale
+        self.update_counts(
+            int(round(gx * gs)), int(round(gy * gs)), int(round(gz * gs)),
+            int(round(ax * acs)), int(round(ay * acs)), int(round(az * acs)),
+            int(round(dt * 1000000)))
+
+    def update_counts(self, gx, gy, gz, ax, ay, az, dt_us) -> None:
+        """
+        Advances the estimate by one sample.
+
+        Args:
+            gx, gy, gz (int): Angular rate in counts, the gyro offset already subtracted.
+            ax, ay, az (int): Acceleration in counts of any scale, offset subtracted.
+            dt_us (int): Microseconds since the previous sample.
+        """
+        raise NotImplementedError
+
+    @micropython.native
+    def _gyro_steps(self, gx, gy, gz, dt_us):
+        # angle turned about each axis in STEP_BITS radians, what the shift
+        # drops is carried over to the next sample
+        k = (dt_us * self._gyro_k) >> self._gyro_shift
+        bits = self.STEP_EXTRA_BITS
+        steps = self._steps
+        r = self._remainders
+
+        x = gx * k + r[0]
+        steps[0] = x >> bits
+        r[0] = x - (steps[0] << bits)
+        x = gy * k + r[1]
+        steps[1] = x >> bits
+        r[1] = x - (steps[1] << bits)
+        x = gz * k + r[2]
+        steps[2] = x >> bits
+        r[2] = x - (steps[2] << bits)
+
+
+class FixedComplementaryFilter(FixedPointFilter):
+    name = "complementary_fixed"
+    # whole angles, in the format of the angles
+    STEP_BITS = 26
+    STEP_EXTRA_BITS = 8
+
+    def __init__(self, alpha: float = 0.98, gyro_scale: float = 131.0, accel_scale: float = 16384.0):
+        """
+        Args:
+            alpha (float, optional): Weight of the integrated gyro against the accelerometer tilt. Defaults to 0.98.
+            gyro_scale (float, optional): Counts per deg/s. Defaults to 131.0.
+            accel_scale (float, optional): Counts per g, only used by update(). Defaults to 16384.0.
+        """
+        super().__init__(gyro_scale, accel_scale)
+        self.alpha = alpha
+        # weight of the accelerometer tilt, Q14
+        self._accel_k = int(round((1.0 - alpha) * Q14))
+        # roll, pitch, yaw in Q26 radians
+        self._angles = array("i", [0, 0, 0])
+        self._initialized = False
+
+    def reset(self) -> None:
+        super().reset()
+        a = self._angles
+        a[0], a[1], a[2] = 0, 0, 0
+        self._initialized = False
+
+    @micropython.native
+    def update_counts(self, gx, gy, gz, ax, ay, az, dt_us) -> None:
+        # only the direction matters, bring the largest below 2**13
+        m = max(abs(ax), abs(ay), abs(az))
+
+        while m >= 8192:
+            m >>= 1
+            ax >>= 1
+            ay >>= 1
+            az >>= 1
+
+        a = self._angles
+        accel_roll = _atan2_q26(ay, az)
+        accel_pitch = _atan2_q26(-ax, _isqrt(ay * ay + az * az))
+
+        if not self._initialized:
+            a[0] = accel_roll
+            a[1] = accel_pitch
+            self._initialized = True
+        else:
+            self._gyro_steps(gx, gy, gz, dt_us)
+            steps = self._steps
+            k = self._accel_k
+            # x + (1 - alpha) * (tilt - x), the difference in Q18 times Q14
+            x = a[0] + steps[0]
+            a[0] = x + ((((accel_roll - x) >> 8) * k) >> 6)
+            x = a[1] + steps[1]
+            a[1] = x + ((((accel_pitch - x) >> 8) * k) >> 6)
+            # yaw is not corrected, wrap it so it never leaves the int range
+            x = a[2] + steps[2]
+            if x >= PI_Q26:
+                x -= 2 * PI_Q26
+            elif x < -PI_Q26:
+                x += 2 * PI_Q26
+            a[2] = x
+
+        # quaternion from roll/pitch/yaw (ZYX), half angles in Q14
+        cr = _cos_q14(a[0] >> 13)
+        sr = _sin_q14(a[0] >> 13)
+        cp = _cos_q14(a[1] >> 13)
+        sp = _sin_q14(a[1] >> 13)
+        cy = _cos_q14(a[2] >> 13)
+        sy = _sin_q14(a[2] >> 13)
+
+        q = self._q
+        q[0] = ((cr * cp) >> 14) * cy + ((sr * sp) >> 14) * sy
+        q[1] = ((sr * cp) >> 14) * cy - ((cr * sp) >> 14) * sy
+        q[2] = ((cr * sp) >> 14) * cy + ((sr * cp) >> 14) * sy
+        q[3] = ((cr * cp) >> 14) * sy - ((sr * sp) >> 14) * cy
+
+
+class FixedMadgwickFilter(FixedPointFilter):
+    name = "madgwick_fixed"
+    # whole angles in Q20 are the half angles the update needs in Q21
+    STEP_BITS = 20
+    STEP_EXTRA_BITS = 15
+
+    def __init__(self, beta: float = 0.1, gyro_scale: float = 131.0, accel_scale: float = 16384.0):
+        """
+        Args:
+            beta (float, optional): Gradient descent gain, higher trusts the accelerometer more. Defaults to 0.1.
+            gyro_scale (float, optional): Counts per deg/s. Defaults to 131.0.
+            accel_scale (float, optional): Counts per g, only used by update(). Defaults to 16384.0.
+        """
+        super().__init__(gyro_scale, accel_scale)
+        self.beta = beta
+        # beta * dt in Q28 is dt_us * _beta_k >> 8
+        self._beta_k = int(round(beta * Q28 / 1000000 * 256))
+
+    @micropython.native
+    def update_counts(self, gx, gy, gz, ax, ay, az, dt_us) -> None:
+        q = self._q
+        # Q14 copies for the products, the Q28 values only take the sums
+        p0 = q[0] >> 14
+        p1 = q[1] >> 14
+        p2 = q[2] >> 14
+        p3 = q[3] >> 14
+
+        # change of the quaternion from the gyroscope, Q14 times Q21 -> Q28
+        self._gyro_steps(gx, gy, gz, dt_us)
+        steps = self._steps
+        wx = steps[0]
+        wy = steps[1]
+        wz = steps[2]
+        d0 = -(p1 * wx + p2 * wy + p3 * wz) >> 7
+        d1 = (p0 * wx + p2 * wz - p3 * wy) >> 7
+        d2 = (p0 * wy - p1 * wz + p3 * wx) >> 7
+        d3 = (p0 * wz + p1 * wy - p2 * wx) >> 7
+
+        m = max(abs(ax), abs(ay), abs(az))
+
+        if m:
+            # bring the largest to 2**12..2**13, then normalize to Q14
+            while m >= 8192:
+                m >>= 1
+                ax >>= 1
+                ay >>= 1
+                az >>= 1
+
+            while m < 4096:
+                m <<= 1
+                ax <<= 1
+                ay <<= 1
+                az <<= 1
+
+            n = _isqrt(ax * ax + ay * ay + az * az)
+            ax = (ax << 16) // n
+            ay = (ay << 16) // n
+            az = (az << 16) // n
+
+            # objective function, estimated minus measured gravity (Q16)
+            f0 = ((p1 * p3 - p0 * p2) >> 11) - ax
+            f1 = ((p0 * p1 + p2 * p3) >> 11) - ay
+            f2 = (1 << 16) - ((p1 * p1 + p2 * p2) >> 11) - az
+
+            # half the gradient, Jacobian transposed times f, Q11 times Q16 -> Q27;
+            # it is not shifted back, rounding it down would bias its direction
+            r0 = p0 >> 3
+            r1 = p1 >> 3
+            r2 = p2 >> 3
+            r3 = p3 >> 3
+            s0 = r1 * f1 - r2 * f0
+            s1 = r3 * f0 + r0 * f1 - ((r1 * f2) << 1)
+            s2 = r3 * f1 - r0 * f0 - ((r2 * f2) << 1)
+            s3 = r1 * f0 + r2 * f1
+
+            m = max(abs(s0), abs(s1), abs(s2), abs(s3))
+
+            if m:
+                while m >= 8192:
+                    m >>= 1
+                    s0 >>= 1
+                    s1 >>= 1
+                    s2 >>= 1
+                    s3 >>= 1
+
+                while m < 4096:
+                    m <<= 1
+                    s0 <<= 1
+                    s1 <<= 1
+                    s2 <<= 1
+                    s3 <<= 1
+
+                n = _isqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3)
+                # beta * dt along the normalized gradient, Q24 times Q14 -> Q28
+                step = ((dt_us * self._beta_k) >> 8) >> 4
+                d0 -= (((s0 << 14) // n) * step) >> 10
+                d1 -= (((s1 << 14) // n) * step) >> 10
+                d2 -= (((s2 << 14) // n) * step) >> 10
+                d3 -= (((s3 << 14) // n) * step) >> 10
+
+        q0 = q[0] + d0
+        q1 = q[1] + d1
+        q2 = q[2] + d2
+        q3 = q[3] + d3
+
+        # q * (3 - |q|^2) / 2, the norm stays close enough to 1 for one step
+        p0 = q0 >> 14
+        p1 = q1 >> 14
+        p2 = q2 >> 14
+        p3 = q3 >> 14
+        e = (p0 * p0 + p1 * p1 + p2 * p2 + p3 * p3 - Q28) >> 2
+        q[0] = q0 - ((p0 * e) >> 13)
+        q[1] = q1 - ((p1 * e) >> 13)
+        q[2] = q2 - ((p2 * e) >> 13)
+        q[3] = q3 - ((p3 * e) >> 13)
+
+
+FILTERS = {
+    ComplementaryFilter.name: ComplementaryFilter,
+    MadgwickFilter.name: MadgwickFilter,
+    MahonyFilter.name: MahonyFilter,
+    FixedComplementaryFilter.name: FixedComplementaryFilter,
+    FixedMadgwickFilter.name: FixedMadgwickFilter,
+}
+
+
+def create_filter(name: str, **kwargs) -> AttitudeFilter:
+    """Creates a filter by name, see FILTERS."""
+    if name not in FILTERS:
+        raise ValueError("unknown filter {}".format(name))
+
+    return FILTERS[name](**kwargs)
+
+
+class AttitudeEstimator:
+    """
+    Ring consumer that runs an AttitudeFilter over every sample.
+
+    dt comes from the sample timestamps, so it follows the real sample rate
+    including any jitter. FixedPointFilter instances get the raw counts with
+    the calibration offsets converted to counts, at the driver's gyro scale.
+    """
+
+    def __init__(self, ring, mpu, attitude_filter: AttitudeFilter, ticks_diff=None):
+        self.ring = ring
+        self.mpu = mpu
+        self.filter = attitude_filter
+        self.updates = 0
+        self.timestamp = 0
+
+        if ticks_diff is None:
+            try:
+                from time import ticks_diff
+            except ImportError:
+                def ticks_diff(a, b):
+                    return a - b
+
+        self._ticks_diff = ticks_diff
+        self._cursor = ring.reader()
+        self._raw = bytearray(ring.record_size)
+        # gx, gy, gz, ax, ay, az, temp of the sample being processed
+        self._values = array("f", [0.0] * 7)
+        self._counts = array("i", [0] * 7)
+        # gyro and accel offsets in counts, for the offsets and scales they were converted from
+        self._count_offsets = array("i", [0] * 6)
+        self._converted = None
+
+    def process(self) -> int:
+        """
+        Feeds every new ring sample to the filter.
+
+        Returns:
+            int: Number of samples processed.
+        """
+        if isinstance(self.filter, FixedPointFilter):
+            return self._process_counts()
+
+        count = 0
+        raw = self._raw
+        v = self._values
+        decode = self.mpu.decode_raw_into
+        update = self.filter.update
+
+        while True:
+            timestamp = self.ring.read_into(self._cursor, raw)
+
+            if timestamp is None:
+                break
+
+            decode(raw, v)
+
+            if self.updates:
+                dt = self._ticks_diff(timestamp, self.timestamp) / 1000000
+            else:
+                dt = 0.0
+
+            update(v[0], v[1], v[2], v[3], v[4], v[5], dt)
+            self.timestamp = timestamp
+            self.updates += 1
+            count += 1
+
+        return count
+
+    def _convert_offsets(self) -> None:
+        mpu = self.mpu
+        gs = mpu.gyro_scale
+        acs = mpu.accel_scale
+        key = (mpu.gyro_offset, mpu.accel_offset, gs, acs)
+
+        if key == self._converted:
+            return
+
+        o = self._count_offsets
+
+        for i in range(3):
+            o[i] = int(round(mpu.gyro_offset[i] * gs))
+            o[3 + i] = int(round(mpu.accel_offset[i] * acs))
+
+        if self.filter.gyro_scale != gs:
+            self.filter.set_gyro_scale(gs)
+
+        self._converted = key
+
+    def _process_counts(self) -> int:
+        # calibration or a range change between batches takes effect here
+        self._convert_offsets()
+
+        count = 0
+        raw = self._raw
+        c = self._counts
+        o = self._count_offsets
+        decode = self.mpu.decode_counts_into
+        update = self.filter.update_counts
+
+        while True:
+            timestamp = self.ring.read_into(self._cursor, raw)
+
+            if timestamp is None:
+                break
+
+            decode(raw, c)
+            dt_us = self._ticks_diff(timestamp, self.timestamp) if self.updates else 0
+            update(c[0] - o[0], c[1] - o[1], c[2] - o[2],
+                   c[3] - o[3], c[4] - o[4], c[5] - o[5], dt_us)
+            self.timestamp = timestamp
+            self.updates += 1
+            count += 1
+
+        return count
@@ -0,0 +1,171 @@
+"""
+I2C bus of the sensor: a hardware peripheral if one works, SoftI2C if not,
+and recovery of a hung bus.
+
+The ESP32's I2C peripherals clock the bus themselves, SoftI2C bit-bangs it
+from Python at well below the requested frequency and keeps the CPU busy
+for the whole transfer. open() therefore tries the hardware peripheral at
+the configured frequency first, then at 400 kHz (the MPU6050's rated
+maximum, some modules do not run at 1 MHz), and only then SoftI2C. Each
+candidate must answer a read of the sensor, and the one picked is timed
+over a few burst reads so the log shows what the bus can do.
+
+A slave interrupted in the middle of a read (an ESP32 reset, a glitch on
+SCL) keeps driving SDA low until it has clocked out its byte, and every
+transaction fails from then on. clear() takes the pins over as GPIO and
+pulses SCL until SDA is released, at most 9 times, then sends a STOP, as
+the I2C specification describes for bus clear. The peripheral is set up
+again afterwards. Errors that come from the sensor itself (NACK after a
+brown-out) are handled by waking and reconfiguring it, see
+SensorControl.recover.
+"""
+
+from machine import I2C, Pin, SoftI2C
+from time import sleep_us, ticks_diff, ticks_us
+
+# the MPU6050's highest rated clock, tried when a faster one fails
+FALLBACK_FREQ = 400000
+# half a clock period of the manual bus clear, 100 kHz
+CLEAR_HALF_PERIOD_US = 5
+
+
+class I2CBus:
+    def __init__(self, scl: int, sda: int, freq: int = 400000, hw_id: int = 0,
+                 address: int = 0x68, probe_register: int = 0x75):
+        """
+        Args:
+            scl (int): SCL GPIO.
+            sda (int): SDA GPIO.
+            freq (int, optional): Clock to ask for. Defaults to 400000.
+            hw_id (int, optional): Hardware I2C peripheral, None to only use SoftI2C. Defaults to 0.
+            address (int, optional): Device that must answer for a bus to be used. Defaults to 0x68.
+            probe_register (int, optional): Register read to check the device answers, WHO_AM_I. Defaults to 0x75.
+        """
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+        self.hw_id = hw_id
+        self.address = address
+        self.probe_register = probe_register
+
+        # the machine.I2C or SoftI2C in use, replaced by recover()
+        self.i2c = None
+        self.hardware = False
+        self.bus_freq = 0
+        self.reads_per_s = 0.0
+        self.recoveries = 0
+
+    def __str__(self):
+        return "{} I2C {} kHz, {:.0f} reads/s".format(
+            "hardware" if self.hardware else "software", self.bus_freq // 1000,
+            self.reads_per_s)
+
+    def open(self):
+        """
+        Sets up the first bus on which the device answers.
+
+        Returns:
+            machine.I2C: The bus, also in self.i2c.
+
+        Raises:
+            OSError: The device did not answer on any bus.
+        """
+        candidates = []
+
+        if self.hw_id is not None:
+            candidates.append((True, self.freq))
+
+            if self.freq > FALLBACK_FREQ:
+                candidates.append((True, FALLBACK_FREQ))
+
+        candidates.append((False, min(self.freq, FALLBACK_FREQ)))
+        error = None
+
+        for hardware, freq in candidates:
+            if hardware:
+                i2c = I2C(self.hw_id, scl=Pin(self.scl), sda=Pin(self.sda), freq=freq)
+            else:
+                i2c = SoftI2C(scl=Pin(self.scl), sda=Pin(self.sda), freq=freq)
+
+            try:
+                i2c.readfrom_mem(self.address, self.probe_register, 1)
+            except OSError as e:
+                error = e
+                continue
+
+            self.i2c = i2c
+            self.hardware = hardware
+            self.bus_freq = freq
+            return i2c
+
+        raise error
+
+    def measure(self, register: int = 0x3B, nbytes: int = 14, count: int = 50) -> float:
+        """
+        Times burst reads like the sampler's.
+
+        Returns:
+            float: Reads per second, also in self.reads_per_s.
+        """
+        buf = bytearray(nbytes)
+        i2c = self.i2c
+        start = ticks_us()
+
+        for _ in range(count):
+            i2c.readfrom_mem_into(self.address, register, buf)
+
+        elapsed = ticks_diff(ticks_us(), start)
+        self.reads_per_s = count * 1000000 / max(1, elapsed)
+        return self.reads_per_s
+
+    def clear(self) -> bool:
+        """
+        Clocks a slave holding SDA low out of its transfer and ends it with a STOP.
+
+        Returns:
+            bool: True if SDA is released.
+        """
+        half = CLEAR_HALF_PERIOD_US
+        scl = Pin(self.scl, Pin.OPEN_DRAIN, value=1)
+        sda = Pin(self.sda, Pin.OPEN_DRAIN, value=1)
+        sleep_us(half)
+
+        for _ in range(9):
+            if sda.value():
+                break
+
+            scl.value(0)
+            sleep_us(half)
+            scl.value(1)
+            sleep_us(half)
+
+        # STOP: SDA rises while SCL is high
+        scl.value(0)
+        sleep_us(half)
+        sda.value(0)
+        sleep_us(half)
+        scl.value(1)
+        sleep_us(half)
+        sda.value(1)
+        sleep_us(half)
+
+        return bool(sda.value())
+
+    def recover(self):
+        """
+        Clears the bus and sets it up again, after a transaction failed. The
+        bus picked may be another one than before, it is timed again.
+
+        Returns:
+            machine.I2C: The new bus, also in self.i2c.
+
+        Raises:
+            OSError: The device still does not answer.
+        """
+        if not self.clear():
+            print("I2C: SDA still held low after the bus clear")
+
+        self.recoveries += 1
+        self.open()
+        self.measure()
+        return self.i2c
@@ -0,0 +1,594 @@
+"""
+Circular sample log on the board's flash.
+
+Samples are taken from the SampleRing with their own cursor, compressed
+into DELTA messages (see codec.py and wire.py) and written to a fixed
+number of segment files that are reused oldest first:
+
+    <root>/seg<slot>.bin    slot = sequence % segments
+    <root>/seg<slot>.idx    sparse time index of the segment
+
+A segment is a sequence of chunks of block_size bytes, each written with
+a single write() so the file system only ever sees whole, aligned blocks:
+
+    4s MAGIC, I segment sequence, H chunk index, H payload length,
+    I wall clock seconds, H milliseconds of the chunk's first sample,
+    I crc32 of the 14 bytes before it and the payload,
+    payload, zero padding up to block_size
+
+Chunk 0 is the segment header, its payload is SEGMENT_FORMAT (format
+version, chunks per segment, sample rate, wall clock seconds) followed by
+a wire SCHEMA message. Every further chunk holds whole DELTA messages.
+
+After a power loss the last chunk may be torn; readers stop at the first
+chunk whose magic, sequence, index or CRC does not match, so at most one
+block of samples is lost. A new segment is started on every boot.
+
+The index file holds one INDEX_FORMAT entry (seconds, milliseconds, chunk
+index) per data chunk, appended after the chunk is written. Wall clock
+times are the board's time.time() when logging started plus the ticks
+elapsed since, so a clock set later (e.g. by NTP) only moves new segments.
+On boot the index is extended from the chunks it is missing, usually none
+or the one written just before a reset. history() uses it to read only the
+chunks of a time range; samples still in the chunk buffer are not on
+flash yet, the live stream has them.
+
+Only os, struct and binascii are used, so the logger runs against any
+directory, e.g. on a PC for testing.
+"""
+
+import os
+import struct
+import time
+import wire
+from binascii import crc32
+from codec import RAW_DATA_SIZE, DeltaEncoder
+from math import isfinite
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter_ns
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+MAGIC = b"MPUL"
+FORMAT_VERSION = 2
+
+CHUNK_FORMAT = ">4sIHHIHI"
+CHUNK_HEADER_SIZE = 22
+# bytes covered by the CRC in front of the payload
+CHUNK_CRC_START = 4
+CHUNK_CRC_END = 18
+
+INDEX_FORMAT = ">IHH"
+INDEX_ENTRY_SIZE = 8
+
+SEGMENT_FORMAT = ">BHfI"
+SEGMENT_HEADER_SIZE = 11
+
+
+def segment_name(slot: int) -> str:
+    return "seg{}.bin".format(slot)
+
+
+def index_name(slot: int) -> str:
+    return "seg{}.idx".format(slot)
+
+
+def parse_time(value: str, now_ms: int) -> int:
+    """
+    Converts a /history time to wall clock milliseconds.
+
+    Accepts seconds since the epoch, negative seconds relative to now
+    ("-30") and "HH:MM[:SS]" of the current day (board clock, UTC).
+
+    Raises:
+        ValueError: Not a time in one of these forms, or not finite.
+    """
+    if ":" in value:
+        parts = [int(v) for v in value.split(":")]
+
+        if len(parts) > 3:
+            raise ValueError("bad time {}".format(value))
+
+        while len(parts) < 3:
+            parts.append(0)
+
+        midnight = now_ms - now_ms % 86400000
+        return midnight + ((parts[0] * 60 + parts[1]) * 60 + parts[2]) * 1000
+
+    seconds = float(value)
+
+    if not isfinite(seconds * 1000):
+        raise ValueError("bad time {}".format(value))
+
+    if seconds < 0:
+        return now_ms + int(seconds * 1000)
+
+    return int(seconds) * 1000 + int(seconds % 1 * 1000)
+
+
+def read_chunk_header(data, offset: int = 0):
+    """
+    Parses and checks the chunk at offset of a segment image.
+
+    Returns:
+        tuple: (sequence, index, payload offset, payload length, wall clock ms),
+        None if the chunk is invalid.
+    """
+    if len(data) - offset < CHUNK_HEADER_SIZE:
+        return None
+
+    magic, sequence, index, length, seconds, ms, crc = struct.unpack_from(
+        CHUNK_FORMAT, data, offset)
+    start = offset + CHUNK_HEADER_SIZE
+
+    if magic != MAGIC or start + length > len(data):
+        return None
+
+    mv = memoryview(data)
+    check = crc32(mv[start:start + length],
+                  crc32(mv[offset + CHUNK_CRC_START:offset + CHUNK_CRC_END]))
+
+    if check & 0xFFFFFFFF != crc:
+        return None
+
+    return sequence, index, start, length, seconds * 1000 + ms
+
+
+def read_segment(data, block_size: int):
+    """
+    Splits a segment image into its valid chunks.
+
+    Returns:
+        tuple: (header, payloads) where header is (sequence, chunks, sample rate,
+        wall clock seconds, schema message) and payloads a list of memoryviews
+        of the chunks that follow in order, or None if chunk 0 is invalid.
+    """
+    chunk = read_chunk_header(data, 0)
+
+    if chunk is None or chunk[1] != 0:
+        return None
+
+    sequence, _, start, length, _ = chunk
+    version, chunks, rate, clock = struct.unpack_from(
+        SEGMENT_FORMAT, data, start)
+
+    if version != FORMAT_VERSION:
+        return None
+
+    mv = memoryview(data)
+    schema = bytes(mv[start + SEGMENT_HEADER_SIZE:start + length])
+    payloads = []
+
+    for index in range(1, chunks):
+        chunk = read_chunk_header(data, index * block_size)
+
+        if chunk is None or chunk[0] != sequence or chunk[1] != index:
+            break
+
+        payloads.append(mv[chunk[2]:chunk[2] + chunk[3]])
+
+    return (sequence, chunks, rate, clock, schema), payloads
+
+
+class FlashLogger:
+    def __init__(self, ring, mpu, root: str = "/log", segment_size: int = 65536,
+                 segments: int = 8, block_size: int = 4096,
+                 sample_rate_hz: float = 100, frame_samples: int = 25):
+        """
+        Args:
+            ring (SampleRing): Ring the sampler writes to.
+            mpu (MPU6050): Its scales and offsets go into every segment header.
+            root (str, optional): Directory of the segment files. Defaults to "/log".
+            segment_size (int, optional): Bytes per segment file, a multiple of block_size. Defaults to 65536.
+            segments (int, optional): Number of segment files kept. Defaults to 8.
+            block_size (int, optional): Chunk size, the flash erase block size. Defaults to 4096.
+            sample_rate_hz (float, optional): Rate the ring is filled at. Defaults to 100.
+            frame_samples (int, optional): Samples per DELTA message. Defaults to 25.
+        """
+        if segment_size % block_size or segment_size < 2 * block_size:
+            raise ValueError("segment_size must be a multiple of block_size, at least 2 blocks")
+
+        self.ring = ring
+        self.mpu = mpu
+        self.root = root
+        self.segments = segments
+        self.block_size = block_size
+        self.chunks = segment_size // block_size
+        self.sample_rate_hz = sample_rate_hz
+
+        # sequence of the next segment, and of the one being written
+        self.sequence = 0
+        self._current = 0
+        self.samples = 0
+        self.chunks_written = 0
+        # time of the slowest chunk write, the stall the loop sees
+        self.max_write_us = 0
+
+        self._cursor = ring.reader()
+        self._raw = bytearray(RAW_DATA_SIZE)
+        self._encoder = DeltaEncoder(frame_samples)
+        self._buf = bytearray(block_size)
+        self._mv = memoryview(self._buf)
+        self._zeros = bytes(block_size)
+        self._fill = CHUNK_HEADER_SIZE
+        self._index = 0
+        self._file = None
+        self._index_file = None
+        self._entry = bytearray(INDEX_ENTRY_SIZE)
+
+        # wall clock of the chunk being filled, and the sample it refers to
+        self._chunk_ms = 0
+        self._ref_ms = None
+        self._ref_ts = 0
+        self._ref_us = 0
+
+        try:
+            os.mkdir(root)
+        except OSError:
+            pass
+
+        for info in self.list():
+            self.sequence = max(self.sequence, info["seq"] + 1)
+
+        self.rebuild_index()
+
+    def path(self, slot: int) -> str:
+        return "{}/{}".format(self.root, segment_name(slot))
+
+    def index_path(self, slot: int) -> str:
+        return "{}/{}".format(self.root, index_name(slot))
+
+    def rebuild_index(self) -> int:
+        """
+        Appends the index entries missing for chunks on flash, e.g. after a reset.
+
+        Returns:
+            int: Number of entries added.
+        """
+        added = 0
+        buf = None
+
+        for segment in self.list():
+            slot = segment["slot"]
+            path = self.index_path(slot)
+
+            try:
+                size = os.stat(path)[6]
+            except OSError:
+                size = 0
+
+            entries = size // INDEX_ENTRY_SIZE
+
+            if size % INDEX_ENTRY_SIZE:
+                # torn entry, rewrite the file without it
+                with open(path, "rb") as index_file:
+                    data = index_file.read(entries * INDEX_ENTRY_SIZE)
+                with open(path, "wb") as index_file:
+                    index_file.write(data)
+
+            chunks = segment["size"] // self.block_size
+
+            if entries >= chunks - 1:
+                continue
+
+            if buf is None:
+                buf = bytearray(self.block_size)
+
+            with open(path, "ab") as index_file:
+                for index in range(entries + 1, chunks):
+                    chunk = self.read_chunk(slot, index, buf)
+
+                    if chunk is None or chunk[0] != segment["seq"]:
+                        break
+
+                    struct.pack_into(INDEX_FORMAT, self._entry, 0,
+                                     chunk[1] // 1000, chunk[1] % 1000, index)
+                    index_file.write(self._entry)
+                    added += 1
+
+        return added
+
+    def read_chunk(self, slot: int, index: int, buf):
+        """
+        Reads and checks one chunk into buf (block_size bytes).
+
+        Returns:
+            tuple: (sequence, wall clock ms, payload memoryview), None if the chunk is invalid.
+        """
+        try:
+            with open(self.path(slot), "rb") as file:
+                file.seek(index * self.block_size)
+                n = file.readinto(buf)
+        except OSError:
+            return None
+
+        if n != self.block_size:
+            return None
+
+        chunk = read_chunk_header(buf)
+
+        if chunk is None or chunk[1] != index:
+            return None
+
+        sequence, _, start, length, ms = chunk
+        return sequence, ms, memoryview(buf)[start:start + length]
+
+    def find(self, from_ms: int, to_ms: int) -> list:
+        """
+        Chunks that may hold samples between from_ms and to_ms, oldest first.
+
+        Returns:
+            list: (slot, sequence, chunk index) tuples.
+        """
+        entries = []
+        entry = bytearray(INDEX_ENTRY_SIZE)
+
+        for segment in self.list():
+            slot = segment["slot"]
+
+            try:
+                index_file = open(self.index_path(slot), "rb")
+            except OSError:
+                continue
+
+            with index_file:
+                while index_file.readinto(entry) == INDEX_ENTRY_SIZE:
+                    seconds, ms, index = struct.unpack_from(INDEX_FORMAT, entry)
+                    entries.append((seconds * 1000 + ms, slot, segment["seq"], index))
+
+        chunks = []
+
+        for i, (start, slot, sequence, index) in enumerate(entries):
+            # a chunk ends where the next one starts
+            end = entries[i + 1][0] if i + 1 < len(entries) else None
+
+            if start <= to_ms and (end is None or end > from_ms):
+                chunks.append((slot, sequence, index))
+
+        return chunks
+
+    def history(self, from_ms: int, to_ms: int, raw):
+        """
+        Generator over the logged samples between from_ms and to_ms.
+
+        Reads chunk by chunk through one block_size buffer and writes each
+        sample into raw (RAW_DATA_SIZE bytes).
+
+        Yields:
+            tuple: (timestamp, schema, rate) where schema is the wire SCHEMA
+            message and rate the sample rate the segment was logged at, for
+            its first sample, else both None.
+        """
+        from codec import decode
+
+        buf = bytearray(self.block_size)
+        sequence = None
+
+        for slot, seq, index in self.find(from_ms, to_ms):
+            schema = None
+            rate = None
+
+            if seq != sequence:
+                chunk = self.read_chunk(slot, 0, buf)
+                if chunk is None or chunk[0] != seq:
+                    continue
+                rate = struct.unpack_from(SEGMENT_FORMAT, chunk[2])[2]
+                schema = bytes(chunk[2][SEGMENT_HEADER_SIZE:])
+                sequence = seq
+
+            chunk = self.read_chunk(slot, index, buf)
+
+            if chunk is None or chunk[0] != seq:
+                continue
+
+            _, chunk_ms, payload = chunk
+            offset = 0
+            first = None
+
+            while offset + wire.DELTA_HEADER_SIZE <= len(payload):
+                _, _, count, length = struct.unpack_from(
+                    wire.DELTA_HEADER_FORMAT, payload, offset)
+                offset += wire.DELTA_HEADER_SIZE
+
+                for timestamp, values in decode(payload, count, offset):
+                    if first is None:
+                        first = timestamp
+
+                    ms = chunk_ms + ticks_diff(timestamp, first) // 1000
+
+                    if ms > to_ms:
+                        return
+                    if ms < from_ms:
+                        continue
+
+                    struct.pack_into(">7h", raw, 0, *values)
+                    yield timestamp, schema, rate
+                    schema = None
+                    rate = None
+
+                offset += length
+
+    def list(self) -> list:
+        """Segments on flash with a valid header, oldest first, as dicts."""
+        segments = []
+        header = bytearray(CHUNK_HEADER_SIZE + SEGMENT_HEADER_SIZE)
+
+        for slot in range(self.segments):
+            path = self.path(slot)
+
+            try:
+                size = os.stat(path)[6]
+                with open(path, "rb") as file:
+                    n = file.readinto(header)
+            except OSError:
+                continue
+
+            if n != len(header):
+                continue
+
+            magic, sequence, index, _, seconds, _, _ = struct.unpack_from(
+                CHUNK_FORMAT, header)
+
+            if magic != MAGIC or index != 0:
+                continue
+
+            segments.append({
+                "name": segment_name(slot),
+                "slot": slot,
+                "seq": sequence,
+                "size": size,
+                "time": seconds,
+            })
+
+        segments.sort(key=lambda s: s["seq"])
+        return segments
+
+    def process(self) -> int:
+        """
+        Logs the samples written to the ring since the last call.
+
+        Returns:
+            int: Number of samples logged.
+        """
+        raw = self._raw
+        encoder = self._encoder
+        count = 0
+
+        while True:
+            timestamp = self.ring.read_into(self._cursor, raw)
+
+            if timestamp is None:
+                break
+
+            length = encoder.add(raw, timestamp)
+            if length:
+                self._append(length)
+
+            count += 1
+
+        self.samples += count
+        return count
+
+    def flush(self) -> None:
+        """Writes out the partial frame and chunk, e.g. before a reset."""
+        length = self._encoder.flush()
+        if length:
+            self._append(length)
+
+        if self._fill > CHUNK_HEADER_SIZE:
+            self._write_chunk()
+
+    def reconfigure(self, sample_rate_hz: float) -> None:
+        """
+        Ends the current segment after a change of the ranges or sample rate,
+        the next one carries the new schema. Call flush() before the change.
+        """
+        self.sample_rate_hz = sample_rate_hz
+
+        if self._file:
+            self._index = self.chunks
+
+    def close(self) -> None:
+        self.flush()
+
+        if self._file:
+            self._file.close()
+            self._index_file.close()
+            self._file = None
+            self._index_file = None
+
+    def _append(self, length: int) -> None:
+        """Adds the encoder's frame as a DELTA message to the chunk being filled."""
+        size = wire.DELTA_HEADER_SIZE + length
+
+        if self._fill + size > self.block_size:
+            self._write_chunk()
+
+        if self._fill == CHUNK_HEADER_SIZE:
+            # the frame's keyframe timestamp is the chunk's first sample
+            self._chunk_ms = self._wall_ms(
+                struct.unpack_from(">I", self._encoder.body)[0])
+
+        wire.encode_delta_header(self._encoder.count, length,
+                                 self._mv[self._fill:])
+        self._fill += wire.DELTA_HEADER_SIZE
+        self._mv[self._fill:self._fill + length] = memoryview(
+            self._encoder.body)[:length]
+        self._fill += length
+
+    def _write_chunk(self) -> None:
+        if self._file is None or self._index == self.chunks:
+            self._start_segment()
+
+        self._seal(self._index, self._fill - CHUNK_HEADER_SIZE)
+        self._write()
+
+        struct.pack_into(INDEX_FORMAT, self._entry, 0, self._chunk_ms // 1000,
+                         self._chunk_ms % 1000, self._index)
+        self._index_file.write(self._entry)
+        self._index_file.flush()
+
+        self._index += 1
+        self._fill = CHUNK_HEADER_SIZE
+
+    def _wall_ms(self, timestamp: int) -> int:
+        """Wall clock milliseconds of a sample timestamp, chunks must start less than a ticks period apart."""
+        if self._ref_ms is None:
+            self._ref_ms = int(time.time()) * 1000
+            self._ref_ts = timestamp
+
+        self._ref_us += ticks_diff(timestamp, self._ref_ts)
+        self._ref_ts = timestamp
+        self._ref_ms += self._ref_us // 1000
+        self._ref_us %= 1000
+        return self._ref_ms
+
+    def _start_segment(self) -> None:
+        if self._file:
+            self._file.close()
+            self._index_file.close()
+
+        # keep the pending data chunk, the header is built in front of it
+        pending = bytes(self._mv[:self._fill])
+
+        self._current = self.sequence
+        self.sequence += 1
+        slot = self._current % self.segments
+        self._file = open(self.path(slot), "wb")
+        self._index_file = open(self.index_path(slot), "wb")
+        start = CHUNK_HEADER_SIZE
+        struct.pack_into(SEGMENT_FORMAT, self._buf, start, FORMAT_VERSION,
+                         self.chunks, self.sample_rate_hz, int(time.time()))
+        start += SEGMENT_HEADER_SIZE
+        wire.encode_schema(self.mpu, self._mv[start:start + wire.SCHEMA_SIZE])
+        self._seal(0, SEGMENT_HEADER_SIZE + wire.SCHEMA_SIZE)
+        self._write()
+
+        self._mv[:len(pending)] = pending
+        self._index = 1
+
+    def _seal(self, index: int, length: int) -> None:
+        """Fills in the chunk header and zero padding of the chunk buffer."""
+        mv = self._mv
+        end = CHUNK_HEADER_SIZE + length
+        mv[end:] = self._zeros[end:]
+        struct.pack_into(CHUNK_FORMAT, self._buf, 0, MAGIC, self._current, index,
+                         length, self._chunk_ms // 1000, self._chunk_ms % 1000, 0)
+        crc = crc32(mv[CHUNK_HEADER_SIZE:end],
+                    crc32(mv[CHUNK_CRC_START:CHUNK_CRC_END]))
+        struct.pack_into(">I", self._buf, CHUNK_CRC_END, crc & 0xFFFFFFFF)
+
+    def _write(self) -> None:
+        start = ticks_us()
+        self._file.write(self._buf)
+        self._file.flush()
+        self.chunks_written += 1
+        self.max_write_us = max(self.max_write_us, ticks_diff(ticks_us(), start))
+
@@ -1,16 +1,31 @@
-from machine import Pin, SoftI2C
-from time import sleep
+import boottime
+from machine import Pin
 from MPU6050 import *
 
 
 uart = None
 led = Pin(2, Pin.OUT)
+buses = None
+sensors = None
 mpu = None
+sampler = None
+ring = None
+estimator = None
+logger = None
+streamer = None
+control = None
+metrics = None
 
 
 def on_rx():
     rx_data = uart.read().decode().strip()
-    uart.write("Esp32 says: " + str(rx_data) + "\n")
+
+    if streamer and streamer.command(rx_data):
+        return
+
+    if not (streamer and streamer.active):
+        # text would break up the binary samples on the TX characteristic
+        uart.write("Esp32 says: " + str(rx_data) + "\n")
     print("Esp32 says: " + str(rx_data))
 
     # bluefruit connect app
@@ -20,58 +35,333 @@ def on_rx():
         led.off()
 
 
-def loop():
-    from server import send_stream
+async def loop():
+    import config
+    from time import ticks_diff, ticks_ms, ticks_us
+    from server import asyncio, notify_stream
+
+    raw = bytearray(RAW_DATA_SIZE)
+    last_sample = 0
+    last_print = ticks_ms()
+    # newest sample or recovery attempt
+    last_seen = ticks_ms()
+    retry = False
+    stages = metrics.stages
+    jitter = metrics.interval_jitter
+    # timestamp of the last sample whose interval was observed, None after a gap
+    previous = None
+    period_us = 0
+    period_rate = 0.0
+
+    def observe_intervals(start, head):
+        nonlocal previous, period_us, period_rate
+
+        if sampler.rate_hz != period_rate:
+            # an interval across a rate change is not jitter
+            period_rate = sampler.rate_hz
+            period_us = round(1000000 / period_rate) if period_rate else 0
+            previous = None
+
+        seq = max(start, head - ring.capacity)
+
+        if seq != start:
+            # records were overwritten before the loop got to them
+            previous = None
+
+        timestamps = ring.timestamps
+        capacity = ring.capacity
+
+        while seq < head:
+            timestamp = timestamps[seq % capacity]
+
+            if previous is not None:
+                jitter.observe(abs(ticks_diff(timestamp, previous) - period_us))
+
+            previous = timestamp
+            seq += 1
+
+    def process():
+        start = t = ticks_us()
+
+        if estimator:
+            estimator.process()
+            t = stages["fusion"].lap(t)
+
+        if logger:
+            logger.process()
+            t = stages["log"].lap(t)
+
+        if streamer:
+            streamer.process()
+            t = stages["ble"].lap(t)
+
+        notify_stream()
+        stages["publish"].lap(t)
+        stages["loop"].lap(start)
+
+    def drain():
+        # the last samples of the old settings, before the registers change
+        process()
+
+        if logger:
+            logger.flush()
 
     while True:
-        gyro = mpu.read_gyro_data()
-        accel = mpu.read_accel_data()
-        temp = mpu.read_temperature()
+        if control and control.pending:
+            control.apply(drain)
 
-        data = {
-            "gyro": gyro,
-            "accel": accel,
-            "temp": temp,
-        }
+        if (sampler.fault and not retry) or ticks_diff(
+                ticks_ms(), last_seen) >= config.SENSOR_TIMEOUT_MS:
+            # a sensor that reset stops its INT pulses without a read failing, a stall counts too
+            retry = not control.recover(buses)
+            last_seen = ticks_ms()
 
-        print(data, end="\r")
-        send_stream(data)
+        if ring.head == last_sample:
+            # the sampler runs from interrupts, just yield to the server tasks
+            await asyncio.sleep(0.002)
+            continue
 
-        sleep(0.1)
+        head = ring.head
+        observe_intervals(last_sample, head)
+        last_sample = head
+        last_seen = ticks_ms()
+        timestamp = ring.latest_into(raw)
+        stages["latency"].observe(ticks_diff(ticks_us(), timestamp))
 
+        process()
+        metrics.poll()
 
-def main():
-    from _thread import start_new_thread
+        if config.DEBUG_PRINT_MS and ticks_diff(ticks_ms(), last_print) >= config.DEBUG_PRINT_MS:
+            # the console is slow, printing every sample would cost more than the rest of the loop
+            last_print = ticks_ms()
+            gyro, accel, temp = mpu.decode_raw(raw)
+            print({"gyro": gyro, "accel": accel, "temp": temp}, end="\r")
+
+
+def calibrate(mpu, path):
+    """
+    Loads the stored offsets for the current settings, or measures and stores them.
+
+    Args:
+        mpu (MPU6050): Sensor to calibrate.
+        path (str): Its offsets file.
+
+    Returns:
+        float: Temperature the offsets in use were measured at.
+    """
+    import calibration
+    import config
+
+    temp = mpu.read_temperature()
+    entry = calibration.load(path, mpu, temp, config.CALIBRATION_MAX_TEMP_DELTA)
+
+    if entry:
+        print("Loaded calibration for {:.1f} C".format(entry["temp"]))
+        temp = entry["temp"]
+    else:
+        print("Calibrating...")
+
+        try:
+            result = calibration.calibrate(mpu, az_0=False)
+            temp = result["temp"]
+            calibration.save(path, mpu, temp)
+            print("Calibrated with {} samples".format(result["samples"]))
+        except calibration.CalibrationError as e:
+            print("Calibration failed:", e)
+            entry = calibration.load(path, mpu, temp, None)
+
+            if entry:
+                print("Using the stored calibration for {:.1f} C".format(entry["temp"]))
+                temp = entry["temp"]
+
+    if config.CALIBRATION_HW_OFFSETS:
+        calibration.apply_to_registers(mpu)
+
+    return temp
+
+
+async def run(wlan):
+    from server import asyncio, create_server, wait_connected
+
+    await create_server(mpu)
+    boottime.mark("server")
+
+    # the interface comes up while the sampler is already running
+    asyncio.create_task(wait_connected(wlan))
+    await loop()
+
+
+def setup():
+    """
+    Brings up the radios, the sensor and every consumer of its samples.
+
+    Returns:
+        WLAN: The Wi-Fi interface, still coming up, for run().
+    """
     import bluetooth
+    import config
     from BLE import BLEUART
-    from server import create_server, socket_accept
+    from blestream import BLEStreamer
+    from control import SensorControl
+    from i2cbus import I2CBus
+    from metrics import Metrics
+    from ringbuffer import SampleRing
+    from sampler import DataReadySampler
+    from sensorarray import SensorArray, sensor_file
+    from server import (attach_control, attach_estimator, attach_logger,
+                        attach_metrics, attach_ring, connect)
+
+    boottime.mark("imports")
 
     global uart
+    global buses
+    global sensors
     global mpu
+    global sampler
+    global ring
+    global estimator
+    global logger
+    global streamer
+    global control
+    global metrics
 
     name = "esp32"
     led.off()
 
-    create_server(ap_if=True)
+    # only start the interface here, run() waits for it next to the sampler
+    wlan = connect(ap_if=True, wait=False)
+    boottime.mark("wifi started")
 
     ble = bluetooth.BLE()
-    uart = BLEUART(ble, name)
+    uart = BLEUART(ble, name, mtu=config.BLE_MTU)
     uart.irq(handler=on_rx)
+    boottime.mark("ble")
+
+    # each bus is probed at the address of its first sensor
+    buses = []
+
+    for hw_id, scl, sda in config.I2C_BUSES:
+        address = [a for b, a in config.SENSORS if b == len(buses)][0]
+        bus = I2CBus(scl, sda, config.I2C_FREQ_HZ, hw_id, address)
+        bus.open()
+        buses.append(bus)
+
+    sensors = [MPU6050(buses[b].i2c, address) for b, address in config.SENSORS]
+    mpu = sensors[0]
+
+    for sensor in sensors:
+        if config.CALIBRATION_HW_OFFSETS:
+            # the offset registers survive an ESP32 reset, start from the factory values
+            sensor.reset()
+
+        sensor.wake()
+
+        sensor.write_gyro_range(GYRO_RANGE_250DPS)
+        sensor.write_accel_range(ACCEL_RANGE_2G)
+        sensor.write_lpf_range(LPF_RANGE_44HZ)
+
+    for i, bus in enumerate(buses):
+        bus.measure()
+        print("Sensor bus {}:".format(i), bus)
 
-    i2c = SoftI2C(scl=Pin(22), sda=Pin(21))
-    mpu = MPU6050(i2c)
-    mpu.wake()
+    boottime.mark("sensor")
 
-    mpu.write_gyro_range(GYRO_RANGE_250DPS)
-    mpu.write_accel_range(ACCEL_RANGE_2G)
-    mpu.write_lpf_range(LPF_RANGE_44HZ)
+    # the temperature of sensor 0's offsets, the one the compensator corrects
+    calibration_temp = None
+
+    for i, sensor in enumerate(sensors):
+        temp = calibrate(sensor, sensor_file(config.CALIBRATION_FILE, i))
+
+        if not i:
+            calibration_temp = temp
 
-    print("Calibrating...")
-    mpu.calibrate(az_0=False)
     mpu.print_ranges()
+    boottime.mark("calibration")
+
+    int_pin = None
+
+    if config.MPU_INT_PIN is not None:
+        int_pin = Pin(config.MPU_INT_PIN, Pin.IN)
+
+    # one record holds a sample of every sensor, sensor 0's first for the consumers of one
+    ring = SampleRing(config.SAMPLE_BUFFER_SIZE, RAW_DATA_SIZE * len(sensors))
+    attach_ring(ring, mpu, config.SAMPLE_RATE_HZ, config.STREAM_DELTA_FRAME_MS, sensors)
+
+    streamer = BLEStreamer(uart, ring, mpu, config.SAMPLE_RATE_HZ,
+                           config.BLE_STREAM_RATE_HZ)
+
+    if config.FUSION_FILTER:
+        from fusion import AttitudeEstimator, create_filter
+
+        estimator = AttitudeEstimator(
+            ring, mpu, create_filter(config.FUSION_FILTER))
+        attach_estimator(estimator)
+
+    if config.LOG_DIR:
+        from logger import FlashLogger
+
+        logger = FlashLogger(ring, mpu, config.LOG_DIR, config.LOG_SEGMENT_SIZE,
+                             config.LOG_SEGMENTS, config.LOG_BLOCK_SIZE,
+                             config.SAMPLE_RATE_HZ)
+        attach_logger(logger)
+
+    on_sample = ring.write
+    compensator = None
+
+    if config.TEMP_MODEL_FILE:
+        from calibration import TempCompensator, load_temp_model
+
+        model = load_temp_model(config.TEMP_MODEL_FILE)
+
+        if model:
+            compensator = TempCompensator(model, mpu, calibration_temp)
+
+            def on_sample(buf, timestamp):
+                # the model is fitted to sensor 0, the block at the start of the record
+                compensator.apply(buf)
+                ring.write(buf, timestamp)
+
+    if len(sensors) > 1:
+        array = SensorArray(sensors)
+        sampler = DataReadySampler(array, on_sample, None, array.record_size)
+    else:
+        sampler = DataReadySampler(mpu, on_sample)
+
+    metrics = Metrics(config.GC_BUDGET)
+    sampler.read_time = metrics.stages["read"]
+    sampler.start(int_pin, config.SAMPLE_RATE_HZ)
+
+    # hardware offsets do not depend on the range, only software ones are looked up again
+    control = SensorControl(mpu, sampler, int_pin, sampler.rate_hz,
+                            None if config.CALIBRATION_HW_OFFSETS else config.CALIBRATION_FILE,
+                            calibration_temp, config.CALIBRATION_MAX_TEMP_DELTA, sensors)
+
+    if compensator:
+        control.listeners.append(
+            lambda _: compensator.rescale(mpu, control.calibration_temp))
+
+    if logger:
+        control.listeners.append(logger.reconfigure)
+
+    control.listeners.append(streamer.reconfigure)
+    attach_control(control)
+
+    metrics.buses = buses
+    metrics.sampler = sampler
+    metrics.logger = logger
+    metrics.streamer = streamer
+    metrics.control = control
+    attach_metrics(metrics)
+    boottime.mark("sampler")
+
+    return wlan
+
+
+def main():
+    from server import asyncio
 
-    start_new_thread(socket_accept, ([mpu]))
-    loop()
+    wlan = setup()
+    asyncio.run(run(wlan))
 
 
 if __name__ == "__main__":
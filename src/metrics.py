@@ -0,0 +1,312 @@
+"""
+Low-overhead runtime telemetry, served on /metrics in the Prometheus text format.
+
+Hot paths time themselves with ticks_us and Histogram.observe, which
+only increments a bucket of a preallocated array, so nothing is allocated
+per sample. Everything else (sample counts, per-client send stats, BLE
+and log counters, the heap) is read from the counters those objects keep
+anyway, only when /metrics is rendered.
+
+Stages timed by the main loop, the sampler and the stream tasks:
+
+    read      burst read of one sample (sampler)
+    latency   data-ready IRQ of the newest sample until the loop picks it up
+    fusion    AttitudeEstimator.process per batch
+    log       FlashLogger.process per batch
+    ble       BLEStreamer.process per batch
+    publish   Broadcaster.publish (serialization) per batch
+    loop      the whole batch
+    send      first queued frame until the client's socket drained
+
+The loop also records how far every sample-to-sample interval was off the
+sampler's period (interval_jitter), from the timestamps in the ring, so
+it covers the samples of a batch it did not look at one by one.
+
+MicroPython has no hook for garbage collections, so the loop collects
+itself (poll) once more than gc_budget bytes were allocated since the
+last collection, between batches rather than inside one, and those
+pauses are timed. Automatic collections that still happen are not seen.
+"""
+
+import gc
+from array import array
+
+try:
+    from time import ticks_us, ticks_ms, ticks_diff
+except ImportError:
+    from time import perf_counter_ns
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_ms():
+        return perf_counter_ns() // 1000000
+
+    def ticks_diff(a, b):
+        return a - b
+
+# upper bucket bounds in microseconds, the last bucket is +Inf
+BUCKETS_US = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+# finer at the low end, a healthy sampler is off by tens of microseconds
+JITTER_BUCKETS_US = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+STAGES = ("read", "latency", "fusion", "log", "ble", "publish", "loop", "send")
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in microseconds."""
+
+    def __init__(self, buckets=BUCKETS_US):
+        self.buckets = buckets
+        self.counts = array("I", [0] * (len(buckets) + 1))
+        self.count = 0
+        # the sum is split so both parts stay small ints, which never allocate
+        self.sum_s = 0
+        self.sum_us = 0
+
+    def observe(self, us: int) -> None:
+        buckets = self.buckets
+        n = len(buckets)
+        i = 0
+
+        while i < n and us > buckets[i]:
+            i += 1
+
+        self.counts[i] += 1
+        self.count += 1
+        total = self.sum_us + us
+
+        if total >= 1000000:
+            self.sum_s += total // 1000000
+            total %= 1000000
+
+        self.sum_us = total
+
+    def lap(self, start: int) -> int:
+        """Observes the time since start, returns now for the next lap."""
+        now = ticks_us()
+        self.observe(ticks_diff(now, start))
+        return now
+
+
+class Metrics:
+    def __init__(self, gc_budget: int = 16384):
+        """
+        Args:
+            gc_budget (int, optional): Bytes allocated after which poll() collects. Defaults to 16384.
+        """
+        self.stages = {name: Histogram() for name in STAGES}
+        # |interval - period| of consecutive samples
+        self.interval_jitter = Histogram(JITTER_BUCKETS_US)
+        self.gc_budget = gc_budget
+        self.gc_count = 0
+        self.gc_pause = Histogram()
+        self.mem_free = 0
+        self.mem_free_min = None
+        self.sample_rate_hz = 0.0
+
+        # set by the application, every one of them is optional
+        self.buses = None
+        self.sampler = None
+        self.broadcaster = None
+        self.logger = None
+        self.streamer = None
+        self.control = None
+
+        self._rate_ms = ticks_ms()
+        self._rate_samples = 0
+        # heap in use after the last collection, mem_alloc() grows from there
+        self._allocated = 0
+        self._update_heap()
+
+    def collect(self) -> None:
+        """Runs a timed garbage collection and updates the heap figures."""
+        start = ticks_us()
+        gc.collect()
+        self.gc_pause.lap(start)
+        self.gc_count += 1
+        self._update_heap()
+
+    def poll(self) -> None:
+        """Called from the loop between batches, collects when the budget is used up and updates the sample rate once a second."""
+        if self.mem_free_min is not None and gc.mem_alloc() > self._allocated + self.gc_budget:
+            self.collect()
+
+        now = ticks_ms()
+        elapsed = ticks_diff(now, self._rate_ms)
+
+        if elapsed < 1000 or self.sampler is None:
+            return
+
+        samples = self.sampler.samples
+        self.sample_rate_hz = (samples - self._rate_samples) * 1000 / elapsed
+        self._rate_samples = samples
+        self._rate_ms = now
+        self._update_heap()
+
+    def _update_heap(self) -> None:
+        if not hasattr(gc, "mem_free"):
+            return
+
+        self.mem_free = gc.mem_free()
+        self._allocated = gc.mem_alloc()
+
+        if self.mem_free_min is None or self.mem_free < self.mem_free_min:
+            self.mem_free_min = self.mem_free
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+
+        _header(lines, "mpu_stage_seconds", "histogram",
+                "Time spent per stage of the sample path.")
+        for name, histogram in self.stages.items():
+            _histogram(lines, "mpu_stage_seconds", 'stage="{}"'.format(name), histogram)
+
+        _header(lines, "mpu_gc_pause_seconds", "histogram",
+                "Garbage collections run between batches.")
+        _histogram(lines, "mpu_gc_pause_seconds", "", self.gc_pause)
+        _value(lines, "mpu_gc_collections_total", "counter",
+               "Garbage collections run between batches.", self.gc_count)
+
+        if self.mem_free_min is not None:
+            _value(lines, "mpu_heap_free_bytes", "gauge", "Free heap.", self.mem_free)
+            _value(lines, "mpu_heap_free_min_bytes", "gauge",
+                   "Lowest free heap seen.", self.mem_free_min)
+
+        sampler = self.sampler
+        if sampler:
+            _value(lines, "mpu_samples_total", "counter",
+                   "Samples read from the sensor.", sampler.samples)
+            _value(lines, "mpu_samples_missed_total", "counter",
+                   "Data-ready interrupts whose sample was overwritten before the read.",
+                   sampler.missed)
+            _value(lines, "mpu_sample_rate_hz", "gauge",
+                   "Samples read per second over the last second.", self.sample_rate_hz)
+            _header(lines, "mpu_sample_interval_jitter_seconds", "histogram",
+                    "Deviation of the sample-to-sample intervals from the sampler's period.")
+            _histogram(lines, "mpu_sample_interval_jitter_seconds", "", self.interval_jitter)
+            _value(lines, "mpu_i2c_errors_total", "counter",
+                   "Sample reads that failed on the bus.", sampler.errors)
+
+        if self.buses:
+            _labelled(lines, "mpu_i2c_bus_resets_total", "counter",
+                      "Bus clears and restarts after an error.",
+                      [("bus", i, bus.recoveries) for i, bus in enumerate(self.buses)])
+            _labelled(lines, "mpu_i2c_reads_per_second", "gauge",
+                      "Burst reads per second the bus managed when it was set up.",
+                      [("bus", i, bus.reads_per_s) for i, bus in enumerate(self.buses)])
+
+        if self.control:
+            _value(lines, "mpu_sensor_reconfigurations_total", "counter",
+                   "Sensor settings applied at runtime.", self.control.changes)
+
+        self._render_clients(lines)
+
+        streamer = self.streamer
+        if streamer:
+            _value(lines, "mpu_ble_notifications_total", "counter",
+                   "BLE notifications sent.", streamer.notifications)
+            _value(lines, "mpu_ble_bytes_total", "counter",
+                   "BLE notification payload bytes sent.", streamer.bytes_sent)
+            _value(lines, "mpu_ble_samples_dropped_total", "counter",
+                   "Samples skipped by the BLE stream.", streamer.dropped)
+            _value(lines, "mpu_ble_congested_total", "counter",
+                   "BLE notifications refused by the stack.", streamer.uart.congested)
+
+        logger = self.logger
+        if logger:
+            _value(lines, "mpu_log_chunks_total", "counter",
+                   "Chunks written to the flash log.", logger.chunks_written)
+            _value(lines, "mpu_log_samples_total", "counter",
+                   "Samples written to the flash log.", logger.samples)
+            _value(lines, "mpu_log_write_max_seconds", "gauge",
+                   "Slowest chunk write.", logger.max_write_us / 1000000)
+
+        lines.append("")
+        return "\n".join(lines)
+
+    def _render_clients(self, lines) -> None:
+        broadcaster = self.broadcaster
+        if not broadcaster:
+            return
+
+        clients = broadcaster.clients
+        _value(lines, "mpu_stream_clients", "gauge", "Connected stream clients.", len(clients))
+
+        if not clients:
+            return
+
+        series = (
+            ("mpu_stream_bytes_total", "counter", "Bytes sent to the client.", "bytes_sent"),
+            ("mpu_stream_frames_total", "counter", "Frames sent to the client.", "frames_sent"),
+            ("mpu_stream_frames_dropped_total", "counter",
+             "Frames dropped by the overflow policy.", "frames_dropped"),
+            ("mpu_stream_last_send_seconds", "gauge",
+             "Last batch from queueing until drained.", "last_send_us"),
+        )
+
+        labels = [_client_labels(c) for c in clients]
+
+        for name, kind, help, attribute in series:
+            _header(lines, name, kind, help)
+
+            for client, label in zip(clients, labels):
+                value = getattr(client, attribute)
+                if attribute == "last_send_us":
+                    value /= 1000000
+                lines.append("{}{{{}}} {}".format(name, label, value))
+
+        _header(lines, "mpu_stream_queued", "gauge", "Frames waiting in the client's queue.")
+        for client, label in zip(clients, labels):
+            lines.append("mpu_stream_queued{{{}}} {}".format(label, client.queued()))
+
+
+def _client_labels(client) -> str:
+    peer = client.peername()
+
+    if isinstance(peer, tuple) and len(peer) >= 2:
+        peer = "{}:{}".format(peer[0], peer[1])
+
+    return 'client="{}",format="{}",channel="{}"'.format(
+        _escape(peer), client.format, client.channel)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _header(lines, name: str, kind: str, help: str) -> None:
+    lines.append("# HELP {} {}".format(name, help))
+    lines.append("# TYPE {} {}".format(name, kind))
+
+
+def _value(lines, name: str, kind: str, help: str, value) -> None:
+    _header(lines, name, kind, help)
+    lines.append("{} {}".format(name, value))
+
+
+def _labelled(lines, name: str, kind: str, help: str, values) -> None:
+    """One series per (label, label value, value) of values."""
+    _header(lines, name, kind, help)
+
+    for label, key, value in values:
+        lines.append('{}{{{}="{}"}} {}'.format(name, label, key, value))
+
+
+def _histogram(lines, name: str, labels: str, histogram: Histogram) -> None:
+    prefix = labels + "," if labels else ""
+    total = 0
+
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        total += count
+        lines.append('{}_bucket{{{}le="{}"}} {}'.format(
+            name, prefix, bound / 1000000, total))
+
+    lines.append('{}_bucket{{{}le="+Inf"}} {}'.format(name, prefix, histogram.count))
+    suffix = "{" + labels + "}" if labels else ""
+    lines.append("{}_sum{} {}".format(
+        name, suffix, histogram.sum_s + histogram.sum_us / 1000000))
+    lines.append("{}_count{} {}".format(name, suffix, histogram.count))
@@ -14,36 +14,69 @@ const confirmBtn = document.getElementById("confirm-btn");
 const settingsBtn = document.getElementById("settings-btn");
 
 // const gateway = `${window.location.host}/stream`;
-const gateway = `ws://${window.location.host}:80/stream`;
+const gateway = `ws://${window.location.host}/stream`;
 let webSocket;
 
 function initWebSocket() {
-  webSocket = new WebSocket(gateway);
+  webSocket = new WebSocket(gateway, ["mpu6050.bin", "mpu6050.json"]);
+  webSocket.binaryType = "arraybuffer";
   webSocket.onopen = onOpen;
   webSocket.onclose = onClose;
   webSocket.onmessage = onMessage;
-
-  alert(window.location.host);
 }
 
 function onOpen() {
   console.log("Connection open");
-  webSocket.send("GET /stream HTTP/1.1");
 }
 
 function onClose() {
   console.log("Connection closed");
+  setTimeout(initWebSocket, 2000);
+}
+
+function parseJsonSample(text) {
+  const sample = JSON.parse(text);
+
+  if (sample.q) {
+    return { quaternion: sample.q, euler: sample.euler };
+  }
+
+  return {
+    acceleration: {
+      x: sample.accel[0],
+      y: sample.accel[1],
+      z: sample.accel[2],
+    },
+    gyro: {
+      x: sample.gyro[0],
+      y: sample.gyro[1],
+      z: sample.gyro[2],
+    },
+    temperature: sample.temp,
+  };
 }
 
 function onMessage(event) {
-  const data = JSON.parse(event.data);
+  const data =
+    typeof event.data === "string"
+      ? parseJsonSample(event.data)
+      : decodeWireMessage(event.data);
 
-  // for (const [key, value] of Object.entries(data)) {
-  //   mpuData[key].textContent = parseFloat(value).toFixed(2);
-  // }
+  if (data === null) {
+    return;
+  }
+
+  if (data.quaternion) {
+    attitude = data;
+    return;
+  }
 
   mpuData = data;
 
+  if (!ax) {
+    return;
+  }
+
   ax.textContent = parseFloat(data.acceleration.x).toFixed(2);
   ay.textContent = parseFloat(data.acceleration.y).toFixed(2);
   az.textContent = parseFloat(data.acceleration.z).toFixed(2);
@@ -11,3 +11,9 @@ let mpuData = {
   },
   temperature: 0,
 };
+
+// fused orientation, filled in by clients subscribed to ?ch=attitude
+let attitude = {
+  quaternion: [1, 0, 0, 0],
+  euler: [0, 0, 0],
+};
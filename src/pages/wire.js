@@ -0,0 +1,129 @@
+// Decoder for the binary stream format, see wire.py for the layout.
+const WIRE_VERSION = 1;
+const MSG_SCHEMA = 1;
+const MSG_SAMPLE = 2;
+const MSG_ATTITUDE = 3;
+const MSG_PACKED = 4;
+const MSG_SENSOR = 6;
+
+// channel bits of PACKED messages, in payload order
+const CH_ACCEL = 1;
+const CH_TEMP = 2;
+const CH_GYRO = 4;
+
+let wireSchema = null;
+// sensor id -> schema, for SENSOR messages
+const wireSchemas = {};
+
+// Returns a sample in the mpuData shape, an {timestamp, quaternion} object
+// for attitude messages, or null for schema messages. Channels missing from
+// PACKED messages are left out of the sample, SENSOR messages add sensor.
+function decodeWireMessage(buffer) {
+  const view = new DataView(buffer);
+
+  if (view.getUint8(0) !== WIRE_VERSION) {
+    throw new Error(`unknown wire version ${view.getUint8(0)}`);
+  }
+
+  const type = view.getUint8(1);
+
+  if (type === MSG_SCHEMA) {
+    const schema = {
+      accelScale: view.getFloat32(4),
+      gyroScale: view.getFloat32(8),
+      accelOffset: [view.getFloat32(12), view.getFloat32(16), view.getFloat32(20)],
+      gyroOffset: [view.getFloat32(24), view.getFloat32(28), view.getFloat32(32)],
+    };
+    const sensor = view.getUint16(2);
+
+    wireSchemas[sensor] = schema;
+    if (sensor === 0) {
+      wireSchema = schema;
+    }
+    return null;
+  }
+
+  if (type === MSG_SENSOR) {
+    return decodeSensor(view);
+  }
+
+  if (type === MSG_ATTITUDE) {
+    return {
+      timestamp: view.getUint32(2),
+      quaternion: [
+        view.getFloat32(6),
+        view.getFloat32(10),
+        view.getFloat32(14),
+        view.getFloat32(18),
+      ],
+    };
+  }
+
+  if (type === MSG_PACKED && wireSchema !== null) {
+    return decodePacked(view);
+  }
+
+  if (type !== MSG_SAMPLE || wireSchema === null) {
+    return null;
+  }
+
+  const accel = (i) =>
+    view.getInt16(6 + i * 2) / wireSchema.accelScale - wireSchema.accelOffset[i];
+  const gyro = (i) =>
+    view.getInt16(14 + i * 2) / wireSchema.gyroScale - wireSchema.gyroOffset[i];
+
+  return {
+    timestamp: view.getUint32(2),
+    acceleration: { x: accel(0), y: accel(1), z: accel(2) },
+    gyro: { x: gyro(0), y: gyro(1), z: gyro(2) },
+    temperature: view.getInt16(12) / 340 + 36.53,
+  };
+}
+
+function decodeSensor(view) {
+  const sensor = view.getUint8(2);
+  const schema = wireSchemas[sensor];
+
+  if (schema === undefined) {
+    return null;
+  }
+
+  const accel = (i) =>
+    view.getInt16(7 + i * 2) / schema.accelScale - schema.accelOffset[i];
+  const gyro = (i) =>
+    view.getInt16(15 + i * 2) / schema.gyroScale - schema.gyroOffset[i];
+
+  return {
+    sensor,
+    timestamp: view.getUint32(3),
+    acceleration: { x: accel(0), y: accel(1), z: accel(2) },
+    gyro: { x: gyro(0), y: gyro(1), z: gyro(2) },
+    temperature: view.getInt16(13) / 340 + 36.53,
+  };
+}
+
+function decodePacked(view) {
+  const mask = view.getUint8(2);
+  const sample = { timestamp: view.getUint32(3) };
+  let offset = 7;
+
+  if (mask & CH_ACCEL) {
+    const accel = (i) =>
+      view.getInt16(offset + i * 2) / wireSchema.accelScale - wireSchema.accelOffset[i];
+    sample.acceleration = { x: accel(0), y: accel(1), z: accel(2) };
+    offset += 6;
+  }
+
+  if (mask & CH_TEMP) {
+    sample.temperature = view.getInt16(offset) / 340 + 36.53;
+    offset += 2;
+  }
+
+  if (mask & CH_GYRO) {
+    const gyro = (i) =>
+      view.getInt16(offset + i * 2) / wireSchema.gyroScale - wireSchema.gyroOffset[i];
+    sample.gyro = { x: gyro(0), y: gyro(1), z: gyro(2) };
+  }
+
+  return sample;
+}
@@ -0,0 +1,101 @@
+"""
+Fixed-capacity ring buffer of raw, timestamped MPU6050 samples.
+
+One producer (the sampler) writes records without allocating. Every
+consumer (stream clients, BLE, logger, ...) reads through its own
+RingCursor, so a slow consumer only loses its own data: once it falls more
+than `capacity` records behind, its cursor skips ahead to the oldest
+record still stored and the skipped records are added to its drop count.
+
+With several sensors (see sensorarray.py) a record holds one raw block per
+sensor, the first sensor's first. Reads copy as much of a record as the
+buffer takes, so a consumer with a one-block buffer sees the first sensor.
+"""
+
+from array import array
+from MPU6050 import RAW_DATA_SIZE
+
+
+class RingCursor:
+    """Read position of one consumer."""
+
+    def __init__(self, seq: int):
+        self.seq = seq
+        self.dropped = 0
+
+
+class SampleRing:
+    def __init__(self, capacity: int = 256, record_size: int = RAW_DATA_SIZE):
+        """
+        Args:
+            capacity (int, optional): Number of records kept. Defaults to 256.
+            record_size (int, optional): Bytes per record. Defaults to one raw MPU6050 block (14).
+        """
+        self.capacity = capacity
+        self.record_size = record_size
+        self.data = bytearray(capacity * record_size)
+        # slices of a memoryview are copied with memcpy, and its length
+        # check keeps a wrong sized buf from resizing data
+        self._mv = memoryview(self.data)
+        self.timestamps = array("I", bytes(4 * capacity))
+
+        # total number of records ever written, the next write goes to head % capacity
+        self.head = 0
+
+    def write(self, buf, timestamp_us: int) -> None:
+        """Stores one record (buf holds exactly record_size bytes), overwriting the oldest one when full."""
+        index = self.head % self.capacity
+        offset = index * self.record_size
+        self._mv[offset:offset + self.record_size] = buf
+
+        self.timestamps[index] = timestamp_us
+        self.head += 1
+
+    def reader(self) -> RingCursor:
+        """Creates a cursor that starts at the next record written."""
+        return RingCursor(self.head)
+
+    def available(self, cursor: RingCursor) -> int:
+        """Number of records cursor can still read."""
+        return min(self.head - cursor.seq, self.capacity)
+
+    def read_into(self, cursor: RingCursor, buf):
+        """
+        Copies the next record, or its first len(buf) bytes, for cursor into buf and advances it.
+
+        Returns:
+            int: The record timestamp, or None if cursor is up to date.
+        """
+        lag = self.head - cursor.seq
+
+        if lag <= 0:
+            return None
+
+        if lag > self.capacity:
+            cursor.dropped += lag - self.capacity
+            cursor.seq = self.head - self.capacity
+
+        index = cursor.seq % self.capacity
+        offset = index * self.record_size
+        n = min(self.record_size, len(buf))
+        buf[:n] = self._mv[offset:offset + n]
+
+        cursor.seq += 1
+        return self.timestamps[index]
+
+    def latest_into(self, buf):
+        """
+        Copies the newest record, or its first len(buf) bytes, into buf without touching any cursor.
+
+        Returns:
+            int: The record timestamp, or None if nothing was written yet.
+        """
+        if self.head == 0:
+            return None
+
+        index = (self.head - 1) % self.capacity
+        offset = index * self.record_size
+        n = min(self.record_size, len(buf))
+        buf[:n] = self._mv[offset:offset + n]
+
+        return self.timestamps[index]
@@ -0,0 +1,203 @@
+"""
+HTTP/1.1 request parsing and table-driven routing.
+
+read_request() parses one request head with readline(), so requests that
+arrive split over several packets are fine, and rejects malformed or
+oversized heads instead of raising. Router maps (method, path) to a
+handler with a single dict lookup, unknown GET paths go to a fallback
+(the static files) before answering 404.
+
+Connections are kept alive between requests unless the client asks
+otherwise, a handler that takes the connection over (the stream) sets
+request.detached.
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+MAX_HEADERS = 32
+MAX_LINE = 1024
+
+STATUS = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+
+class BadRequest(Exception):
+    def __init__(self, status: int = 400):
+        super().__init__(status)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, path, query, version, headers, reader=None):
+        self.reader = reader
+        self.method = method
+        self.path = path
+        self.query = query
+        self.version = version
+        self.headers = headers
+        self.detached = False
+
+        connection = headers.get("connection", "").lower()
+
+        if version == "HTTP/1.1":
+            self.keep_alive = connection != "close"
+        else:
+            self.keep_alive = connection == "keep-alive"
+
+
+def parse_path(path):
+    """Splits "/path?a=1&b=2" into ("/path", {"a": "1", "b": "2"})."""
+    query = {}
+
+    if "?" not in path:
+        return path, query
+
+    path, query_string = path.split("?", 1)
+
+    for pair in query_string.split("&"):
+        if pair:
+            name, _, value = pair.partition("=")
+            query[name] = value
+
+    return path, query
+
+
+async def read_line(reader):
+    line = await reader.readline()
+
+    if len(line) > MAX_LINE:
+        raise BadRequest(431)
+
+    return line
+
+
+async def read_request(reader, timeout_s=None):
+    """
+    Reads one request head.
+
+    Args:
+        reader (StreamReader): Client connection.
+        timeout_s (float, optional): How long to wait for the whole head, for idle keep-alive connections and clients that stall in the headers. Defaults to None.
+
+    Returns:
+        Request: The parsed request, or None if the client closed the connection.
+
+    Raises:
+        BadRequest: On a malformed or oversized request head.
+        asyncio.TimeoutError: The head was not complete within timeout_s.
+    """
+    if timeout_s:
+        return await asyncio.wait_for(_read_head(reader), timeout_s)
+
+    return await _read_head(reader)
+
+
+async def _read_head(reader):
+    line = await read_line(reader)
+
+    if not line:
+        return None
+
+    try:
+        method, target, version = line.decode("utf-8").strip().split(" ")
+    except ValueError:
+        raise BadRequest()
+
+    if not version.startswith("HTTP/"):
+        raise BadRequest()
+
+    headers = {}
+
+    while True:
+        line = await read_line(reader)
+
+        if not line:
+            return None
+        if line == b"\r\n" or line == b"\n":
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise BadRequest(431)
+
+        try:
+            name, value = line.decode("utf-8").split(":", 1)
+        except ValueError:
+            raise BadRequest()
+
+        headers[name.strip().lower()] = value.strip()
+
+    path, query = parse_path(target)
+    return Request(method, path, query, version, headers, reader)
+
+
+def response_head(status: int, content_type: str = None, length: int = 0,
+                  keep_alive: bool = False, extra: str = "") -> bytes:
+    """Builds a status line and headers ending with the blank line."""
+    head = "HTTP/1.1 {} {}\r\n".format(status, STATUS.get(status, ""))
+
+    if content_type:
+        head += "Content-Type: {}\r\n".format(content_type)
+
+    head += "Content-Length: {}\r\nConnection: {}\r\n{}\r\n".format(
+        length, "keep-alive" if keep_alive else "close", extra)
+
+    return head.encode("utf-8")
+
+
+async def send_response(writer, status: int, body=b"", content_type: str = None,
+                        keep_alive: bool = False) -> None:
+    """Sends a complete response with Content-Length."""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+
+    writer.write(response_head(status, content_type, len(body), keep_alive))
+
+    if body:
+        writer.write(body)
+
+    await writer.drain()
+
+
+class Router:
+    def __init__(self, fallback=None):
+        """
+        Args:
+            fallback (coroutine, optional): fallback(request, writer) -> bool, tried for unknown GET paths. Defaults to None.
+        """
+        self.routes = {}
+        self.paths = set()
+        self.fallback = fallback
+
+    def add(self, method: str, path: str, handler) -> None:
+        """Registers handler(request, writer) for method and path."""
+        self.routes[(method, path)] = handler
+        self.paths.add(path)
+
+    def route(self, method: str, path: str):
+        """Decorator form of add()."""
+        def register(handler):
+            self.add(method, path, handler)
+            return handler
+
+        return register
+
+    async def dispatch(self, request: Request, writer) -> None:
+        handler = self.routes.get((request.method, request.path))
+
+        if handler:
+            await handler(request, writer)
+        elif request.path in self.paths:
+            await send_response(writer, 405, keep_alive=request.keep_alive)
+        elif not (request.method == "GET" and self.fallback
+                  and await self.fallback(request, writer)):
+            await send_response(writer, 404, "Not Found", "text/plain",
+                                request.keep_alive)
@@ -0,0 +1,254 @@
+"""
+Data-ready driven acquisition for the MPU6050.
+
+The sensor raises INT whenever a new sample lands in its data registers. The
+pin IRQ only records a ticks_us timestamp and schedules the read, the burst
+read and the consumer callback run later from micropython.schedule, outside
+of the interrupt context.
+
+Time and scheduling go through a clock object so the same sampler runs on
+the board (MicroPythonClock) or on CPython against SimulatedClock.
+"""
+
+from MPU6050 import RAW_DATA_SIZE
+
+try:
+    import micropython
+    from time import ticks_us, ticks_diff
+except ImportError:
+    micropython = None
+
+
+class MicroPythonClock:
+    """Clock backed by time.ticks_us, micropython.schedule and machine.Timer."""
+
+    def __init__(self, timer_id: int = 0):
+        self._timer_id = timer_id
+        self._timer = None
+
+    def ticks_us(self) -> int:
+        return ticks_us()
+
+    def ticks_diff(self, a: int, b: int) -> int:
+        return ticks_diff(a, b)
+
+    def schedule(self, func, arg) -> None:
+        micropython.schedule(func, arg)
+
+    def every(self, period_us: int, callback) -> None:
+        """Calls callback(timer) from a periodic hardware timer."""
+        from machine import Timer
+
+        self.cancel()
+        self._timer = Timer(self._timer_id)
+        # period= takes whole milliseconds, freq= keeps the timer's sub-microsecond resolution
+        self._timer.init(freq=1000000 / period_us,
+                         mode=Timer.PERIODIC, callback=callback)
+
+    def cancel(self) -> None:
+        if self._timer:
+            self._timer.deinit()
+            self._timer = None
+
+
+class SimulatedClock:
+    """
+    Deterministic clock for running the sampler on CPython.
+
+    Periodic callbacks registered with every() fire as advance() moves time
+    forward, scheduled functions run right after the callback that queued
+    them, like micropython.schedule does between bytecodes. ticks_us wraps
+    at TICKS_PERIOD like on the ESP32, now_us does not.
+    """
+
+    TICKS_PERIOD = 1 << 30
+
+    def __init__(self, start_us: int = 0, queue_size: int = 8):
+        """
+        Args:
+            start_us (int, optional): Initial time, start close to TICKS_PERIOD to test the wrap. Defaults to 0.
+            queue_size (int, optional): Functions schedule() takes before raising RuntimeError. Defaults to 8.
+        """
+        self.now_us = start_us
+        self.queue_size = queue_size
+        self._queue = []
+        self._timers = []
+
+    def ticks_us(self) -> int:
+        return self.now_us % self.TICKS_PERIOD
+
+    def ticks_diff(self, a: int, b: int) -> int:
+        half = self.TICKS_PERIOD // 2
+        return (a - b + half) % self.TICKS_PERIOD - half
+
+    def schedule(self, func, arg) -> None:
+        if len(self._queue) >= self.queue_size:
+            raise RuntimeError("schedule queue full")
+        self._queue.append((func, arg))
+
+    def every(self, period_us: int, callback) -> None:
+        self._timers.append([self.now_us + period_us, period_us, callback])
+
+    def cancel(self) -> None:
+        self._timers = []
+
+    def run_pending(self) -> None:
+        while self._queue:
+            func, arg = self._queue.pop(0)
+            func(arg)
+
+    def advance(self, us: int) -> None:
+        """Moves time forward by us, firing timers and scheduled functions on the way."""
+        end = self.now_us + us
+
+        while self._timers:
+            timer = min(self._timers, key=lambda t: t[0])
+            if timer[0] > end:
+                break
+            self.now_us = timer[0]
+            timer[0] += timer[1]
+            timer[2](self)
+            self.run_pending()
+
+        self.now_us = end
+        self.run_pending()
+
+
+class DataReadySampler:
+    """
+    Reads the MPU6050 once per data-ready interrupt.
+
+    on_sample(buf, timestamp_us) receives the raw 14-byte block (see
+    MPU6050.read_raw_into) and the ticks_us timestamp taken in the IRQ. buf is
+    reused for every sample, copy it if it has to outlive the callback.
+
+    A read that fails with OSError is kept in fault and stops the reads
+    until start() is called again, see SensorControl.recover.
+
+    Rates below the chip's slowest one (SMPLRT_DIV tops out at 255) are
+    paced by the clock's timer even with an INT pin, the reads then pick up
+    the newest of the chip's faster samples. rate_hz is the rate samples
+    actually arrive at.
+    """
+
+    def __init__(self, mpu, on_sample, clock=None, record_size: int = RAW_DATA_SIZE):
+        """
+        Args:
+            mpu (MPU6050): Sensor to read, or a SensorArray reading several.
+            on_sample (callable): Called with (buf, timestamp_us) after every read.
+            clock (optional): MicroPythonClock or SimulatedClock. Defaults to MicroPythonClock().
+            record_size (int, optional): Bytes per read, SensorArray.record_size for an array. Defaults to RAW_DATA_SIZE.
+        """
+        self.mpu = mpu
+        self.on_sample = on_sample
+        self.clock = clock if clock else MicroPythonClock()
+
+        self.samples = 0
+        self.missed = 0
+        # metrics.Histogram of the burst read time, None to skip timing
+        self.read_time = None
+        # OSError of a failed read, reads are skipped until start() runs again
+        self.fault = None
+        self.errors = 0
+        self.rate_hz = 0.0
+
+        self._timer_paced = False
+        self._period_us = 0
+        # cleared by stop(), a read scheduled before it is dropped
+        self._running = False
+        self._buf = bytearray(record_size)
+        self._irq_ts = 0
+        self._pending = False
+        self._pin = None
+
+        # bound methods allocate, so create them once outside of the IRQ
+        self._irq_ref = self._irq
+        self._service_ref = self._service
+
+    def start(self, pin=None, rate_hz: int = 100) -> None:
+        """
+        Starts sampling.
+
+        Args:
+            pin (machine.Pin, optional): Pin wired to the MPU6050 INT output. Without it a periodic timer from the clock triggers the reads. Defaults to None.
+            rate_hz (float, optional): Sensor sample rate. Defaults to 100.
+        """
+        self.configure(rate_hz)
+        self.fault = None
+        self._running = True
+
+        if pin is None or self._timer_paced:
+            self._pin = None
+            self.clock.every(self._period_us, self._irq_ref)
+            return
+
+        self._pin = pin
+        self.mpu.enable_data_ready_interrupt()
+        pin.irq(trigger=pin.IRQ_RISING, handler=self._irq_ref, hard=True)
+
+    def configure(self, rate_hz: float) -> float:
+        """
+        Writes the divider closest to rate_hz, without starting the reads.
+
+        Returns:
+            float: The rate samples will arrive at, also in self.rate_hz.
+        """
+        mpu = self.mpu
+        mpu.write_sample_rate(rate_hz)
+        chip_hz = mpu.read_sample_rate()
+        self._timer_paced = chip_hz > rate_hz and mpu.read_sample_rate_divider() == 255
+        # the chip's rates are whole microseconds apart, a timer pacing a
+        # slower rate runs at the nearest whole microsecond period
+        self._period_us = round(1000000 / (rate_hz if self._timer_paced else chip_hz))
+        self.rate_hz = 1000000 / self._period_us if self._timer_paced else chip_hz
+        return self.rate_hz
+
+    def stop(self) -> None:
+        self._running = False
+
+        if self._pin is None:
+            self.clock.cancel()
+            return
+
+        self._pin.irq(handler=None)
+        self.mpu.disable_data_ready_interrupt()
+        self._pin = None
+
+    def _irq(self, _):
+        self._irq_ts = self.clock.ticks_us()
+
+        if self._pending:
+            # the scheduled read has not run yet, it will pick up this sample
+            self.missed += 1
+            return
+
+        self._pending = True
+
+        try:
+            self.clock.schedule(self._service_ref, 0)
+        except RuntimeError:
+            self._pending = False
+            self.missed += 1
+
+    def _service(self, _):
+        timestamp = self._irq_ts
+        self._pending = False
+
+        if self.fault or not self._running:
+            return
+
+        start = self.clock.ticks_us()
+
+        try:
+            self.mpu.read_raw_into(self._buf)
+        except OSError as e:
+            # raising here would end up in whatever the main loop runs, it recovers the bus instead
+            self.errors += 1
+            self.fault = e
+            return
+
+        if self.read_time:
+            self.read_time.observe(self.clock.ticks_diff(self.clock.ticks_us(), start))
+
+        self.samples += 1
+        self.on_sample(self._buf, timestamp)
@@ -0,0 +1,74 @@
+"""
+Several MPU6050s sampled as one.
+
+Up to two sensors share a bus (AD0 low is 0x68, high 0x69), more need a
+second bus. All of them run at the same sample rate. The first sensor
+paces the reads: its data-ready interrupt, or the sampler's timer without
+one, triggers a single scheduled read that burst-reads every sensor back
+to back into one record (see ringbuffer.py), sensor 0 first. The whole
+record carries the trigger's ticks_us timestamp, so the samples of one
+record line up on a common timebase. Each sensor's clock runs on its own,
+so a record holds the newest sample of every sensor, taken at most one
+sample period before the trigger.
+
+Reading N sensors costs N bus transfers per trigger but one interrupt,
+one scheduled call and one pass of the loop, so the number of samples per
+second grows with the sensors instead of the loop running N times as often.
+"""
+
+from MPU6050 import RAW_DATA_SIZE
+
+
+def sensor_file(path: str, index: int) -> str:
+    """File of a sensor's own data, path itself for sensor 0: calibration.json -> calibration.1.json."""
+    if not index:
+        return path
+
+    dot = path.rfind(".")
+
+    if dot <= path.rfind("/"):
+        return "{}.{}".format(path, index)
+
+    return "{}.{}{}".format(path[:dot], index, path[dot:])
+
+
+class SensorArray:
+    """The part of the MPU6050 interface DataReadySampler uses, over several sensors."""
+
+    def __init__(self, sensors):
+        """
+        Args:
+            sensors (list): MPU6050 instances, the first one's INT pin paces the reads.
+        """
+        self.sensors = sensors
+        self.record_size = RAW_DATA_SIZE * len(sensors)
+        self._buf = None
+        self._reads = None
+
+    def write_sample_rate(self, rate_hz: float) -> None:
+        for mpu in self.sensors:
+            mpu.write_sample_rate(rate_hz)
+
+    def read_sample_rate(self) -> float:
+        return self.sensors[0].read_sample_rate()
+
+    def read_sample_rate_divider(self) -> int:
+        return self.sensors[0].read_sample_rate_divider()
+
+    def enable_data_ready_interrupt(self, active_low: bool = False, latch: bool = False) -> None:
+        self.sensors[0].enable_data_ready_interrupt(active_low, latch)
+
+    def disable_data_ready_interrupt(self) -> None:
+        self.sensors[0].disable_data_ready_interrupt()
+
+    def read_raw_into(self, buf) -> None:
+        """Burst-reads every sensor into its block of buf (record_size bytes)."""
+        if buf is not self._buf:
+            # slices of buf made once, a memoryview slice allocates
+            mv = memoryview(buf)
+            self._reads = [(mpu, mv[i * RAW_DATA_SIZE:(i + 1) * RAW_DATA_SIZE])
+                           for i, mpu in enumerate(self.sensors)]
+            self._buf = buf
+
+        for mpu, block in self._reads:
+            mpu.read_raw_into(block)
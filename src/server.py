@@ -1,16 +1,55 @@
-from _thread import start_new_thread
+"""
+HTTP, WebSocket stream and Wi-Fi setup.
+
+Built-in modules and the request path (config, router) are imported here
+once; modules only some clients need (broadcast, websocket, wire, static
+files, the log) are imported on first use, so boot only loads what it
+runs.
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import config
+import gc
+import json
+from router import BadRequest, Router, read_request, response_head, send_response
 
 socket_server = None
-clients = []
+broadcaster = None
+logger = None
+control = None
+metrics = None
+# pulsed by notify_stream() after new samples were written to the clients
+new_sample = asyncio.Event()
 
 
-def connect_sta():
+def connect_sta(wait=True):
     import network
-    import config
+    from time import sleep
 
     sta_if = network.WLAN(network.STA_IF)
     sta_if.active(True)
 
+    if config.WIFI_SCAN:
+        print_scan(sta_if)
+
+    print("Connecting to " + config.WIFI_SSID)
+    sta_if.connect(config.WIFI_SSID, config.WIFI_PASSWD)
+
+    while wait and not sta_if.isconnected():
+        print("Waiting for connection...", end="\r")
+        sleep(0.25)
+
+    if wait:
+        print_connected(sta_if)
+
+    return sta_if
+
+
+def print_scan(sta_if):
     print("WIFI scan results:")
 
     authmodes = ['Open', 'WEP', 'WPA-PSK' 'WPA2-PSK4', 'WPA/WPA2-PSK']
@@ -28,21 +67,9 @@ def connect_sta():
         except:
             pass
 
-    print("Connecting to " + config.WIFI_SSID)
-    sta_if.connect(config.WIFI_SSID, config.WIFI_PASSWD)
 
-    while not sta_if.isconnected():
-        print("Waiting for connection...", end="\r")
-        sleep(0.25)
-
-    print("Connected!")
-    print(sta_if.ifconfig())
-    print("======================\n")
-
-
-def connect_ap():
+def connect_ap(wait=True):
     import network
-    import config
     from time import sleep
 
     print("\nConnecting to " + config.WIFI_SSID_AP)
@@ -52,137 +79,496 @@ def connect_ap():
     ap_if.config(essid=config.WIFI_SSID_AP,
                  authmode=network.AUTH_WPA2_PSK, password=config.WIFI_PASSWD_AP)
 
-    while not ap_if.active():
+    while wait and not ap_if.active():
         print("Waiting for connection...", end="\r")
         sleep(0.25)
 
+    if wait:
+        print_connected(ap_if)
+
+    return ap_if
+
+
+def print_connected(wlan):
     print("Connected!")
-    print(ap_if.ifconfig())
+    print(wlan.ifconfig())
     print("======================\n")
 
 
-def create_server(ap_if=True):
-    """Initializes esp32 server.
+def connect(ap_if=True, wait=True):
+    """Brings up Wi-Fi.
 
     Args:
         ap_if (bool, optional): Whether to connect to access point (True) or station (False). Defaults to True.
+        wait (bool, optional): Whether to block until the interface is up, else see wait_connected. Defaults to True.
+
+    Returns:
+        WLAN: The interface.
     """
 
-    import socket
-    import config
+    if ap_if:
+        return connect_ap(wait)
+
+    return connect_sta(wait)
+
+
+async def wait_connected(wlan, ap_if=True):
+    """Waits, without blocking the loop, for an interface started with connect(wait=False)."""
+    import boottime
+
+    # an access point is up once active, a station once it has joined
+    up = wlan.active if ap_if else wlan.isconnected
+
+    while not up():
+        await asyncio.sleep(0.1)
 
+    print_connected(wlan)
+    boottime.mark("wifi up")
+
+
+async def create_server(mpu, host=None, port=None):
+    """Starts the HTTP/stream server on the running event loop.
+
+    Args:
+        mpu (MPU6050): Sensor used for the one-shot endpoints and to decode stream samples.
+        host (str, optional): Address to bind. Defaults to config.HOST_IP.
+        port (int, optional): Port to bind. Defaults to config.HOST_PORT.
+    """
     global socket_server
 
-    if ap_if:
-        connect_ap()
-    else:
-        connect_sta()
-
-    socket_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    socket_server.bind((config.HOST_IP, config.HOST_PORT))
-    socket_server.listen(5)
-
-
-def send_html(client, html_file):
-    with open(html_file, "r") as page:
-        client[0].send("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n")
-        html = page.read(1024)
-
-        while html:
-            client[0].send(html)
-            html = page.read(1024)
-
-        client[0].send("\r\n")
-
-
-def http_server(client, mpu):
-    import json
-    import gc
-
-    gc.collect()
-    print("Free memory:", gc.mem_free())
-
-    request = client[0].recv(1024).decode("utf-8")
-    request_lines = request.split('\r\n')
-    method, path, protocol = request_lines[0].split(' ')
-
-    print(f"method = {method} path = {path} protocol = {protocol}")
-
-    file_path = "/pages" + path
-    file_type = path.split('.')[-1]
-    res = None
-
-    print("Sending", file_path)
-
-    if method == "GET":
-        if path == "/":
-            gc.collect()
-            send_html(client, "pages/index.html")
-        elif path == "/aviator":
-            gc.collect()
-            send_html(client, "pages/aviator.html")
-        elif file_type == "css":
-            gc.collect()
-
-            with open(file_path, "r") as file:
-                css = file.read()
-                res = f"HTTP/1.1 200 OK\r\nContent-Type: text/css\r\n{css}"
-        elif file_type == "js":
-            client[0].send(
-                "HTTP/1.1 200 OK\r\nContent-Type: text/javascript\r\n\r\n")
-
-            with open(file_path, "r") as file:
-                js = file.read(1024)
-
-                while js:
-                    try:
-                        gc.collect()
-                        client[0].send(js.encode("utf-8"))
-                    except:
-                        break
-
-                    js = file.read(1024)
-        elif path == "/stream":
-            # send continuous stream of data
-            if not client in clients:
-                clients.append(client)
-        elif path == "/gyro":
-            res = json.dumps(mpu.read_gyro_data())
-        elif path == "/accel":
-            res = json.dumps(mpu.read_accel_data())
-        elif path == "/temp":
-            res = json.dumps(mpu.read_temperature())
+    if host is None:
+        host = config.HOST_IP
+    if port is None:
+        port = config.HOST_PORT
+
+    router = create_router(mpu)
+
+    async def handler(reader, writer):
+        await http_server(reader, writer, router)
+
+    socket_server = await asyncio.start_server(handler, host, port)
+    return socket_server
+
+
+def create_router(mpu):
+    """Builds the route table of the server."""
+    from static import StaticFiles
+
+    static_files = StaticFiles("pages")
+
+    async def serve_static(request, writer):
+        return await static_files.serve(writer, request.path, request.headers,
+                                        request.keep_alive)
+
+    router = Router(fallback=serve_static)
+
+    def page(file_path):
+        async def handler(request, writer):
+            await static_files.serve(writer, file_path, request.headers,
+                                     request.keep_alive)
+        return handler
+
+    def reading(read):
+        async def handler(request, writer):
+            await send_response(writer, 200, json.dumps(read()),
+                                "application/json", request.keep_alive)
+        return handler
+
+    async def attitude(request, writer):
+        estimator = broadcaster.estimator
+
+        if not estimator:
+            await send_response(writer, 404, "Fusion disabled", "text/plain",
+                                request.keep_alive)
+            return
+
+        await send_response(writer, 200, json.dumps({
+            "q": estimator.filter.quaternion(),
+            "euler": estimator.filter.euler(),
+            "filter": estimator.filter.name,
+        }), "application/json", request.keep_alive)
+
+    async def log_list(request, writer):
+        if not logger:
+            await send_response(writer, 404, "Logging disabled", "text/plain",
+                                request.keep_alive)
+            return
+
+        await send_response(writer, 200, json.dumps({
+            "block_size": logger.block_size,
+            "segments": logger.list(),
+        }), "application/json", request.keep_alive)
+
+    async def log_download(request, writer):
+        if not logger:
+            await send_response(writer, 404, "Logging disabled", "text/plain",
+                                request.keep_alive)
+            return
+
+        await download_segments(writer, request.query.get("seg"),
+                                request.keep_alive)
+
+    async def history(request, writer):
+        if not logger:
+            await send_response(writer, 404, "Logging disabled", "text/plain",
+                                request.keep_alive)
+            return
+
+        # the response has no length, it ends with the connection
+        request.keep_alive = False
+        await send_history(writer, request.query)
+
+    async def sensor_config(request, writer):
+        if not control:
+            await send_response(writer, 404, "Reconfiguration disabled", "text/plain",
+                                request.keep_alive)
+            return
+
+        await send_response(writer, 200, json.dumps(control.settings()),
+                            "application/json", request.keep_alive)
+
+    async def metrics_handler(request, writer):
+        if not metrics:
+            await send_response(writer, 404, "Metrics disabled", "text/plain",
+                                request.keep_alive)
+            return
+
+        from metrics import CONTENT_TYPE
+
+        await send_response(writer, 200, metrics.render(), CONTENT_TYPE,
+                            request.keep_alive)
+
+    async def stream_handler(request, writer):
+        # send continuous stream of data, the connection stays open
+        request.detached = True
+        await stream(request.reader, writer, mpu, request.headers, request.query)
+
+    router.add("GET", "/", page("/index.html"))
+    router.add("GET", "/aviator", page("/aviator.html"))
+    router.add("GET", "/stream", stream_handler)
+    router.add("GET", "/gyro", reading(mpu.read_gyro_data))
+    router.add("GET", "/accel", reading(mpu.read_accel_data))
+    router.add("GET", "/temp", reading(mpu.read_temperature))
+    router.add("GET", "/attitude", attitude)
+    router.add("GET", "/config", sensor_config)
+    router.add("GET", "/metrics", metrics_handler)
+    router.add("GET", "/log", log_list)
+    router.add("GET", "/log/download", log_download)
+    router.add("GET", "/history", history)
+
+    return router
+
+
+async def download_segments(writer, seq=None, keep_alive=False):
+    """Sends one log segment (?seg=<seq>), or all of them oldest first, as raw segment images.
+
+    The current segment is sent up to its last complete chunk. See logger.py
+    for the layout and tools/read_log.py for turning a download into CSV.
+    """
+    segments = logger.list()
+
+    if seq is not None:
+        segments = [s for s in segments if str(s["seq"]) == seq]
+
+        if not segments:
+            await send_response(writer, 404, "No such segment", "text/plain",
+                                keep_alive)
+            return
+
+    length = sum(s["size"] for s in segments)
+    writer.write(response_head(200, "application/octet-stream", length, keep_alive,
+                               'Content-Disposition: attachment; filename="mpu6050.log"\r\n'))
+
+    buf = bytearray(1024)
+    mv = memoryview(buf)
+
+    for segment in segments:
+        remaining = segment["size"]
+
+        with open("{}/{}".format(logger.root, segment["name"]), "rb") as file:
+            while remaining > 0:
+                n = file.readinto(buf)
+                if not n:
+                    break
+
+                n = min(n, remaining)
+                writer.write(mv[:n])
+                remaining -= n
+                await writer.drain()
+
+        # keep the promised Content-Length if the file shrank meanwhile
+        while remaining > 0:
+            n = min(remaining, len(buf))
+            mv[:n] = bytes(n)
+            writer.write(mv[:n])
+            remaining -= n
+
+    await writer.drain()
+
+
+async def send_history(writer, query):
+    """Streams the logged samples of a time range as binary wire messages.
+
+    ?from= and ?to= take epoch seconds, negative seconds relative to now or
+    HH:MM[:SS] of today (see logger.parse_time) and default to the whole
+    log. ?rate= decimates like /stream, each segment from the rate it was
+    logged at. Every segment starts with its SCHEMA message, the samples
+    keep the timestamps of the live stream.
+    """
+    import time
+    import wire
+    from decimate import Decimator, factor_for, parse_rate
+    from logger import parse_time
+    from MPU6050 import RAW_DATA_SIZE
+
+    now_ms = int(time.time()) * 1000
+
+    try:
+        from_ms = parse_time(query["from"], now_ms) if "from" in query else 0
+        # open end, samples may be stamped slightly after now
+        to_ms = parse_time(query["to"], now_ms) if "to" in query else 1 << 48
+        rate_hz = parse_rate(query.get("rate", ""))
+    except ValueError as e:
+        await send_response(writer, 400, str(e), "text/plain")
+        return
+
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\nConnection: close\r\n\r\n")
+
+    raw = bytearray(RAW_DATA_SIZE)
+    packet = bytearray(wire.SAMPLE_SIZE)
+    decimator = None
+    sent = 0
+
+    for timestamp, schema, segment_rate_hz in logger.history(from_ms, to_ms, raw):
+        if schema:
+            writer.write(schema)
+            # averaging windows do not span segments, and the rate may differ between them
+            factor = factor_for(segment_rate_hz, rate_hz)
+            decimator = Decimator(factor) if factor > 1 else None
+
+        if decimator:
+            if not decimator.add(raw, timestamp):
+                continue
+            wire.encode_sample(decimator.out, decimator.timestamp, packet)
         else:
-            res = "HTTP/1.1 404 NOT FOUND"
+            wire.encode_sample(raw, timestamp, packet)
+
+        writer.write(packet)
+        sent += 1
+
+        if sent % 64 == 0:
+            await writer.drain()
+
+    await writer.drain()
+
+
+async def http_server(reader, writer, router):
+    """Serves requests on one connection until it is closed or taken over."""
+    if metrics:
+        metrics.collect()
+    else:
+        gc.collect()
+
+    try:
+        while True:
+            try:
+                request = await read_request(reader, config.HTTP_KEEPALIVE_S)
+            except BadRequest as e:
+                print("Error with request", e.status)
+                await send_response(writer, e.status)
+                break
+            except asyncio.TimeoutError:
+                break
+
+            if request is None:
+                break
+
+            print(f"method = {request.method} path = {request.path} protocol = {request.version}")
+
+            await router.dispatch(request, writer)
+
+            if request.detached:
+                return
+            if not request.keep_alive:
+                break
+    except OSError as e:
+        # OsError ValueError MemoryError
+        print("Error with request", e)
+
+    await close(writer)
+    print("END HTTP")
+
+
+async def close(writer):
+    try:
+        writer.close()
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+
+def attach_ring(ring, mpu, sample_rate_hz=100, delta_frame_ms=100, sensors=None):
+    """Sets the sample ring that stream clients are fed from.
+
+    Args:
+        ring (SampleRing): Ring the sampler writes to.
+        mpu (MPU6050): Used to decode samples for JSON clients.
+        sample_rate_hz (float, optional): Rate the ring is filled at, the base of ?rate= decimation. Defaults to 100.
+        delta_frame_ms (int, optional): Time span of one ?format=delta frame. Defaults to 100.
+        sensors (list, optional): Every sensor of a ring record, mpu first, for ?sensors=. Defaults to [mpu].
+    """
+    from broadcast import Broadcaster
 
-        if file_type != "js" and path != "/stream" and res != None:
-            client[0].sendall(res.encode("utf-8"))
+    global broadcaster
 
-        if path != "/stream":
-            client[0].close()
+    broadcaster = Broadcaster(ring, mpu, sample_rate_hz, delta_frame_ms, sensors)
 
-        print("END HTTP")
 
+def attach_logger(flash_logger):
+    """Serves the segments of a FlashLogger on /log and /log/download."""
+    global logger
 
-def socket_accept(mpu):
+    logger = flash_logger
+
+
+def attach_estimator(estimator):
+    """Publishes the orientation of an AttitudeEstimator on the attitude channel."""
+    broadcaster.estimator = estimator
+
+
+def attach_metrics(runtime_metrics):
+    """Serves a Metrics registry on /metrics and times the stream sends into it."""
+    global metrics
+
+    metrics = runtime_metrics
+    metrics.broadcaster = broadcaster
+
+
+def attach_control(sensor_control):
+    """Applies the settings dashboards send over the stream, and serves them on /config."""
+    global control
+
+    control = sensor_control
+    control.listeners.append(reconfigure_stream)
+
+
+def reconfigure_stream(sample_rate_hz):
+    """Sends the new schema to stream clients and follows the new rate, see SensorControl."""
+    broadcaster.reconfigure(sample_rate_hz)
+    new_sample.set()
+    new_sample.clear()
+
+
+def notify_stream():
+    """Sends the new ring samples to every stream client and wakes their tasks."""
+    if broadcaster.publish():
+        new_sample.set()
+        new_sample.clear()
+
+
+async def receive_settings(ws, client):
+    """Reads the messages a dashboard sends back over its WebSocket."""
     while True:
+        message = await ws.recv()
+
+        if message is None:
+            return
+
         try:
-            client = socket_server.accept()
-            print("Client connected: {}\n".format(client[1]))
-            http_server(client, mpu)
-        except OSError as e:
-            # OsError ValueError MemoryError
-            print("Error with request", e)
-            continue
+            settings = json.loads(message)
+            client.settings.update(settings)
 
+            if control:
+                # applied by the main loop between two batches
+                control.request(settings)
+        except (ValueError, TypeError, AttributeError) as e:
+            print("Ignoring stream message:", message, e)
 
-def send_stream(data):
-    import json
 
-    for client in clients:
-        try:
-            client[0].send(json.dumps(data).encode("utf-8"))
-        except OSError:
-            print("Client disconnected: {}\n".format(client[1]))
-            client[0].close()
-            clients.remove(client)
+async def stream(reader, writer, mpu, headers, query):
+    """Subscribes a client to the sample broadcast until it disconnects.
+
+    Clients that ask for a WebSocket upgrade get one frame per message,
+    anything else gets the messages written straight to the socket. The
+    format is JSON, the binary wire format or its delta compressed variant
+    (see wire.negotiate), binary streams start with a schema message.
+
+    ?rate= asks for a lower, decimated rate and ?ch= for a subset of the
+    accel, gyro and temp channels. ?ch=attitude subscribes to the fused
+    orientation instead of the samples. ?sensors=all or ?sensors=0,1
+    streams several sensors, one message with the sensor id each, and a
+    schema per sensor first.
+
+    The broadcaster only fills the client's bounded queue, this task writes
+    it out. ?policy= picks the overflow policy (see broadcast), and a client
+    that stalls for more than config.STREAM_MAX_LAG_MS is disconnected.
+    """
+    import websocket
+    import wire
+    from broadcast import CHANNEL_ATTITUDE, CHANNEL_IMU, StreamClient
+    from decimate import parse_rate
+
+    ws = None
+    fmt, subprotocol = wire.negotiate(query, headers)
+
+    try:
+        channels = query.get("ch", "")
+
+        if channels == CHANNEL_ATTITUDE:
+            channel, mask = CHANNEL_ATTITUDE, wire.CH_ALL
+        else:
+            channel, mask = CHANNEL_IMU, wire.parse_channels(channels)
+
+        client = StreamClient(writer, fmt, None, config.STREAM_QUEUE_SIZE,
+                              query.get("policy", config.STREAM_OVERFLOW_POLICY),
+                              config.STREAM_MAX_LAG_MS, channel, mask,
+                              parse_rate(query.get("rate", "")),
+                              wire.parse_sensors(query.get("sensors", ""),
+                                                 len(broadcaster.sensors)))
+    except ValueError as e:
+        print("Error with request", e)
+        await send_response(writer, 400, str(e), "text/plain")
+        await close(writer)
+        return
+
+    if metrics:
+        client.send_time = metrics.stages["send"]
+
+    if websocket.is_upgrade(headers):
+        ws = websocket.WebSocket(reader, writer)
+        await ws.handshake(headers, subprotocol)
+        client.ws = ws
+
+    if ws:
+        asyncio.create_task(receive_settings(ws, client))
+
+    try:
+        if fmt != wire.FORMAT_JSON:
+            for sensor in broadcaster.selected(client):
+                schema = wire.encode_schema(broadcaster.sensors[sensor], None, sensor)
+
+                if ws:
+                    ws.send(schema, binary=True)
+                else:
+                    writer.write(schema)
+
+            if ws:
+                await ws.drain()
+            else:
+                await writer.drain()
+
+        broadcaster.add(client)
+
+        while not (client.closed or (ws and ws.closed)):
+            await new_sample.wait()
+            await client.flush()
+    except OSError:
+        print("Client disconnected: {}\n".format(client.peername()))
+    finally:
+        client.closed = True
+        broadcaster.remove(client)
+
+        if ws:
+            await ws.close()
+
+        await close(writer)
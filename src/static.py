@@ -0,0 +1,184 @@
+"""
+Static file serving for the pages directory.
+
+Serves the build-time gzip variant (file.gz, see tools/gzip_pages.py)
+whenever the client accepts it. Responses carry Content-Length, an ETag,
+Cache-Control and support If-None-Match -> 304 and single byte Range
+requests. Files are streamed through one reusable readinto buffer.
+
+ETags come from the manifest tools/gzip_pages.py writes (CRC32 and size of
+every file, pages/etags.json), read once at startup. Files it does not
+list, or that changed size since, get one built from size and mtime. No
+file is ever hashed on the board, that would block every task for the
+length of the read.
+"""
+
+import json
+import os
+
+CONTENT_TYPES = {
+    "html": "text/html",
+    "js": "text/javascript",
+    "css": "text/css",
+    "json": "application/json",
+    "png": "image/png",
+    "ico": "image/x-icon",
+}
+
+# html is revalidated on every load, everything else is cached for a while
+CACHE_HTML = "no-cache"
+CACHE_ASSET = "max-age=3600"
+
+# written by tools/gzip_pages.py, name -> [size, etag]
+ETAGS = "etags.json"
+
+
+def file_size(path):
+    """Size of path in bytes, or None if it does not exist."""
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return None
+
+
+def parse_range(value, size):
+    """
+    Parses a single "bytes=start-end" Range header.
+
+    Returns:
+        tuple: (start, end) inclusive, None to ignore the header or
+        False when the range cannot be satisfied.
+    """
+    if not value.startswith("bytes=") or "," in value:
+        return None
+
+    start, _, end = value[6:].strip().partition("-")
+
+    try:
+        if not start:
+            # suffix range, the last `end` bytes
+            length = int(end)
+            if length <= 0:
+                return False
+            return max(0, size - length), size - 1
+
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        return False
+
+    return start, min(end, size - 1)
+
+
+class StaticFiles:
+    def __init__(self, root: str = "pages", chunk_size: int = 1024):
+        self.root = root
+        self._buf = bytearray(chunk_size)
+        self._mv = memoryview(self._buf)
+        self._etags = self._load_etags()
+
+    def _load_etags(self):
+        try:
+            with open(self.root + "/" + ETAGS) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _etag(self, path, size):
+        listed = self._etags.get(path[len(self.root) + 1:])
+
+        if listed and listed[0] == size:
+            return listed[1]
+
+        # not in the manifest or edited since, fall back to what stat knows
+        return '"{:x}-{:x}"'.format(int(os.stat(path)[8]), size)
+
+    async def serve(self, writer, path: str, headers: dict, keep_alive: bool = False) -> bool:
+        """
+        Sends pages/<path>.
+
+        Args:
+            writer (StreamWriter): Client connection.
+            path (str): Request path, e.g. "/index.js".
+            headers (dict): Request headers with lowercase names.
+            keep_alive (bool, optional): Whether the connection stays open afterwards. Defaults to False.
+
+        Returns:
+            bool: False if there is no such file, nothing was sent then.
+        """
+        if ".." in path:
+            return False
+
+        file_path = self.root + path
+        file_type = path.split(".")[-1]
+        size = file_size(file_path)
+
+        if size is None:
+            return False
+
+        encoding = None
+
+        if "gzip" in headers.get("accept-encoding", ""):
+            gz_size = file_size(file_path + ".gz")
+
+            if gz_size is not None:
+                file_path += ".gz"
+                size = gz_size
+                encoding = "gzip"
+
+        etag = self._etag(file_path, size)
+        connection = "Connection: {}\r\n".format(
+            "keep-alive" if keep_alive else "close")
+        common = "Content-Type: {}\r\nCache-Control: {}\r\nETag: {}\r\nAccept-Ranges: bytes\r\nVary: Accept-Encoding\r\n{}".format(
+            CONTENT_TYPES.get(file_type, "application/octet-stream"),
+            CACHE_HTML if file_type == "html" else CACHE_ASSET,
+            etag, connection)
+
+        if encoding:
+            common += "Content-Encoding: gzip\r\n"
+
+        if headers.get("if-none-match") == etag:
+            writer.write("HTTP/1.1 304 Not Modified\r\n{}Content-Length: 0\r\n\r\n".format(
+                common).encode("utf-8"))
+            await writer.drain()
+            return True
+
+        start, end = 0, size - 1
+        status = "200 OK"
+        byte_range = parse_range(headers.get("range", ""), size)
+
+        if byte_range is False:
+            writer.write("HTTP/1.1 416 Range Not Satisfiable\r\nContent-Range: bytes */{}\r\nContent-Length: 0\r\n{}\r\n".format(
+                size, connection).encode("utf-8"))
+            await writer.drain()
+            return True
+        elif byte_range:
+            start, end = byte_range
+            status = "206 Partial Content"
+            common += "Content-Range: bytes {}-{}/{}\r\n".format(
+                start, end, size)
+
+        writer.write("HTTP/1.1 {}\r\n{}Content-Length: {}\r\n\r\n".format(
+            status, common, end - start + 1).encode("utf-8"))
+
+        remaining = end - start + 1
+
+        with open(file_path, "rb") as file:
+            if start:
+                file.seek(start)
+
+            while remaining > 0:
+                n = file.readinto(self._buf)
+                if not n:
+                    break
+
+                n = min(n, remaining)
+                # write() copies, so the buffer is free again once it returns
+                writer.write(self._mv[:n])
+                remaining -= n
+                await writer.drain()
+
+        return True
@@ -0,0 +1,203 @@
+"""
+Minimal RFC 6455 WebSocket server side on top of asyncio streams.
+
+Only what the dashboard needs: the opening handshake, unmasked server
+frames (text or binary), masked client frames up to MAX_PAYLOAD bytes with
+fragment reassembly, ping/pong and the closing handshake.
+
+The connection's reader task answers pings and closes while another task
+streams to the same writer. uasyncio allows one task waiting on a stream's
+write at a time, so every drain goes through WebSocket.drain, which holds
+the connection's write lock.
+"""
+
+import struct
+from binascii import b2a_base64
+from hashlib import sha1
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_PAYLOAD = 1024
+
+OP_CONT = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_INVALID_DATA = 1007
+CLOSE_TOO_BIG = 1009
+
+
+def accept_key(key: str) -> str:
+    """Computes Sec-WebSocket-Accept for a Sec-WebSocket-Key."""
+    digest = sha1(key.strip().encode("utf-8") + GUID).digest()
+    return b2a_base64(digest).decode("utf-8").strip()
+
+
+def is_upgrade(headers: dict) -> bool:
+    """Whether the request headers ask for a WebSocket upgrade."""
+    return headers.get("upgrade", "").lower() == "websocket" and "sec-websocket-key" in headers
+
+
+def frame_header(opcode: int, length: int) -> bytes:
+    """Header of a final, unmasked frame carrying length bytes."""
+    if length < 126:
+        return struct.pack("!BB", 0x80 | opcode, length)
+    if length < 0x10000:
+        return struct.pack("!BBH", 0x80 | opcode, 126, length)
+    return struct.pack("!BBQ", 0x80 | opcode, 127, length)
+
+
+class WebSocket:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+        self.lock = asyncio.Lock()
+
+    async def handshake(self, headers: dict, protocol: str = None) -> None:
+        """Sends the 101 response for an upgrade request.
+
+        Args:
+            headers (dict): Request headers with lowercase names.
+            protocol (str, optional): Subprotocol to confirm. Defaults to None.
+        """
+        response = "HTTP/1.1 101 Switching Protocols\r\n" \
+            "Upgrade: websocket\r\n" \
+            "Connection: Upgrade\r\n" \
+            "Sec-WebSocket-Accept: {}\r\n".format(
+                accept_key(headers["sec-websocket-key"]))
+
+        if protocol:
+            response += "Sec-WebSocket-Protocol: {}\r\n".format(protocol)
+
+        self.writer.write((response + "\r\n").encode("utf-8"))
+        await self.drain()
+
+    async def drain(self) -> None:
+        """Waits for the written frames to be sent, one task at a time."""
+        async with self.lock:
+            await self.writer.drain()
+
+    def send(self, data, binary: bool = False) -> None:
+        """Queues one frame, the caller awaits drain().
+
+        Args:
+            data (str | bytes): Payload, str is sent UTF-8 encoded.
+            binary (bool, optional): Send a binary frame instead of a text frame. Defaults to False.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        self.writer.write(frame_header(
+            OP_BINARY if binary else OP_TEXT, len(data)))
+        self.writer.write(data)
+
+    def ping(self, data=b"") -> None:
+        self.writer.write(frame_header(OP_PING, len(data)))
+        self.writer.write(data)
+
+    async def close(self, code: int = CLOSE_NORMAL) -> None:
+        """Starts (or answers) the closing handshake."""
+        if self.closed:
+            return
+
+        self.closed = True
+
+        try:
+            self.writer.write(frame_header(OP_CLOSE, 2))
+            self.writer.write(struct.pack("!H", code))
+            await self.drain()
+        except OSError:
+            pass
+
+    async def _read_frame(self) -> tuple:
+        head = await self.reader.readexactly(2)
+        fin = head[0] & 0x80
+        opcode = head[0] & 0x0F
+        masked = head[1] & 0x80
+        length = head[1] & 0x7F
+
+        if length == 126:
+            length = struct.unpack("!H", await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+
+        if length > MAX_PAYLOAD:
+            await self.close(CLOSE_TOO_BIG)
+            raise ValueError("frame too big")
+
+        if not masked:
+            # clients must mask every frame
+            await self.close(CLOSE_PROTOCOL_ERROR)
+            raise ValueError("unmasked client frame")
+
+        mask = await self.reader.readexactly(4)
+        payload = bytearray(await self.reader.readexactly(length))
+
+        for i in range(length):
+            payload[i] ^= mask[i & 3]
+
+        return fin, opcode, payload
+
+    async def recv(self):
+        """Waits for the next text or binary message.
+
+        Control frames are handled here: pings are answered and a close frame
+        completes the closing handshake.
+
+        Returns:
+            str | bytes: The message, str for text frames. None once the connection is closed.
+        """
+        message = None
+        message_opcode = None
+
+        while not self.closed:
+            try:
+                fin, opcode, payload = await self._read_frame()
+            except (EOFError, OSError, ValueError):
+                self.closed = True
+                return None
+
+            if opcode == OP_PING:
+                self.writer.write(frame_header(OP_PONG, len(payload)))
+                self.writer.write(payload)
+                await self.drain()
+                continue
+            elif opcode == OP_PONG:
+                continue
+            elif opcode == OP_CLOSE:
+                await self.close()
+                return None
+            elif opcode == OP_CONT and message is not None:
+                message += payload
+            elif opcode in (OP_TEXT, OP_BINARY):
+                message = payload
+                message_opcode = opcode
+            else:
+                await self.close(CLOSE_PROTOCOL_ERROR)
+                return None
+
+            if len(message) > MAX_PAYLOAD:
+                await self.close(CLOSE_TOO_BIG)
+                return None
+
+            if fin:
+                if message_opcode != OP_TEXT:
+                    return bytes(message)
+
+                try:
+                    return bytes(message).decode("utf-8")
+                except UnicodeError:
+                    await self.close(CLOSE_INVALID_DATA)
+                    return None
+
+        return None
@@ -0,0 +1,378 @@
+"""
+Compact binary wire format for streamed samples.
+
+Every message starts with a version byte and a type byte, the type (and
+for PACKED and DELTA the rest of the header) fixes the message length, so
+messages can be sent back to back on a raw socket
+as well as one per WebSocket frame. All fields are big-endian.
+
+SCHEMA (36 bytes), sent first and whenever the ranges or offsets change:
+    B version, B type, H sensor id (0 unless several sensors are streamed),
+    f accel scale (LSB/g), f gyro scale (LSB/deg/s),
+    3f accel offset (g), 3f gyro offset (deg/s)
+
+SAMPLE (20 bytes):
+    B version, B type, I timestamp (ticks_us, wraps like the board's ticks),
+    7h raw accel x/y/z, temp, gyro x/y/z exactly as read from the MPU6050
+
+ATTITUDE (22 bytes), fused orientation (see fusion.py):
+    B version, B type, I timestamp, 4f quaternion w, x, y, z
+
+PACKED (7 + 2 * channels bytes), a subset of a sample:
+    B version, B type, B channel mask, I timestamp,
+    h values of the selected channels, in SAMPLE order
+    mask bits: CH_ACCEL (x, y, z), CH_TEMP, CH_GYRO (x, y, z)
+
+SENSOR (21 bytes), a SAMPLE of one of several sensors (see sensorarray.py),
+decoded with the SCHEMA of the same sensor id:
+    B version, B type, B sensor id, I timestamp, 7h raw block
+
+DELTA (5 + length bytes), several samples compressed (see codec.py):
+    B version, B type, B sample count, H body length,
+    body: I timestamp, 7h raw block, then per further sample a varint
+    timestamp delta and 7 zigzag varint raw deltas
+
+Decoding a sample: accel = raw / accel_scale - accel_offset,
+gyro = raw / gyro_scale - gyro_offset, temp = raw / 340 + 36.53.
+"""
+
+import codec
+import struct
+
+VERSION = 1
+
+MSG_SCHEMA = 1
+MSG_SAMPLE = 2
+MSG_ATTITUDE = 3
+MSG_PACKED = 4
+MSG_DELTA = 5
+MSG_SENSOR = 6
+
+CH_ACCEL = 0x01
+CH_TEMP = 0x02
+CH_GYRO = 0x04
+CH_ALL = CH_ACCEL | CH_TEMP | CH_GYRO
+
+CHANNEL_NAMES = {
+    "accel": CH_ACCEL,
+    "temp": CH_TEMP,
+    "gyro": CH_GYRO,
+}
+
+# (mask bit, first int16 index in the raw block, number of values)
+CHANNEL_LAYOUT = (
+    (CH_ACCEL, 0, 3),
+    (CH_TEMP, 3, 1),
+    (CH_GYRO, 4, 3),
+)
+
+SCHEMA_FORMAT = ">BBHff3f3f"
+SCHEMA_SIZE = 36
+SAMPLE_HEADER_FORMAT = ">BBI"
+SAMPLE_HEADER_SIZE = 6
+SAMPLE_SIZE = 20
+ATTITUDE_FORMAT = ">BBIffff"
+ATTITUDE_SIZE = 22
+
+PACKED_HEADER_FORMAT = ">BBBI"
+PACKED_HEADER_SIZE = 7
+DELTA_HEADER_FORMAT = ">BBBH"
+DELTA_HEADER_SIZE = 5
+SENSOR_HEADER_FORMAT = ">BBBI"
+SENSOR_HEADER_SIZE = 7
+SENSOR_SIZE = 21
+
+MESSAGE_SIZES = {
+    MSG_SCHEMA: SCHEMA_SIZE,
+    MSG_SAMPLE: SAMPLE_SIZE,
+    MSG_ATTITUDE: ATTITUDE_SIZE,
+    MSG_SENSOR: SENSOR_SIZE,
+}
+
+
+def parse_channels(value: str) -> int:
+    """Converts "accel,gyro" into a channel mask, empty means all channels."""
+    mask = 0
+
+    for name in value.split(","):
+        if name:
+            if name not in CHANNEL_NAMES:
+                raise ValueError("unknown channel {}".format(name))
+            mask |= CHANNEL_NAMES[name]
+
+    return mask or CH_ALL
+
+
+def packed_size(mask: int) -> int:
+    size = PACKED_HEADER_SIZE
+
+    for bit, _, count in CHANNEL_LAYOUT:
+        if mask & bit:
+            size += 2 * count
+
+    return size
+
+
+def message_size(data, offset: int):
+    """Length of the message starting at offset, None if the header is incomplete."""
+    kind = data[offset + 1]
+
+    if kind == MSG_PACKED:
+        if len(data) - offset < 3:
+            return None
+        return packed_size(data[offset + 2])
+
+    if kind == MSG_DELTA:
+        if len(data) - offset < DELTA_HEADER_SIZE:
+            return None
+        return DELTA_HEADER_SIZE + ((data[offset + 3] << 8) | data[offset + 4])
+
+    return MESSAGE_SIZES.get(kind)
+
+
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+FORMAT_DELTA = "delta"
+
+# WebSocket subprotocols, in order of preference
+SUBPROTOCOLS = {
+    "mpu6050.delta": FORMAT_DELTA,
+    "mpu6050.bin": FORMAT_BINARY,
+    "mpu6050.json": FORMAT_JSON,
+}
+
+
+def negotiate(query: dict, headers: dict) -> tuple:
+    """
+    Picks the stream format from ?format= or Sec-WebSocket-Protocol.
+
+    Returns:
+        tuple: (format, subprotocol to confirm or None). JSON is the default.
+    """
+    offered = headers.get("sec-websocket-protocol")
+
+    if offered:
+        for protocol in offered.split(","):
+            protocol = protocol.strip()
+            if protocol in SUBPROTOCOLS:
+                return SUBPROTOCOLS[protocol], protocol
+
+    if query.get("format") in (FORMAT_BINARY, FORMAT_DELTA):
+        return query["format"], None
+
+    return FORMAT_JSON, None
+
+
+def parse_sensors(value: str, count: int) -> int:
+    """Converts "all" or "0,1" into a mask of sensor ids below count, empty means none."""
+    if value == "all":
+        return (1 << count) - 1
+
+    mask = 0
+
+    for index in value.split(","):
+        if index:
+            if not index.isdigit() or int(index) >= count:
+                raise ValueError("unknown sensor {}".format(index))
+            mask |= 1 << int(index)
+
+    return mask
+
+
+def encode_schema(mpu, buf=None, sensor: int = 0):
+    """Packs the scale factors and offsets of mpu into a SCHEMA message."""
+    if buf is None:
+        buf = bytearray(SCHEMA_SIZE)
+
+    struct.pack_into(SCHEMA_FORMAT, buf, 0, VERSION, MSG_SCHEMA, sensor,
+                     mpu.accel_scale, mpu.gyro_scale,
+                     mpu.accel_offset[0], mpu.accel_offset[1], mpu.accel_offset[2],
+                     mpu.gyro_offset[0], mpu.gyro_offset[1], mpu.gyro_offset[2])
+    return buf
+
+
+def encode_sample(raw, timestamp_us: int, buf) -> None:
+    """Packs a raw 14-byte MPU6050 block into buf (SAMPLE_SIZE bytes) without allocating."""
+    struct.pack_into(SAMPLE_HEADER_FORMAT, buf, 0,
+                     VERSION, MSG_SAMPLE, timestamp_us & 0xFFFFFFFF)
+
+    for i in range(14):
+        buf[SAMPLE_HEADER_SIZE + i] = raw[i]
+
+
+def encode_sensor(raw, offset: int, sensor: int, timestamp_us: int, buf) -> None:
+    """Packs the raw block at offset of a record into buf (SENSOR_SIZE bytes) without allocating."""
+    struct.pack_into(SENSOR_HEADER_FORMAT, buf, 0,
+                     VERSION, MSG_SENSOR, sensor, timestamp_us & 0xFFFFFFFF)
+
+    for i in range(14):
+        buf[SENSOR_HEADER_SIZE + i] = raw[offset + i]
+
+
+def encode_attitude(q, timestamp_us: int, buf) -> None:
+    """Packs a quaternion (w, x, y, z) into buf (ATTITUDE_SIZE bytes)."""
+    struct.pack_into(ATTITUDE_FORMAT, buf, 0, VERSION, MSG_ATTITUDE,
+                     timestamp_us & 0xFFFFFFFF, q[0], q[1], q[2], q[3])
+
+
+def encode_packed(raw, timestamp_us: int, mask: int, buf) -> int:
+    """Packs the channels in mask of a raw block into buf, returns the message length."""
+    struct.pack_into(PACKED_HEADER_FORMAT, buf, 0, VERSION, MSG_PACKED,
+                     mask, timestamp_us & 0xFFFFFFFF)
+    offset = PACKED_HEADER_SIZE
+
+    for bit, first, count in CHANNEL_LAYOUT:
+        if mask & bit:
+            for i in range(2 * first, 2 * (first + count)):
+                buf[offset] = raw[i]
+                offset += 1
+
+    return offset
+
+
+def encode_delta_header(count: int, length: int, buf) -> None:
+    """Packs the header of a DELTA message with count samples and a length byte body."""
+    struct.pack_into(DELTA_HEADER_FORMAT, buf, 0,
+                     VERSION, MSG_DELTA, count, length)
+
+
+class Decoder:
+    """
+    Decodes a byte stream of wire messages, for clients.
+
+    feed() accepts arbitrary chunks and returns the decoded samples as
+    (timestamp_us, (gx, gy, gz), (ax, ay, az), temp) tuples, channels
+    missing from PACKED messages are None. SENSOR messages add the sensor
+    id as a fifth item. The latest
+    attitude message is kept in attitude as (timestamp_us, (w, x, y, z)).
+    """
+
+    def __init__(self):
+        # of sensor 0, the one SAMPLE, PACKED and DELTA messages are of
+        self.schema = None
+        # sensor id -> schema
+        self.schemas = {}
+        self.attitude = None
+        self._pending = b""
+
+    def feed(self, data) -> list:
+        data = self._pending + bytes(data)
+        samples = []
+        offset = 0
+
+        while len(data) - offset >= 2:
+            version, kind = data[offset], data[offset + 1]
+
+            if version != VERSION or (kind not in MESSAGE_SIZES and kind not in (MSG_PACKED, MSG_DELTA)):
+                raise ValueError(
+                    "unknown message {}/{}".format(version, kind))
+
+            size = message_size(data, offset)
+
+            if size is None or len(data) - offset < size:
+                break
+
+            if kind == MSG_SCHEMA:
+                values = struct.unpack_from(SCHEMA_FORMAT, data, offset)
+                schema = (values[3], values[4], values[5:8], values[8:11])
+                self.schemas[values[2]] = schema
+
+                if values[2] == 0:
+                    self.schema = schema
+            elif kind == MSG_SENSOR:
+                samples.append(self.decode_sensor(data, offset))
+            elif kind == MSG_PACKED:
+                samples.append(self.decode_packed(data, offset))
+            elif kind == MSG_DELTA:
+                samples += self.decode_delta(data, offset)
+            elif kind == MSG_ATTITUDE:
+                values = struct.unpack_from(ATTITUDE_FORMAT, data, offset)
+                self.attitude = (values[2], values[3:7])
+            else:
+                samples.append(self.decode_sample(data, offset))
+
+            offset += size
+
+        self._pending = data[offset:]
+        return samples
+
+    def decode_sample(self, data, offset: int = 0) -> tuple:
+        if self.schema is None:
+            raise ValueError("sample before schema")
+
+        accel_scale, gyro_scale, ao, go = self.schema
+        timestamp = struct.unpack_from(">I", data, offset + 2)[0]
+        ax, ay, az, t, gx, gy, gz = struct.unpack_from(
+            ">hhhhhhh", data, offset + SAMPLE_HEADER_SIZE)
+
+        return (
+            timestamp,
+            (gx / gyro_scale - go[0], gy / gyro_scale - go[1], gz / gyro_scale - go[2]),
+            (ax / accel_scale - ao[0], ay / accel_scale - ao[1], az / accel_scale - ao[2]),
+            t / 340.0 + 36.53,
+        )
+
+    def decode_sensor(self, data, offset: int = 0) -> tuple:
+        sensor = data[offset + 2]
+        schema = self.schemas.get(sensor)
+
+        if schema is None:
+            raise ValueError("sample of sensor {} before its schema".format(sensor))
+
+        accel_scale, gyro_scale, ao, go = schema
+        timestamp = struct.unpack_from(">I", data, offset + 3)[0]
+        ax, ay, az, t, gx, gy, gz = struct.unpack_from(
+            ">hhhhhhh", data, offset + SENSOR_HEADER_SIZE)
+
+        return (
+            timestamp,
+            (gx / gyro_scale - go[0], gy / gyro_scale - go[1], gz / gyro_scale - go[2]),
+            (ax / accel_scale - ao[0], ay / accel_scale - ao[1], az / accel_scale - ao[2]),
+            t / 340.0 + 36.53,
+            sensor,
+        )
+
+    def decode_delta(self, data, offset: int = 0) -> list:
+        if self.schema is None:
+            raise ValueError("sample before schema")
+
+        accel_scale, gyro_scale, ao, go = self.schema
+        samples = []
+
+        for timestamp, (ax, ay, az, t, gx, gy, gz) in codec.decode(
+                data, data[offset + 2], offset + DELTA_HEADER_SIZE):
+            samples.append((
+                timestamp,
+                (gx / gyro_scale - go[0], gy / gyro_scale - go[1], gz / gyro_scale - go[2]),
+                (ax / accel_scale - ao[0], ay / accel_scale - ao[1], az / accel_scale - ao[2]),
+                t / 340.0 + 36.53,
+            ))
+
+        return samples
+
+    def decode_packed(self, data, offset: int = 0) -> tuple:
+        if self.schema is None:
+            raise ValueError("sample before schema")
+
+        accel_scale, gyro_scale, ao, go = self.schema
+        _, _, mask, timestamp = struct.unpack_from(
+            PACKED_HEADER_FORMAT, data, offset)
+        offset += PACKED_HEADER_SIZE
+        gyro = accel = temp = None
+
+        if mask & CH_ACCEL:
+            ax, ay, az = struct.unpack_from(">hhh", data, offset)
+            accel = (ax / accel_scale - ao[0], ay /
+                     accel_scale - ao[1], az / accel_scale - ao[2])
+            offset += 6
+
+        if mask & CH_TEMP:
+            temp = struct.unpack_from(">h", data, offset)[0] / 340.0 + 36.53
+            offset += 2
+
+        if mask & CH_GYRO:
+            gx, gy, gz = struct.unpack_from(">hhh", data, offset)
+            gyro = (gx / gyro_scale - go[0], gy /
+                    gyro_scale - go[1], gz / gyro_scale - go[2])
+
+        return (timestamp, gyro, accel, temp)
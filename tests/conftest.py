@@ -0,0 +1,58 @@
+"""
+Runs the modules of src/ on CPython against the simulated board of
+tools/sim, with the stub machine and micropython modules on sys.path.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+
+import pytest  # noqa: E402
+import sim  # noqa: E402
+
+sim.install()
+
+from sim.i2c import SimI2C  # noqa: E402
+from sim.sensor import SimMPU6050  # noqa: E402
+
+
+class ManualClock:
+    """Seconds for SimMPU6050 that only move when a test advances them."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return ManualClock()
+
+
+@pytest.fixture
+def bus():
+    return SimI2C()
+
+
+@pytest.fixture
+def device(bus, clock):
+    """Simulated MPU6050 at 0x68, driven by clock."""
+    return bus.attach(SimMPU6050(clock=clock))
+
+
+@pytest.fixture
+def mpu(bus, device):
+    """Driver of device, awake at 100 Hz with the DLPF at 44 Hz."""
+    from MPU6050 import MPU6050
+
+    driver = MPU6050(bus)
+    driver.wake()
+    driver.write_lpf_range(44)
+    driver.write_sample_rate(100)
+    return driver
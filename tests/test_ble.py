@@ -0,0 +1,82 @@
+import time
+
+import bluetooth
+import pytest
+
+from BLE import BLEUART
+from blestream import BLEStreamer
+from ringbuffer import SampleRing
+
+
+@pytest.fixture
+def ble():
+    stub = bluetooth.BLE()
+    stub.on_notify = None
+    yield stub
+    for conn_handle in list(stub._connections):
+        stub.gap_disconnect(conn_handle)
+
+
+@pytest.fixture
+def uart(ble):
+    return BLEUART(ble, "test")
+
+
+def fill_queue(ble, conn_handle):
+    """Makes the stack refuse notifications to conn_handle for the current interval."""
+    connection = ble._connections[conn_handle]
+    connection[2] = time.monotonic()
+    connection[3] = bluetooth.NOTIFY_QUEUE
+
+
+def drain_queue(ble, conn_handle):
+    ble._connections[conn_handle][3] = 0
+
+
+def test_resend_only_goes_to_the_refusing_connection(ble, uart):
+    received = []
+    ble.on_notify = lambda conn_handle, handle, data: received.append(conn_handle)
+    ble.sim_connect(0, interval_ms=1000)
+    ble.sim_connect(1, interval_ms=1000)
+    fill_queue(ble, 1)
+
+    assert not uart.notify(b"packet")
+    assert received == [0]
+
+    # still full, the retry fails again without reaching connection 0
+    assert not uart.notify(b"packet", True)
+    assert received == [0]
+
+    drain_queue(ble, 1)
+    assert uart.notify(b"packet", True)
+    assert received == [0, 1]
+
+    assert uart.notify(b"next")
+    assert received == [0, 1, 0, 1]
+
+
+def test_retry_skips_a_connection_that_left(ble, uart):
+    ble.sim_connect(0, interval_ms=1000)
+    ble.sim_connect(1, interval_ms=1000)
+    fill_queue(ble, 1)
+    assert not uart.notify(b"packet")
+
+    ble.gap_disconnect(1)
+    assert uart.notify(b"packet", True)
+
+
+def test_commands_apply_on_the_next_process(ble, uart, mpu):
+    ring = SampleRing(16)
+    streamer = BLEStreamer(uart, ring, mpu, 100, 50)
+    ble.sim_connect(0, interval_ms=10)
+
+    assert streamer.command("stream 25")
+    assert not streamer.active
+    streamer.process()
+    assert streamer.active
+    assert streamer._decimator.factor == 4
+
+    assert streamer.command("stop")
+    assert streamer.active
+    streamer.process()
+    assert not streamer.active
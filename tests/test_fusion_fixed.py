@@ -0,0 +1,110 @@
+import pytest
+
+import fusion
+from bench_fusion import synthetic_trace, to_counts
+from fusion import AttitudeEstimator, FixedMadgwickFilter, create_filter
+from MPU6050 import RAW_DATA_SIZE
+from ringbuffer import SampleRing
+
+SMALL_INT_MIN = -(1 << 30)
+SMALL_INT_MAX = (1 << 30) - 1
+
+
+class Checked(int):
+    """int that fails once a result would not be a MicroPython small int."""
+
+
+def _checked(op):
+    def method(*args):
+        result = getattr(int, op)(*args)
+
+        if result is NotImplemented:
+            return result
+
+        assert SMALL_INT_MIN <= result <= SMALL_INT_MAX, (op, args, result)
+        return Checked(result)
+
+    return method
+
+
+for _op in ("add", "sub", "mul", "floordiv", "lshift", "rshift",
+            "radd", "rsub", "rmul", "rfloordiv", "rlshift", "rrshift",
+            "neg", "abs"):
+    setattr(Checked, "__{}__".format(_op), _checked("__{}__".format(_op)))
+
+
+class CheckedArray(list):
+    def __getitem__(self, i):
+        return Checked(super().__getitem__(i))
+
+
+def run_counts(f, samples):
+    euler = [0.0, 0.0, 0.0]
+    out = []
+    previous = None
+
+    for timestamp, gyro, accel, _ in samples:
+        f.update_counts(*gyro, *accel, 0 if previous is None else timestamp - previous)
+        previous = timestamp
+        f.euler_into(euler)
+        out.append(tuple(euler))
+
+    return out
+
+
+@pytest.mark.parametrize("name", ["complementary", "madgwick"])
+def test_fixed_point_follows_the_float_filter(name):
+    samples, _ = synthetic_trace(seconds=10)
+    fixed = create_filter(name + "_fixed")
+    counts = to_counts(samples, fixed.gyro_scale, fixed.accel_scale)
+    floating = create_filter(name)
+    euler = [0.0, 0.0, 0.0]
+    previous = None
+
+    for (timestamp, gyro, accel, _), expected in zip(counts, run_counts(fixed, counts)):
+        dt = 0.0 if previous is None else (timestamp - previous) / 1e6
+        previous = timestamp
+        floating.update(*(v / fixed.gyro_scale for v in gyro),
+                        *(v / fixed.accel_scale for v in accel), dt)
+        floating.euler_into(euler)
+
+        for axis in range(3):
+            assert expected[axis] == pytest.approx(euler[axis], abs=0.1)
+
+
+@pytest.mark.parametrize("cls", [fusion.FixedComplementaryFilter, fusion.FixedMadgwickFilter])
+@pytest.mark.parametrize("rate_hz", [100, 1000])
+def test_fixed_point_stays_in_small_int_range(cls, rate_hz):
+    samples, _ = synthetic_trace(rate_hz=rate_hz, seconds=2)
+    f = cls()
+    # every value read from the state and everything computed from it is checked
+    for attr in ("_q", "_steps", "_remainders", "_angles"):
+        if hasattr(f, attr):
+            setattr(f, attr, CheckedArray(getattr(f, attr)))
+
+    checked = [(Checked(t), tuple(map(Checked, g)), tuple(map(Checked, a)), temp)
+               for t, g, a, temp in to_counts(samples, f.gyro_scale, f.accel_scale)]
+
+    run_counts(f, checked)
+
+
+def test_estimator_feeds_counts_with_offsets(mpu, device, clock):
+    mpu.write_gyro_range(500)
+    mpu.gyro_offset = (1.5, -0.5, 0.25)
+    mpu.accel_offset = (0.01, 0.0, -0.02)
+    ring = SampleRing(64, RAW_DATA_SIZE)
+    fixed = AttitudeEstimator(ring, mpu, FixedMadgwickFilter())
+    floating = AttitudeEstimator(ring, mpu, create_filter("madgwick"))
+    buf = bytearray(RAW_DATA_SIZE)
+
+    for i in range(50):
+        clock.advance(0.01)
+        mpu.read_raw_into(buf)
+        ring.write(buf, i * 10000)
+
+    assert fixed.process() == 50
+    assert floating.process() == 50
+    assert fixed.filter.gyro_scale == mpu.gyro_scale
+
+    for a, b in zip(fixed.filter.euler(), floating.filter.euler()):
+        assert a == pytest.approx(b, abs=0.1)
@@ -0,0 +1,54 @@
+import asyncio
+import struct
+
+import server
+import wire
+from logger import FlashLogger
+from ringbuffer import SampleRing
+
+
+class Writer:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def log_samples(ring, logger, count, period_us, start_us):
+    for i in range(count):
+        ring.write(struct.pack(">7h", 0, 0, 16384, 0, i, 0, 0), start_us + i * period_us)
+        logger.process()
+
+    logger.flush()
+    return start_us + count * period_us
+
+
+def test_history_decimates_each_segment_from_its_own_rate(tmp_path, mpu):
+    ring = SampleRing(256)
+    logger = FlashLogger(ring, mpu, str(tmp_path), 4096 * 4, 3, 4096, 100)
+    end = log_samples(ring, logger, 100, 10000, 0)
+    # the rate drops at runtime, the 100 Hz segment must keep its factor
+    logger.reconfigure(50)
+    log_samples(ring, logger, 50, 20000, end)
+    logger.close()
+    server.attach_logger(logger)
+
+    writer = Writer()
+    asyncio.run(server.send_history(writer, {"rate": "10"}))
+    _, _, body = bytes(writer.data).partition(b"\r\n\r\n")
+    counts = []
+    offset = 0
+
+    while offset < len(body):
+        if body[offset + 1] == wire.MSG_SCHEMA:
+            counts.append(0)
+        else:
+            counts[-1] += 1
+
+        offset += wire.message_size(body, offset)
+
+    assert counts == [10, 10]
@@ -0,0 +1,86 @@
+from MPU6050 import FIFO_SIZE, INT_DATA_RDY, INT_FIFO_OFLOW, RAW_DATA_SIZE
+
+FIFO_EN = 0x23
+INT_ENABLE = 0x38
+USER_CTRL = 0x6A
+
+
+def test_enable_fifo_sets_up_the_chip(mpu, device):
+    mpu.enable_fifo()
+
+    assert device.regs[FIFO_EN] == 0xF8
+    assert device.regs[USER_CTRL] & 0x40
+    assert device.regs[INT_ENABLE] & INT_FIFO_OFLOW
+    assert mpu.read_fifo_count() == 0
+
+
+def test_read_fifo_returns_every_sample_oldest_first(mpu, device, clock):
+    mpu.enable_fifo()
+    clock.advance(0.105)
+
+    samples, overflow = mpu.read_fifo()
+
+    assert not overflow
+    assert len(samples) == 10
+    for gyro, accel, temp in samples:
+        # the board lies still for the first two seconds
+        assert abs(accel[2] - 1.0) < 0.05
+        assert 20.0 < temp < 40.0
+
+    assert mpu.read_fifo_count() == 0
+    clock.advance(0.05)
+    assert len(mpu.read_fifo()[0]) == 5
+
+
+def test_read_fifo_without_temperature(mpu, device, clock):
+    mpu.enable_fifo(temp=False)
+    clock.advance(0.055)
+
+    assert mpu.read_fifo_count() == 5 * (RAW_DATA_SIZE - 2)
+    samples, overflow = mpu.read_fifo()
+
+    assert not overflow
+    assert len(samples) == 5
+    assert all(temp is None for _, _, temp in samples)
+
+
+def test_overflow_resets_the_fifo(mpu, device, clock):
+    mpu.enable_fifo()
+    # 100 frames of 14 bytes do not fit in 1024
+    clock.advance(1.005)
+    assert FIFO_SIZE // RAW_DATA_SIZE < 100
+
+    samples, overflow = mpu.read_fifo()
+
+    assert overflow
+    assert samples == []
+    assert mpu.read_fifo_count() == 0
+
+    # framing starts over after the reset
+    clock.advance(0.03)
+    samples, overflow = mpu.read_fifo()
+    assert not overflow
+    assert len(samples) == 3
+    assert abs(samples[0][1][2] - 1.0) < 0.05
+
+
+def test_disable_fifo_restores_the_overflow_interrupt(mpu, device, clock):
+    mpu.enable_data_ready_interrupt()
+    mpu.enable_fifo()
+    mpu.disable_fifo()
+
+    assert device.regs[INT_ENABLE] == INT_DATA_RDY
+    assert device.regs[FIFO_EN] == 0
+    assert not device.regs[USER_CTRL] & 0x40
+
+    clock.advance(0.05)
+    assert mpu.read_fifo_count() == 0
+
+
+def test_disable_fifo_keeps_an_overflow_interrupt_enabled_before(mpu, device):
+    device.regs[INT_ENABLE] = INT_FIFO_OFLOW
+    mpu.enable_fifo()
+    mpu.enable_fifo(temp=False)
+    mpu.disable_fifo()
+
+    assert device.regs[INT_ENABLE] == INT_FIFO_OFLOW
@@ -0,0 +1,61 @@
+import pytest
+
+from MPU6050 import MPU6050
+
+ACCEL_XOUT_H = 0x3B
+
+
+def test_new_driver_takes_the_ranges_the_chip_kept(bus, device, mpu, clock):
+    mpu.write_accel_range(8)
+    mpu.write_gyro_range(1000)
+
+    # soft reboot: the chip keeps its registers, the driver starts over
+    rebooted = MPU6050(bus)
+
+    assert rebooted.accel_scale == mpu.accel_scale == 4096.0
+    assert rebooted.gyro_scale == mpu.gyro_scale == 32.8
+
+    clock.advance(0.02)
+    _, accel, _ = rebooted.read_all()
+    assert abs(accel[2] - 1.0) < 0.05
+
+
+def test_reset_goes_back_to_the_power_on_scales(mpu):
+    mpu.write_accel_range(16)
+    mpu.write_gyro_range(2000)
+    mpu.reset()
+
+    assert mpu.accel_scale == 16384.0
+    assert mpu.gyro_scale == 131.0
+    assert mpu.read_accel_range() == 2
+
+
+def test_self_test_bits_do_not_hide_the_ranges(bus, device, mpu):
+    mpu.write_accel_range(4)
+    mpu.write_gyro_range(500)
+    mpu.write_lpf_range(44)
+    # XA/YA/ZA_ST and XG/YG/ZG_ST, EXT_SYNC_SET on TEMP_OUT_L
+    bus.writeto_mem(0x68, 0x1C, bytes([0xE0 | 0x08]))
+    bus.writeto_mem(0x68, 0x1B, bytes([0xE0 | 0x08]))
+    bus.writeto_mem(0x68, 0x1A, bytes([0x08 | 0x03]))
+
+    rebooted = MPU6050(bus)
+
+    assert rebooted.read_accel_range() == 4
+    assert rebooted.read_gyro_range() == 500
+    assert rebooted.read_lpf_range() == 44
+    assert rebooted.accel_scale == 8192.0
+
+
+def test_driver_for_a_chip_that_does_not_answer_yet(bus):
+    # nothing answers at 0x69
+    driver = MPU6050(bus, 0x69)
+
+    assert driver.accel_scale == 16384.0
+    assert driver.gyro_scale == 131.0
+
+
+@pytest.mark.parametrize("rate_hz", [0, -10, float("nan")])
+def test_sample_rate_must_be_positive(mpu, rate_hz):
+    with pytest.raises(ValueError):
+        mpu.write_sample_rate(rate_hz)
@@ -0,0 +1,47 @@
+import pytest
+
+from ringbuffer import SampleRing
+
+
+def test_records_come_back_in_order_across_the_wrap():
+    ring = SampleRing(4, 3)
+    cursor = ring.reader()
+    buf = bytearray(3)
+
+    for i in range(6):
+        ring.write(bytes([i, i + 1, i + 2]), 100 * i)
+
+    # 0 and 1 were overwritten before the cursor got to them
+    assert ring.read_into(cursor, buf) == 200
+    assert buf == bytes([2, 3, 4])
+    assert cursor.dropped == 2
+
+    for i in (3, 4, 5):
+        assert ring.read_into(cursor, buf) == 100 * i
+        assert buf == bytes([i, i + 1, i + 2])
+
+    assert ring.read_into(cursor, buf) is None
+
+
+def test_short_buffer_gets_the_start_of_the_record():
+    ring = SampleRing(4, 6)
+    ring.write(bytes(range(6)), 1)
+    buf = bytearray(b"\xff" * 2)
+
+    assert ring.latest_into(buf) == 1
+    assert buf == bytes([0, 1])
+
+    long = bytearray(b"\xff" * 8)
+    assert ring.read_into(ring.reader(), long) is None
+    assert ring.latest_into(long) == 1
+    assert long == bytes(range(6)) + b"\xff\xff"
+
+
+def test_write_rejects_a_buffer_of_another_size():
+    ring = SampleRing(4, 6)
+
+    with pytest.raises(ValueError):
+        ring.write(bytes(8), 1)
+
+    assert len(ring.data) == 24
+    assert ring.head == 0
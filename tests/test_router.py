@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+
+from router import BadRequest, read_request
+
+
+def reader_with(data: bytes, eof: bool = True):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+
+    if eof:
+        reader.feed_eof()
+
+    return reader
+
+
+def test_request_head_is_parsed():
+    async def run():
+        return await read_request(reader_with(
+            b"GET /stream?format=binary&rate=50 HTTP/1.1\r\nHost: esp32\r\nConnection: close\r\n\r\n"), 1)
+
+    request = asyncio.run(run())
+
+    assert request.method == "GET"
+    assert request.path == "/stream"
+    assert request.query == {"format": "binary", "rate": "50"}
+    assert request.headers["host"] == "esp32"
+    assert not request.keep_alive
+
+
+def test_stalled_headers_time_out():
+    async def run():
+        # the request line arrives, the headers never end
+        reader = reader_with(b"GET / HTTP/1.1\r\nHost: esp32\r\n", eof=False)
+        # the outer limit only keeps a regression from hanging the suite
+        await asyncio.wait_for(read_request(reader, 0.05), 1)
+
+    start = time.monotonic()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+
+    assert time.monotonic() - start < 0.5
+
+
+def test_malformed_request_line():
+    async def run():
+        return await read_request(reader_with(b"GARBAGE\r\n\r\n"), 1)
+
+    with pytest.raises(BadRequest):
+        asyncio.run(run())
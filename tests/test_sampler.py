@@ -0,0 +1,195 @@
+import errno
+
+import pytest
+
+from MPU6050 import RAW_DATA_SIZE
+from sampler import DataReadySampler, MicroPythonClock, SimulatedClock
+
+
+class StubSensor:
+    """The part of MPU6050 the sampler uses, at exactly the rate asked for."""
+
+    def __init__(self, slowest_hz: float = 0.0):
+        self.rate_hz = 0.0
+        self.slowest_hz = slowest_hz
+        self.reads = 0
+        self.error = None
+
+    def write_sample_rate(self, rate_hz):
+        self.rate_hz = max(rate_hz, self.slowest_hz)
+
+    def read_sample_rate(self):
+        return self.rate_hz
+
+    def read_sample_rate_divider(self):
+        return 255 if self.rate_hz == self.slowest_hz else 0
+
+    def read_raw_into(self, buf):
+        if self.error:
+            raise self.error
+
+        self.reads += 1
+        buf[0] = self.reads & 0xFF
+
+    def enable_data_ready_interrupt(self):
+        pass
+
+    def disable_data_ready_interrupt(self):
+        pass
+
+
+class StubPin:
+    IRQ_RISING = 1
+
+    def __init__(self):
+        self.handler = None
+
+    def irq(self, trigger=None, handler=None, hard=False):
+        self.handler = handler
+
+
+def record(slowest_hz=0.0, **clock_args):
+    timestamps = []
+    clock = SimulatedClock(**clock_args)
+    sensor = StubSensor(slowest_hz)
+    sampler = DataReadySampler(sensor, lambda buf, ts: timestamps.append(ts), clock)
+    return sampler, sensor, clock, timestamps
+
+
+def test_ticks_wrap_like_the_board():
+    clock = SimulatedClock(SimulatedClock.TICKS_PERIOD - 300)
+    before = clock.ticks_us()
+    clock.advance(500)
+    after = clock.ticks_us()
+
+    assert after == 200
+    assert clock.ticks_diff(after, before) == 500
+    assert clock.ticks_diff(before, after) == -500
+
+
+def test_timestamps_keep_their_spacing_across_the_wrap():
+    sampler, _, clock, timestamps = record(start_us=SimulatedClock.TICKS_PERIOD - 25000)
+    sampler.start(None, 100)
+    clock.advance(100000)
+
+    assert len(timestamps) == 10
+    assert min(timestamps) < 25000 < max(timestamps)
+    assert all(clock.ticks_diff(b, a) == 10000 for a, b in zip(timestamps, timestamps[1:]))
+
+
+def test_timer_period_is_rounded():
+    sampler, _, clock, timestamps = record()
+    sampler.start(None, 1500)
+    clock.advance(20000)
+
+    # 666.67 us, truncating would run the timer 0.1 % fast
+    assert clock.ticks_diff(timestamps[1], timestamps[0]) == 667
+    assert len(timestamps) == 29
+
+
+def test_timer_paces_rates_below_the_chips_slowest():
+    sampler, sensor, clock, timestamps = record(3.9)
+    pin = StubPin()
+    sampler.start(pin, 1)
+    clock.advance(3000000)
+
+    assert sampler.rate_hz == 1
+    assert pin.handler is None
+    assert timestamps == [1000000, 2000000, 3000000]
+
+    sampler.stop()
+    sampler.start(pin, 50)
+    assert sampler.rate_hz == 50
+    assert pin.handler is not None
+
+
+def test_timer_paced_rate_is_the_one_the_timer_runs_at():
+    sampler, _, clock, timestamps = record(3.9)
+    sampler.start(StubPin(), 3)
+    clock.advance(1000000)
+
+    assert sampler.rate_hz == pytest.approx(1000000 / 333333)
+    assert clock.ticks_diff(timestamps[1], timestamps[0]) == 333333
+
+
+def test_hardware_timer_keeps_sub_millisecond_periods(monkeypatch):
+    import machine
+
+    calls = []
+
+    class Timer(machine.Timer):
+        def init(self, **kwargs):
+            calls.append(kwargs)
+
+    monkeypatch.setattr(machine, "Timer", Timer)
+    clock = MicroPythonClock()
+    clock.every(3333, None)
+    clock.cancel()
+
+    assert "period" not in calls[0]
+    assert calls[0]["freq"] == pytest.approx(300.03, abs=0.01)
+
+
+def test_stop_drops_a_scheduled_read():
+    sampler, sensor, clock, timestamps = record()
+    sampler.start(StubPin(), 100)
+    sampler._irq(None)
+    # the read is queued when the settings change
+    sampler.stop()
+    clock.run_pending()
+
+    assert sensor.reads == 0
+    assert timestamps == []
+
+    sampler.start(StubPin(), 100)
+    sampler._irq(None)
+    clock.run_pending()
+    assert len(timestamps) == 1
+
+
+def test_read_error_is_kept_as_fault():
+    sampler, sensor, clock, timestamps = record()
+    sampler.start(None, 100)
+    clock.advance(20000)
+    assert len(timestamps) == 2
+
+    sensor.error = OSError(errno.ETIMEDOUT)
+    clock.advance(50000)
+
+    assert sampler.fault is sensor.error
+    assert sampler.errors == 1
+    assert len(timestamps) == 2
+
+    sensor.error = None
+    clock.advance(20000)
+    assert len(timestamps) == 2
+
+    sampler.stop()
+    sampler.start(None, 100)
+    assert sampler.fault is None
+    clock.advance(20000)
+    assert len(timestamps) == 4
+
+
+def test_read_buffer_has_the_record_size():
+    received = []
+    clock = SimulatedClock()
+    sampler = DataReadySampler(StubSensor(), lambda buf, ts: received.append(len(buf)),
+                               clock, 3 * RAW_DATA_SIZE)
+    sampler.start(None, 100)
+    clock.advance(10000)
+
+    assert received == [3 * RAW_DATA_SIZE]
+
+
+def test_full_schedule_queue_counts_a_missed_sample():
+    sampler, _, clock, timestamps = record(queue_size=1)
+    sampler.start(StubPin(), 100)
+    clock.schedule(lambda _: None, 0)
+    sampler._irq(None)
+
+    assert sampler.missed == 1
+    clock.run_pending()
+    sampler._irq(None)
+    clock.run_pending()
+    assert len(timestamps) == 1
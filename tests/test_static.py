@@ -0,0 +1,59 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+
+import gzip_pages  # noqa: E402
+from static import StaticFiles  # noqa: E402
+
+
+class Writer:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def get(files, path, headers=None):
+    writer = Writer()
+    asyncio.run(files.serve(writer, path, headers or {}))
+    head, _, body = bytes(writer.data).partition(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    return lines[0], dict(line.split(": ", 1) for line in lines[1:]), body
+
+
+def test_etag_comes_from_the_build_manifest(tmp_path):
+    (tmp_path / "index.js").write_bytes(b"let x = 1;\n" * 200)
+    gzip_pages.main(str(tmp_path))
+    files = StaticFiles(str(tmp_path))
+
+    status, headers, body = get(files, "/index.js", {"accept-encoding": "gzip"})
+
+    assert status == "HTTP/1.1 200 OK"
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["ETag"] == files._etags["index.js.gz"][1]
+
+    status, _, body = get(files, "/index.js", {
+        "accept-encoding": "gzip", "if-none-match": headers["ETag"]})
+
+    assert status == "HTTP/1.1 304 Not Modified"
+    assert body == b""
+
+
+def test_unlisted_or_edited_file_falls_back_to_size_and_mtime(tmp_path):
+    (tmp_path / "style.css").write_bytes(b"body { margin: 0 }\n")
+    gzip_pages.main(str(tmp_path))
+    (tmp_path / "style.css").write_bytes(b"body { margin: 1px }\n")
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" * 10)
+    files = StaticFiles(str(tmp_path))
+
+    for name in ("style.css", "logo.png"):
+        _, headers, _ = get(files, "/" + name)
+        stat = os.stat(tmp_path / name)
+
+        assert headers["ETag"] == '"{:x}-{:x}"'.format(int(stat[8]), stat[6])
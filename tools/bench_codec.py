@@ -0,0 +1,119 @@
+"""
+Compression ratio and CPU benchmark for the delta codec in src/codec.py.
+
+    python tools/bench_codec.py [recording.csv]
+
+Without a recording the synthetic trace of bench_fusion.py is used. The
+samples are turned back into raw int16 blocks at the power-on ranges
+(+-2 g, +-250 deg/s), encoded with several frame lengths and decoded
+again, and the result is checked to round-trip exactly. Sizes are
+compared with the SAMPLE message (20 bytes) and the JSON text the stream
+sends otherwise. Run it with micropython too for numbers closer to the
+board.
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.dirname(__file__))
+
+import codec  # noqa: E402
+import wire  # noqa: E402
+from bench_fusion import synthetic_trace  # noqa: E402
+from record_stream import read_csv  # noqa: E402
+
+ACCEL_SCALE = 16384.0
+GYRO_SCALE = 131.0
+FRAME_SAMPLES = (1, 5, 10, 25, 50, 100)
+
+
+def clamp16(value):
+    return max(-32768, min(32767, int(round(value))))
+
+
+def to_raw(samples):
+    """Returns (timestamp, raw 14-byte block) pairs in the MPU6050 register order."""
+    blocks = []
+
+    for timestamp, gyro, accel, temp in samples:
+        blocks.append((timestamp, struct.pack(
+            ">7h",
+            clamp16(accel[0] * ACCEL_SCALE), clamp16(accel[1] * ACCEL_SCALE),
+            clamp16(accel[2] * ACCEL_SCALE), clamp16((temp - 36.53) * 340),
+            clamp16(gyro[0] * GYRO_SCALE), clamp16(gyro[1] * GYRO_SCALE),
+            clamp16(gyro[2] * GYRO_SCALE))))
+
+    return blocks
+
+
+def encode(blocks, samples_per_frame):
+    """Returns the encoded frames as (count, body) and the elapsed time."""
+    encoder = codec.DeltaEncoder(samples_per_frame)
+    frames = []
+    start = time.perf_counter()
+
+    for timestamp, raw in blocks:
+        length = encoder.add(raw, timestamp)
+        if length:
+            frames.append((encoder.count, bytes(encoder.body[:length])))
+
+    length = encoder.flush()
+    if length:
+        frames.append((encoder.count, bytes(encoder.body[:length])))
+
+    return frames, time.perf_counter() - start
+
+
+def decode(frames):
+    samples = []
+    start = time.perf_counter()
+
+    for count, body in frames:
+        samples += codec.decode(body, count)
+
+    return samples, time.perf_counter() - start
+
+
+def json_size(samples):
+    return sum(len(json.dumps({"gyro": gyro, "accel": accel, "temp": temp}))
+               for _, gyro, accel, temp in samples)
+
+
+def main(path=None):
+    if path:
+        samples = read_csv(path)
+        print("{} samples from {}".format(len(samples), path))
+    else:
+        samples, _ = synthetic_trace()
+        print("{} synthetic samples".format(len(samples)))
+
+    blocks = to_raw(samples)
+    n = len(blocks)
+    raw_size = n * wire.SAMPLE_SIZE
+    print("SAMPLE messages: {} bytes, JSON: {} bytes".format(
+        raw_size, json_size(samples)))
+
+    print("{:>8} {:>12} {:>10} {:>10} {:>12} {:>12}".format(
+        "samples", "bytes", "B/sample", "ratio", "enc us/smp", "dec us/smp"))
+
+    for samples_per_frame in FRAME_SAMPLES:
+        frames, encode_s = encode(blocks, samples_per_frame)
+        decoded, decode_s = decode(frames)
+
+        for (timestamp, raw), (t, values) in zip(blocks, decoded):
+            if t != timestamp or list(struct.unpack(">7h", raw)) != values:
+                raise AssertionError("round trip mismatch at {}".format(timestamp))
+
+        size = sum(wire.DELTA_HEADER_SIZE + len(body) for _, body in frames)
+
+        print("{:>8} {:>12} {:>10.2f} {:>10.2f} {:>12.2f} {:>12.2f}".format(
+            samples_per_frame, size, size / n, raw_size / size,
+            encode_s / n * 1e6, decode_s / n * 1e6))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,299 @@
+"""
+End-to-end benchmark of the firmware on the simulated board (tools/sim).
+
+    python tools/bench_e2e.py [clients] [seconds] [format] [i2c_latency_us] [sensors]
+
+Runs main.setup() and main.run() against the simulated MPU6050 and
+connects the given number of WebSocket stream clients (default 4) for
+the given time (default 10 s). format is json, binary, delta or mixed
+(default), mixed cycles the clients through the three. i2c_latency_us is
+added to every bus transaction (default 0, about 250 for the 14-byte
+burst at 400 kHz). sensors (default 1) MPU6050s are put on the bus, at
+0x68, 0x69 and on, and the clients ask for all of them (?sensors=all)
+except delta ones, which only stream the first.
+
+Reports the rate the sampler kept up, the stage times the firmware
+measured itself (see metrics.py), and per format the samples/s received,
+wire bytes per sample and the latency from the data-ready interrupt to
+the client. JSON messages carry no timestamp, so their latency is not
+measured. The clients run on a thread of their own, they still share the
+GIL with the firmware.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import sim  # noqa: E402
+from sim.sensor import Motion, SimMPU6050  # noqa: E402
+
+sim.install()
+
+import config  # noqa: E402
+import wire  # noqa: E402
+
+FORMATS = ("json", "binary", "delta")
+# samples before this are left out, the stream settles after calibration and connecting
+WARMUP_S = 1.0
+
+
+class Client:
+    def __init__(self, index, fmt, sensors=1):
+        self.index = index
+        self.format = fmt
+        self.sensors = sensors
+        self.samples = 0
+        self.bytes = 0
+        self.latencies = []
+        self.error = None
+        self._decoder = wire.Decoder()
+        self._measuring = False
+
+    def start_measuring(self):
+        self._measuring = True
+        self.samples = 0
+        self.bytes = 0
+        self.latencies = []
+
+    async def run(self, port, stop):
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            key = base64.b64encode(os.urandom(16)).decode()
+            writer.write((
+                "GET /stream?format={}{} HTTP/1.1\r\n"
+                "Host: 127.0.0.1\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                "Sec-WebSocket-Key: {}\r\n"
+                "Sec-WebSocket-Version: 13\r\n\r\n").format(
+                    self.format, "&sensors=all" if self.sensors > 1 and self.format != "delta" else "", key).encode())
+            await writer.drain()
+            await reader.readuntil(b"\r\n\r\n")
+
+            while not stop.is_set():
+                try:
+                    frame = await asyncio.wait_for(read_frame(reader), 0.5)
+                except asyncio.TimeoutError:
+                    continue
+
+                self.receive(*frame)
+
+            writer.close()
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.error = e
+
+    def receive(self, opcode, payload, size):
+        now = sim.ticks_us()
+
+        if opcode == 0x1:
+            samples = [None] if json.loads(payload).get("gyro") is not None else []
+        elif opcode == 0x2:
+            samples = self._decoder.feed(payload)
+        else:
+            return
+
+        if not self._measuring:
+            return
+
+        self.bytes += size
+        self.samples += len(samples)
+
+        for sample in samples:
+            if sample is not None:
+                self.latencies.append(sim.ticks_diff(now, sample[0]))
+
+
+async def read_frame(reader):
+    """Returns (opcode, payload, frame size) of the next unmasked server frame."""
+    head = await reader.readexactly(2)
+    length = head[1] & 0x7F
+    size = 2 + length
+
+    if length == 126:
+        length = struct.unpack(">H", await reader.readexactly(2))[0]
+        size = 4 + length
+    elif length == 127:
+        length = struct.unpack(">Q", await reader.readexactly(8))[0]
+        size = 10 + length
+
+    return head[0] & 0x0F, await reader.readexactly(length), size
+
+
+def run_clients(clients, port, stop, ready):
+    async def main():
+        await asyncio.gather(*(client.run(port, stop) for client in clients))
+
+    ready.set()
+    asyncio.run(main())
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def configure(workdir, i2c_latency_us, sensors):
+    config.HOST_IP = "127.0.0.1"
+    config.HOST_PORT = free_port()
+    config.CALIBRATION_FILE = os.path.join(workdir, "calibration.json")
+    config.TEMP_MODEL_FILE = None
+    config.LOG_DIR = os.path.join(workdir, "log")
+    config.CPU_FREQ_HZ = None
+    sim.bus.latency_us = i2c_latency_us
+    # with config.MPU_INT_PIN set the sensor drives that pin, else the sampler's timer reads
+    sim.mpu.int_pin = config.MPU_INT_PIN
+
+    for i in range(1, sensors):
+        sim.bus.attach(SimMPU6050(0x68 + i, motion=Motion(seed=1 + i)))
+
+    config.SENSORS = tuple((0, 0x68 + i) for i in range(sensors))
+
+
+async def bench(main, wlan, clients, seconds):
+    import server
+
+    task = asyncio.create_task(main.run(wlan))
+    stop = threading.Event()
+    ready = threading.Event()
+    thread = threading.Thread(target=run_clients,
+                              args=(clients, config.HOST_PORT, stop, ready), daemon=True)
+
+    # the server is listening once run() got to the loop
+    while server.socket_server is None:
+        await asyncio.sleep(0.01)
+
+    thread.start()
+    ready.wait()
+    await asyncio.sleep(WARMUP_S)
+
+    sampler = main.sampler
+    samples, missed = sampler.samples, sampler.missed
+    stages = {name: (h.count, h.sum_s * 1000000 + h.sum_us)
+              for name, h in main.metrics.stages.items()}
+
+    for client in clients:
+        client.start_measuring()
+
+    start = time.perf_counter()
+    await asyncio.sleep(seconds)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "elapsed": elapsed,
+        "samples": sampler.samples - samples,
+        "missed": sampler.missed - missed,
+        "stages": {name: (h.count - stages[name][0],
+                          h.sum_s * 1000000 + h.sum_us - stages[name][1])
+                   for name, h in main.metrics.stages.items()},
+        "dropped": sum(c.frames_dropped for c in server.broadcaster.clients),
+        "counts": [(c.samples, c.bytes, list(c.latencies)) for c in clients],
+    }
+
+    stop.set()
+
+    # the stream tasks end on the next sample after their client left
+    while thread.is_alive() or server.broadcaster.clients:
+        await asyncio.sleep(0.05)
+
+    sampler.stop()
+    task.cancel()
+    server.socket_server.close()
+    await server.socket_server.wait_closed()
+    return result
+
+
+def report(result, clients):
+    elapsed = result["elapsed"]
+    rate = result["samples"] / elapsed
+
+    print()
+    print("sensor  {} x {:.0f} Hz configured, {:.1f} records/s read, {} missed interrupts".format(
+        len(config.SENSORS), config.SAMPLE_RATE_HZ, rate, result["missed"]))
+    print("bus     {} transactions, {:.0f} us added per transaction".format(
+        sim.bus.transactions, sim.bus.latency_us))
+    print()
+    print("{:<9} {:>8} {:>10}".format("stage", "count", "mean us"))
+
+    for name, (count, total_us) in result["stages"].items():
+        if count:
+            print("{:<9} {:>8} {:>10.1f}".format(name, count, total_us / count))
+
+    print()
+    print("{:<7} {:>7} {:>10} {:>10} {:>9} {:>9} {:>9} {:>9}".format(
+        "format", "clients", "samples/s", "B/sample", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+
+    for fmt in FORMATS:
+        group = [(client, counts) for client, counts in zip(clients, result["counts"])
+                 if client.format == fmt]
+
+        if not group:
+            continue
+
+        samples = sum(counts[0] for _, counts in group)
+        size = sum(counts[1] for _, counts in group)
+        latencies = [v / 1000 for _, counts in group for v in counts[2]]
+        p = ["{:.2f}".format(percentile(latencies, q)) if latencies else "-"
+             for q in (50, 90, 99, 100)]
+
+        print("{:<7} {:>7} {:>10.1f} {:>10.1f} {:>9} {:>9} {:>9} {:>9}".format(
+            fmt, len(group), samples / len(group) / elapsed,
+            size / samples if samples else float("nan"), *p))
+
+    print()
+    print("frames dropped by the send queues: {}".format(result["dropped"]))
+
+    for client in clients:
+        if client.error:
+            print("client {} ({}) failed: {!r}".format(client.index, client.format, client.error))
+
+
+def main(count=4, seconds=10.0, fmt="mixed", i2c_latency_us=0.0, sensors=1):
+    formats = FORMATS if fmt == "mixed" else (fmt,)
+    clients = [Client(i, formats[i % len(formats)], sensors) for i in range(count)]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(workdir, i2c_latency_us, sensors)
+
+        import main as firmware
+
+        wlan = firmware.setup()
+        result = asyncio.run(bench(firmware, wlan, clients, seconds))
+
+    report(result, clients)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="End-to-end benchmark of the firmware on the simulated board.")
+    parser.add_argument("clients", nargs="?", type=int, default=4,
+                        help="WebSocket stream clients (default 4)")
+    parser.add_argument("seconds", nargs="?", type=float, default=10.0,
+                        help="measured time after a %.0f s warm-up (default 10)" % WARMUP_S)
+    parser.add_argument("format", nargs="?", default="mixed", choices=FORMATS + ("mixed",),
+                        help="stream format, mixed cycles the clients through the others (default mixed)")
+    parser.add_argument("i2c_latency_us", nargs="?", type=float, default=0.0,
+                        help="time added to every bus transaction (default 0)")
+    parser.add_argument("sensors", nargs="?", type=int, default=1,
+                        help="MPU6050s on the bus, from 0x68 on (default 1)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.clients, args.seconds, args.format, args.i2c_latency_us, args.sensors)
@@ -0,0 +1,151 @@
+"""
+Accuracy and throughput benchmark for the attitude filters in src/fusion.py.
+
+    python tools/bench_fusion.py [recording.csv]
+
+Without a recording a synthetic trace with known orientation is generated
+(sinusoidal roll/pitch, gyro noise and bias, accelerometer noise) and the
+roll/pitch error against the true orientation is reported. With a
+recording (see record_stream.py) there is no ground truth, so the error
+is measured against the reference implementations in fusion_reference.py.
+Yaw is left out, it is unobservable without a magnetometer.
+
+The fixed-point filters (*_fixed) get the samples as raw counts at the
+default ranges (250 deg/s, 2 g) through update_counts, like on the board.
+Host throughput says little about the ESP32, where the float filters
+allocate on every update and the fixed-point ones do not, it is there to
+compare the filters with each other.
+"""
+
+import os
+import random
+import sys
+import time
+from math import cos, pi, sin, sqrt
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.dirname(__file__))
+
+import fusion  # noqa: E402
+from fusion_reference import REFERENCE_FILTERS, quat_to_euler  # noqa: E402
+from record_stream import read_csv  # noqa: E402
+
+RAD_TO_DEG = 180.0 / pi
+
+
+def synthetic_trace(rate_hz=200, seconds=30.0, seed=1):
+    """
+    Returns (samples, truth) where truth holds (roll, pitch) in degrees per sample.
+    """
+    rng = random.Random(seed)
+    dt = 1.0 / rate_hz
+    bias = (0.4, -0.3, 0.2)
+    samples = []
+    truth = []
+
+    for i in range(int(seconds * rate_hz)):
+        t = i * dt
+        roll = 0.5 * sin(2 * pi * 0.3 * t)
+        pitch = 0.35 * sin(2 * pi * 0.17 * t + 1.0)
+        roll_rate = 0.5 * 2 * pi * 0.3 * cos(2 * pi * 0.3 * t)
+        pitch_rate = 0.35 * 2 * pi * 0.17 * cos(2 * pi * 0.17 * t + 1.0)
+
+        # body rates for ZYX Euler angles with constant yaw
+        p = roll_rate
+        q = pitch_rate * cos(roll)
+        r = -pitch_rate * sin(roll)
+
+        gyro = tuple(v * RAD_TO_DEG + b + rng.gauss(0, 0.05)
+                     for v, b in zip((p, q, r), bias))
+        accel = (
+            -sin(pitch) + rng.gauss(0, 0.01),
+            sin(roll) * cos(pitch) + rng.gauss(0, 0.01),
+            cos(roll) * cos(pitch) + rng.gauss(0, 0.01),
+        )
+
+        samples.append((int(t * 1e6), gyro, accel, 25.0))
+        truth.append((roll * RAD_TO_DEG, pitch * RAD_TO_DEG))
+
+    return samples, truth
+
+
+def run(update, samples):
+    """Runs update(gyro, accel, dt_us) over samples, returns per-sample (roll, pitch) and the elapsed time."""
+    out = []
+    previous = None
+    start = time.perf_counter()
+
+    for timestamp, gyro, accel, _ in samples:
+        dt_us = 0 if previous is None else timestamp - previous
+        previous = timestamp
+        out.append(update(gyro, accel, dt_us))
+
+    return out, time.perf_counter() - start
+
+
+def to_counts(samples, gyro_scale, accel_scale):
+    """samples with gyro and accel as raw counts, as the MPU6050 would read them."""
+    return [(timestamp,
+             tuple(int(round(v * gyro_scale)) for v in gyro),
+             tuple(int(round(v * accel_scale)) for v in accel),
+             temp)
+            for timestamp, gyro, accel, temp in samples]
+
+
+def rms(a, b, skip):
+    errors = [(x[0] - y[0]) ** 2 + (x[1] - y[1]) ** 2
+              for x, y in zip(a[skip:], b[skip:])]
+    return sqrt(sum(errors) / max(1, len(errors)))
+
+
+def main(path=None):
+    if path:
+        samples = read_csv(path)
+        truth = None
+        print("{} samples from {}".format(len(samples), path))
+    else:
+        samples, truth = synthetic_trace()
+        print("{} synthetic samples".format(len(samples)))
+
+    # let the filters converge before measuring
+    skip = min(len(samples) // 10, 400)
+
+    print("{:<20} {:>12} {:>14} {:>16}".format(
+        "filter", "updates/s", "rms err (deg)", "vs reference"))
+
+    for name, cls in fusion.FILTERS.items():
+        f = cls()
+        euler = [0.0, 0.0, 0.0]
+
+        if isinstance(f, fusion.FixedPointFilter):
+            inputs = to_counts(samples, f.gyro_scale, f.accel_scale)
+
+            def update(gyro, accel, dt_us):
+                f.update_counts(gyro[0], gyro[1], gyro[2],
+                                accel[0], accel[1], accel[2], dt_us)
+                f.euler_into(euler)
+                return (euler[0], euler[1])
+        else:
+            inputs = samples
+
+            def update(gyro, accel, dt_us):
+                f.update(gyro[0], gyro[1], gyro[2],
+                         accel[0], accel[1], accel[2], dt_us / 1e6)
+                f.euler_into(euler)
+                return (euler[0], euler[1])
+
+        estimate, elapsed = run(update, inputs)
+
+        # the fixed-point filters are checked against the float algorithm
+        ref = REFERENCE_FILTERS[name.replace("_fixed", "")]()
+        reference, _ = run(lambda g, a, dt_us: quat_to_euler(
+            ref.update(g, a, dt_us / 1e6))[:2], samples)
+
+        print("{:<20} {:>12.0f} {:>14} {:>16.6f}".format(
+            name, len(samples) / elapsed,
+            "{:.3f}".format(rms(estimate, truth, skip)) if truth else "-",
+            rms(estimate, reference, skip)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,67 @@
+"""
+Compiles modules of src/ to frozen-ready .mpy bytecode, run before uploading to the board.
+
+    python tools/build_mpy.py [--all] [module ...]
+
+Importing a .mpy skips parsing and compiling on the board, which is most
+of the import time of the large modules (MPU6050, server, BLE by default,
+--all for every module but boot.py, main.py and config.py, which stay
+editable). Output goes to build/mpy. Upload it in place of the .py files,
+the board imports a .py before a .mpy of the same name.
+
+mpy-cross must match the firmware's bytecode version; it is taken from
+PATH or from the mpy-cross package (pip install mpy-cross). The modules
+use @micropython.native, so they are built for the ESP32's xtensawin
+architecture, override with MPY_MARCH.
+
+To freeze the modules into the firmware instead, build MicroPython with
+FROZEN_MANIFEST pointing at tools/manifest.py.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+OUT = os.path.join(os.path.dirname(__file__), "..", "build", "mpy")
+DEFAULT_MODULES = ("MPU6050", "server", "BLE")
+# run from source so they can be changed on the board
+KEEP_SOURCE = ("boot", "main", "config")
+
+
+def mpy_cross():
+    """Returns the mpy-cross command line."""
+    if shutil.which("mpy-cross"):
+        return ["mpy-cross"]
+
+    return [sys.executable, "-m", "mpy_cross"]
+
+
+def all_modules():
+    return sorted(name[:-3] for name in os.listdir(SRC)
+                  if name.endswith(".py") and name[:-3] not in KEEP_SOURCE)
+
+
+def main(modules):
+    march = os.environ.get("MPY_MARCH", "xtensawin")
+    os.makedirs(OUT, exist_ok=True)
+
+    for module in modules:
+        source = os.path.join(SRC, module + ".py")
+        target = os.path.join(OUT, module + ".mpy")
+
+        subprocess.run(mpy_cross() + ["-march=" + march, "-o", target, source],
+                       check=True)
+
+        print("{:<24} {:>8} -> {:>8} bytes".format(
+            module, os.path.getsize(source), os.path.getsize(target)))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    if "--all" in args:
+        main(all_modules())
+    else:
+        main(args or DEFAULT_MODULES)
@@ -0,0 +1,155 @@
+"""
+Fits the temperature model of the gyro and accel bias from recordings.
+
+    python tools/fit_temp_bias.py temp_model.json recording.csv [...] [degree]
+
+The recordings (record_stream.py or read_log.py CSV) must be of a board
+lying still while its temperature changes, e.g. warming up after power
+on or in a fridge. Samples are averaged per 0.1 C bin, so long stretches
+at one temperature do not dominate, and a polynomial of the given degree
+(default 2) in (temp - t0) is fitted per axis by weighted least squares.
+Only the change of the bias with temperature matters on the board, the
+constant term (gravity on accel z included) cancels against the offsets
+of the calibration.
+
+Copy the output to the board as config.TEMP_MODEL_FILE.
+"""
+
+import json
+import os
+import sys
+from math import sqrt
+
+sys.path.append(os.path.dirname(__file__))
+
+from record_stream import read_csv  # noqa: E402
+
+BIN_C = 0.1
+AXES = ("gx", "gy", "gz", "ax", "ay", "az")
+
+
+def bin_samples(samples):
+    """Returns sorted (temp, count, [gx, gy, gz, ax, ay, az] means) per temperature bin."""
+    bins = {}
+
+    for _, gyro, accel, temp in samples:
+        key = round(temp / BIN_C)
+        entry = bins.setdefault(key, [0, [0.0] * 6])
+        entry[0] += 1
+
+        for i, value in enumerate(gyro + accel):
+            entry[1][i] += value
+
+    return [(key * BIN_C, n, [v / n for v in sums])
+            for key, (n, sums) in sorted(bins.items())]
+
+
+def solve(a, b):
+    """Solves a x = b by Gaussian elimination with partial pivoting."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        m[col], m[pivot] = m[pivot], m[col]
+
+        if m[col][col] == 0:
+            raise ValueError("not enough distinct temperatures for this degree")
+
+        for r in range(col + 1, n):
+            f = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= f * m[col][c]
+
+    x = [0.0] * n
+
+    for r in range(n - 1, -1, -1):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+
+    return x
+
+
+def fit(xs, ys, weights, degree):
+    """Weighted least squares polynomial, coefficients lowest order first."""
+    size = degree + 1
+    a = [[0.0] * size for _ in range(size)]
+    b = [0.0] * size
+
+    for x, y, w in zip(xs, ys, weights):
+        powers = [x ** k for k in range(2 * size)]
+
+        for i in range(size):
+            b[i] += w * y * powers[i]
+            for j in range(size):
+                a[i][j] += w * powers[i + j]
+
+    return solve(a, b)
+
+
+def evaluate(coefficients, x):
+    value = 0.0
+
+    for c in reversed(coefficients):
+        value = value * x + c
+
+    return value
+
+
+def fit_model(samples, degree=2):
+    bins = bin_samples(samples)
+
+    if len(bins) <= degree:
+        raise ValueError("need more than {} temperature bins, got {}".format(
+            degree, len(bins)))
+
+    temps = [t for t, _, _ in bins]
+    weights = [n for _, n, _ in bins]
+    t0 = sum(t * n for t, n in zip(temps, weights)) / sum(weights)
+    xs = [t - t0 for t in temps]
+
+    model = {"t0": t0, "range": [temps[0], temps[-1]], "degree": degree,
+             "gyro": [], "accel": []}
+    report = []
+
+    for axis in range(6):
+        ys = [means[axis] for _, _, means in bins]
+        coefficients = fit(xs, ys, weights, degree)
+        residuals = [y - evaluate(coefficients, x) for x, y in zip(xs, ys)]
+        rms = sqrt(sum(w * r * r for w, r in zip(weights, residuals)) / sum(weights))
+        drift = evaluate(coefficients, xs[-1]) - evaluate(coefficients, xs[0])
+
+        model["gyro" if axis < 3 else "accel"].append(coefficients)
+        report.append((AXES[axis], drift, rms))
+
+    return model, report
+
+
+def main(path, recordings, degree=2):
+    samples = []
+
+    for recording in recordings:
+        samples += read_csv(recording)
+
+    model, report = fit_model(samples, degree)
+
+    with open(path, "w") as file:
+        json.dump(model, file)
+
+    print("{} samples, {:.1f} to {:.1f} C, degree {}".format(
+        len(samples), model["range"][0], model["range"][1], degree))
+    print("{:<5} {:>12} {:>12}".format("axis", "drift", "rms resid"))
+
+    for name, drift, rms in report:
+        print("{:<5} {:>12.5f} {:>12.5f}".format(name, drift, rms))
+
+    print("model written to {}".format(path))
+
+
+if __name__ == "__main__":
+    args = sys.argv[2:]
+    degree = 2
+
+    if args and args[-1].isdigit():
+        degree = int(args.pop())
+
+    main(sys.argv[1], args, degree)
@@ -0,0 +1,144 @@
+"""
+Reference attitude filters for checking src/fusion.py on CPython.
+
+Written for clarity rather than speed: double precision, plain tuples and
+the textbook formulations (Madgwick's Jacobian form, Mahony's cross
+product form) instead of the expanded expressions used on the board.
+"""
+
+from math import asin, atan2, cos, pi, sin, sqrt
+
+DEG_TO_RAD = pi / 180.0
+
+
+def quat_mul(a, b):
+    return (
+        a[0] * b[0] - a[1] * b[1] - a[2] * b[2] - a[3] * b[3],
+        a[0] * b[1] + a[1] * b[0] + a[2] * b[3] - a[3] * b[2],
+        a[0] * b[2] - a[1] * b[3] + a[2] * b[0] + a[3] * b[1],
+        a[0] * b[3] + a[1] * b[2] - a[2] * b[1] + a[3] * b[0],
+    )
+
+
+def normalize(v):
+    n = sqrt(sum(x * x for x in v))
+    return tuple(x / n for x in v) if n > 0 else v
+
+
+def quat_to_euler(q):
+    """(roll, pitch, yaw) in degrees."""
+    w, x, y, z = q
+    roll = atan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    pitch = asin(max(-1.0, min(1.0, 2 * (w * y - z * x))))
+    yaw = atan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return tuple(a / DEG_TO_RAD for a in (roll, pitch, yaw))
+
+
+def euler_to_quat(roll, pitch, yaw):
+    """Quaternion from angles in radians, ZYX order."""
+    cr, sr = cos(roll / 2), sin(roll / 2)
+    cp, sp = cos(pitch / 2), sin(pitch / 2)
+    cy, sy = cos(yaw / 2), sin(yaw / 2)
+    return (
+        cr * cp * cy + sr * sp * sy,
+        sr * cp * cy - cr * sp * sy,
+        cr * sp * cy + sr * cp * sy,
+        cr * cp * sy - sr * sp * cy,
+    )
+
+
+class Complementary:
+    def __init__(self, alpha=0.98):
+        self.alpha = alpha
+        self.angles = None
+
+    def update(self, gyro, accel, dt):
+        ax, ay, az = accel
+        tilt = (atan2(ay, az), atan2(-ax, sqrt(ay * ay + az * az)))
+
+        if self.angles is None:
+            self.angles = [tilt[0], tilt[1], 0.0]
+        else:
+            rates = [g * DEG_TO_RAD for g in gyro]
+            for i in range(2):
+                self.angles[i] = self.alpha * \
+                    (self.angles[i] + rates[i] * dt) + \
+                    (1 - self.alpha) * tilt[i]
+            self.angles[2] += rates[2] * dt
+
+        return euler_to_quat(*self.angles)
+
+
+class Madgwick:
+    def __init__(self, beta=0.1):
+        self.beta = beta
+        self.q = (1.0, 0.0, 0.0, 0.0)
+
+    def update(self, gyro, accel, dt):
+        q = self.q
+        omega = (0.0,) + tuple(g * DEG_TO_RAD for g in gyro)
+        q_dot = tuple(0.5 * v for v in quat_mul(q, omega))
+
+        if any(accel):
+            ax, ay, az = normalize(accel)
+            q0, q1, q2, q3 = q
+            f = (
+                2 * (q1 * q3 - q0 * q2) - ax,
+                2 * (q0 * q1 + q2 * q3) - ay,
+                2 * (0.5 - q1 * q1 - q2 * q2) - az,
+            )
+            jacobian = (
+                (-2 * q2, 2 * q3, -2 * q0, 2 * q1),
+                (2 * q1, 2 * q0, 2 * q3, 2 * q2),
+                (0.0, -4 * q1, -4 * q2, 0.0),
+            )
+            gradient = normalize(tuple(
+                sum(jacobian[r][c] * f[r] for r in range(3)) for c in range(4)))
+            q_dot = tuple(d - self.beta * g for d, g in zip(q_dot, gradient))
+
+        self.q = normalize(tuple(a + d * dt for a, d in zip(q, q_dot)))
+        return self.q
+
+
+class Mahony:
+    def __init__(self, kp=1.0, ki=0.0):
+        self.kp = kp
+        self.ki = ki
+        self.q = (1.0, 0.0, 0.0, 0.0)
+        self.integral = (0.0, 0.0, 0.0)
+
+    def update(self, gyro, accel, dt):
+        q0, q1, q2, q3 = self.q
+        omega = [g * DEG_TO_RAD for g in gyro]
+
+        if any(accel):
+            a = normalize(accel)
+            v = (
+                2 * (q1 * q3 - q0 * q2),
+                2 * (q0 * q1 + q2 * q3),
+                q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3,
+            )
+            e = (
+                a[1] * v[2] - a[2] * v[1],
+                a[2] * v[0] - a[0] * v[2],
+                a[0] * v[1] - a[1] * v[0],
+            )
+
+            if self.ki > 0:
+                self.integral = tuple(
+                    i + self.ki * x * dt for i, x in zip(self.integral, e))
+                omega = [w + i for w, i in zip(omega, self.integral)]
+
+            omega = [w + self.kp * x for w, x in zip(omega, e)]
+
+        q_dot = quat_mul(self.q, (0.0,) + tuple(omega))
+        self.q = normalize(tuple(a + 0.5 * d * dt
+                                 for a, d in zip(self.q, q_dot)))
+        return self.q
+
+
+REFERENCE_FILTERS = {
+    "complementary": Complementary,
+    "madgwick": Madgwick,
+    "mahony": Mahony,
+}
@@ -0,0 +1,71 @@
+"""
+Writes a gzip variant next to every page asset, run before uploading src/ to the board.
+
+    python tools/gzip_pages.py [pages dir]
+
+The server sends file.gz with Content-Encoding: gzip to clients that accept
+it and falls back to the plain file otherwise. Variants that would not be
+smaller are skipped (and removed if an old one exists).
+
+Also writes etags.json, the CRC32 and size of every file in the directory,
+which the server sends as ETag instead of hashing files on the board.
+"""
+
+import gzip
+import json
+import os
+import sys
+import zlib
+
+EXTENSIONS = (".html", ".js", ".css", ".json")
+# read by src/static.py
+ETAGS = "etags.json"
+
+
+def write_etags(pages):
+    etags = {}
+
+    for name in sorted(os.listdir(pages)):
+        path = os.path.join(pages, name)
+
+        if name == ETAGS or not os.path.isfile(path):
+            continue
+
+        with open(path, "rb") as file:
+            data = file.read()
+
+        etags[name] = [len(data), '"{:08x}-{:x}"'.format(zlib.crc32(data), len(data))]
+
+    with open(os.path.join(pages, ETAGS), "w") as file:
+        json.dump(etags, file, separators=(",", ":"))
+
+
+def main(pages):
+    for name in sorted(os.listdir(pages)):
+        path = os.path.join(pages, name)
+
+        if name == ETAGS or not name.endswith(EXTENSIONS):
+            continue
+
+        with open(path, "rb") as file:
+            data = file.read()
+
+        # mtime=0 keeps the output, and so the ETag, stable between builds
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+
+        if len(compressed) >= len(data):
+            if os.path.exists(path + ".gz"):
+                os.remove(path + ".gz")
+            continue
+
+        with open(path + ".gz", "wb") as file:
+            file.write(compressed)
+
+        print("{:<24} {:>8} -> {:>8} bytes".format(name, len(data), len(compressed)))
+
+    write_etags(pages)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(__file__), "..", "src", "pages"))
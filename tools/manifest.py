@@ -0,0 +1,9 @@
+# Freeze manifest, build the firmware with FROZEN_MANIFEST=<repo>/tools/manifest.py.
+# Paths are relative to this file. Frozen modules run from flash without
+# being loaded to RAM; remove their .py files from the board, a file on
+# the filesystem shadows the frozen one.
+include("$(PORT_DIR)/boards/manifest.py")
+
+module("MPU6050.py", base_path="../src", opt=3)
+module("server.py", base_path="../src", opt=3)
+module("BLE.py", base_path="../src", opt=3)
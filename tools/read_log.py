@@ -0,0 +1,91 @@
+"""
+Downloads and decodes the flash sample log of the board.
+
+    python tools/read_log.py out.csv [host | log file] [block size]
+
+Fetches /log/download from the host (default 192.168.4.1), or reads a
+file saved from it or copied off the board, and writes the samples of all
+valid chunks as CSV in the format of record_stream.py. Torn or stale
+chunks are skipped and reported; see src/logger.py for the layout.
+"""
+
+import os
+import sys
+import urllib.request
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.dirname(__file__))
+
+import logger  # noqa: E402
+import wire  # noqa: E402
+from record_stream import write_csv  # noqa: E402
+
+
+def decode_log(data, block_size=4096):
+    """
+    Decodes concatenated segment images.
+
+    Returns:
+        tuple: (samples, segments, bad chunks) with samples as in record_stream.read_csv.
+    """
+    samples = []
+    segments = 0
+    bad = 0
+    decoder = None
+    sequence = None
+    index = 0
+
+    for offset in range(0, len(data) - block_size + 1, block_size):
+        chunk = logger.read_chunk_header(data, offset)
+
+        if chunk is None:
+            if any(data[offset:offset + logger.CHUNK_HEADER_SIZE]):
+                bad += 1
+            sequence = None
+            continue
+
+        seq, chunk_index, start, length, _ = chunk
+
+        if chunk_index == 0:
+            segment = logger.read_segment(data[offset:offset + block_size], block_size)
+
+            if segment is None:
+                bad += 1
+                sequence = None
+                continue
+
+            decoder = wire.Decoder()
+            decoder.feed(segment[0][4])
+            sequence = seq
+            index = 0
+            segments += 1
+        elif seq != sequence or chunk_index != index + 1:
+            bad += 1
+            sequence = None
+            continue
+        else:
+            samples += decoder.feed(data[start:start + length])
+
+        index = chunk_index
+
+    return samples, segments, bad
+
+
+def main(path, source="192.168.4.1", block_size=4096):
+    if os.path.exists(source):
+        with open(source, "rb") as file:
+            data = file.read()
+    else:
+        with urllib.request.urlopen("http://{}/log/download".format(source)) as response:
+            data = response.read()
+
+    samples, segments, bad = decode_log(data, block_size)
+    write_csv(path, samples)
+    print("{} samples from {} segments written to {}, {} bad chunks".format(
+        len(samples), segments, path, bad))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1],
+         sys.argv[2] if len(sys.argv) > 2 else "192.168.4.1",
+         int(sys.argv[3]) if len(sys.argv) > 3 else 4096)
@@ -0,0 +1,70 @@
+"""
+Records the binary sample stream of the board to a CSV file.
+
+    python tools/record_stream.py out.csv [seconds] [host]
+
+Columns: t_us, gx, gy, gz (deg/s), ax, ay, az (g), temp (C). The recordings
+feed the offline tools (bench_fusion.py, bench_codec.py, fit_temp_bias.py).
+"""
+
+import os
+import socket
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+import wire  # noqa: E402
+
+COLUMNS = ("t_us", "gx", "gy", "gz", "ax", "ay", "az", "temp")
+
+
+def write_csv(path, samples):
+    with open(path, "w") as file:
+        file.write(",".join(COLUMNS) + "\n")
+
+        for timestamp, gyro, accel, temp in samples:
+            file.write("{},{:.6f},{:.6f},{:.6f},{:.6f},{:.6f},{:.6f},{:.3f}\n".format(
+                timestamp, gyro[0], gyro[1], gyro[2], accel[0], accel[1], accel[2], temp))
+
+
+def read_csv(path):
+    """Returns a list of (t_us, (gx, gy, gz), (ax, ay, az), temp) tuples."""
+    samples = []
+
+    with open(path) as file:
+        file.readline()
+
+        for line in file:
+            v = line.strip().split(",")
+            if len(v) < 8:
+                continue
+            samples.append((int(v[0]), (float(v[1]), float(v[2]), float(v[3])),
+                            (float(v[4]), float(v[5]), float(v[6])), float(v[7])))
+
+    return samples
+
+
+def main(path, seconds=10.0, host="192.168.4.1"):
+    client = socket.create_connection((host, 80))
+    client.sendall(b"GET /stream?format=binary HTTP/1.1\r\n\r\n")
+    client.settimeout(1.0)
+
+    decoder = wire.Decoder()
+    samples = []
+    end = time.time() + seconds
+
+    while time.time() < end:
+        try:
+            samples += decoder.feed(client.recv(4096))
+        except socket.timeout:
+            pass
+
+    client.close()
+    write_csv(path, samples)
+    print("{} samples written to {}".format(len(samples), path))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1],
+         float(sys.argv[2]) if len(sys.argv) > 2 else 10.0,
+         sys.argv[3] if len(sys.argv) > 3 else "192.168.4.1")
@@ -0,0 +1,81 @@
+"""
+Simulated board for running src/ on CPython.
+
+    import sim
+    sim.install()
+    import main
+
+install() puts the stub modules (machine, micropython, network,
+bluetooth, see stubs/) ahead of src on sys.path and adds MicroPython's
+ticks and sleep functions to time, so the application imports unchanged.
+The stubs talk to the objects here: machine.I2C and SoftI2C use bus, on
+which an MPU6050 (sensor.SimMPU6050) answers at 0x68, and every
+machine.Pin registers itself in pins so the sensor can drive its INT pin.
+
+Hard IRQs, timer callbacks and micropython.schedule run on their own
+threads instead of between the bytecodes of the main loop, the GIL
+interleaves them with it much like the MicroPython VM does. Timings are
+those of CPython on the host, compare runs with each other, not with the
+board.
+"""
+
+import os
+import sys
+import time
+
+from sim.i2c import SimI2C
+from sim.sensor import SimMPU6050
+
+# MicroPython's ticks wrap at 2**30 on the ESP32
+TICKS_PERIOD = 1 << 30
+_TICKS_MAX = TICKS_PERIOD - 1
+_TICKS_HALF = TICKS_PERIOD // 2
+
+# pin id -> machine.Pin, filled by the stub
+pins = {}
+
+bus = SimI2C()
+mpu = bus.attach(SimMPU6050())
+
+_epoch = time.perf_counter_ns()
+
+
+def ticks_us():
+    return (time.perf_counter_ns() - _epoch) // 1000 & _TICKS_MAX
+
+
+def ticks_ms():
+    return (time.perf_counter_ns() - _epoch) // 1000000 & _TICKS_MAX
+
+
+def ticks_cpu():
+    return (time.perf_counter_ns() - _epoch) & _TICKS_MAX
+
+
+def ticks_diff(a, b):
+    return ((a - b + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+
+def install():
+    """Makes the stubs and src importable, call it before importing anything from src."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    src = os.path.join(here, "..", "..", "src")
+
+    for path in (src, os.path.join(here, "stubs")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    for func in (ticks_us, ticks_ms, ticks_cpu, ticks_diff, ticks_add, sleep_ms, sleep_us):
+        setattr(time, func.__name__, func)
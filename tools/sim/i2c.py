@@ -0,0 +1,93 @@
+"""
+Simulated I2C bus with the memory-access methods of machine.I2C.
+
+Devices are attached by address and implement read(register, n) and
+write(register, data). Every transaction can cost a fixed latency plus a
+time per byte, spent busy-waiting so it shows up in timings like a real
+bus would (400 kHz is about 23 us per byte with the ACK bit). A lock
+serializes transactions from the timer and IRQ threads of the stubs.
+
+fail() makes the next transactions raise OSError, like a hung bus or a
+device that stopped answering.
+"""
+
+import threading
+import time
+
+EIO = 5
+ENODEV = 19
+ETIMEDOUT = 116
+
+
+class SimI2C:
+    def __init__(self, latency_us: float = 0, byte_us: float = 0):
+        """
+        Args:
+            latency_us (float, optional): Time per transaction (start, address, register). Defaults to 0.
+            byte_us (float, optional): Time per data byte. Defaults to 0.
+        """
+        self.latency_us = latency_us
+        self.byte_us = byte_us
+        self.devices = {}
+        self.transactions = 0
+        self.bytes = 0
+        self.errors = 0
+        self._failures = 0
+        self._errno = EIO
+        self._lock = threading.Lock()
+
+    def fail(self, count: int = 1, errno: int = ETIMEDOUT) -> None:
+        """Lets the next count transactions fail with OSError(errno)."""
+        self._failures = count
+        self._errno = errno
+
+    def attach(self, device):
+        self.devices[device.address] = device
+        return device
+
+    def scan(self) -> list:
+        return sorted(self.devices)
+
+    def readfrom_mem(self, addr: int, memaddr: int, nbytes: int, *, addrsize: int = 8) -> bytes:
+        with self._lock:
+            data = self._device(addr).read(memaddr, nbytes)
+            self._spend(nbytes)
+            return data
+
+    def readfrom_mem_into(self, addr: int, memaddr: int, buf, *, addrsize: int = 8) -> None:
+        with self._lock:
+            n = len(buf)
+            buf[:] = self._device(addr).read(memaddr, n)
+            self._spend(n)
+
+    def writeto_mem(self, addr: int, memaddr: int, buf, *, addrsize: int = 8) -> None:
+        with self._lock:
+            self._device(addr).write(memaddr, bytes(buf))
+            self._spend(len(buf))
+
+    def _device(self, addr: int):
+        if self._failures:
+            self._failures -= 1
+            self.errors += 1
+            raise OSError(self._errno)
+
+        device = self.devices.get(addr)
+
+        if device is None:
+            # what machine.I2C raises when nothing ACKs the address
+            raise OSError(ENODEV)
+
+        return device
+
+    def _spend(self, nbytes: int) -> None:
+        self.transactions += 1
+        self.bytes += nbytes
+        us = self.latency_us + self.byte_us * nbytes
+
+        if us <= 0:
+            return
+
+        end = time.perf_counter() + us / 1000000
+
+        while time.perf_counter() < end:
+            pass
@@ -0,0 +1,296 @@
+"""
+Register-level MPU6050 for the simulated I2C bus.
+
+The device keeps the register map of the chip and produces samples on
+its own clock at the rate set by SMPLRT_DIV and CONFIG. Every bus access
+first catches the device up to the current time: the data registers hold
+the newest sample, INT_STATUS flags data ready (cleared on read), and with
+the FIFO enabled every sample is appended in the chip's order (accel,
+temp, gyro, as selected by FIFO_EN) until its 1024 bytes overflow.
+
+Samples come from a Motion model in deg/s and g, are scaled by the range
+registers and shifted by the offset registers the way the chip does:
+XA_OFFS in +-16 g LSB relative to the factory trim (bit 0 is reserved),
+XG_OFFS_USR in +-1000 deg/s LSB.
+
+With int_pin set, a thread pulses that pin (see sim.pins) at every sample
+while DATA_RDY is enabled in INT_ENABLE, like the INT output would.
+"""
+
+import random
+import struct
+import threading
+import time
+from math import cos, exp, pi, sin
+
+SMPLRT_DIV = 0x19
+CONFIG = 0x1A
+GYRO_CONFIG = 0x1B
+ACCEL_CONFIG = 0x1C
+FIFO_EN = 0x23
+INT_PIN_CFG = 0x37
+INT_ENABLE = 0x38
+INT_STATUS = 0x3A
+ACCEL_XOUT_H = 0x3B
+USER_CTRL = 0x6A
+PWR_MGMT_1 = 0x6B
+FIFO_COUNTH = 0x72
+FIFO_R_W = 0x74
+WHO_AM_I = 0x75
+XA_OFFS = 0x06
+XG_OFFS_USR = 0x13
+
+FIFO_SIZE = 1024
+INT_DATA_RDY = 0x01
+INT_FIFO_OFLOW = 0x10
+
+# accel and gyro LSB per unit for the FS_SEL / AFS_SEL values 0..3
+ACCEL_SCALES = (16384.0, 8192.0, 4096.0, 2048.0)
+GYRO_SCALES = (131.0, 65.5, 32.8, 16.4)
+
+RAD_TO_DEG = 180.0 / pi
+
+
+class Motion:
+    """
+    Synthetic motion of the board, in deg/s and g.
+
+    The board lies still for still_s seconds, then rolls and pitches
+    sinusoidally with consistent gyro rates and gravity vector. Gyro bias
+    drifts with the die temperature, which warms up exponentially.
+    """
+
+    def __init__(self, still_s: float = 2.0, amplitude_deg: float = 30.0,
+                 gyro_noise: float = 0.05, accel_noise: float = 0.004,
+                 gyro_bias=(0.8, -0.5, 0.3), bias_per_c: float = 0.02,
+                 temp_start: float = 25.0, temp_end: float = 35.0,
+                 warmup_s: float = 300.0, seed: int = 1):
+        self.still_s = still_s
+        self.amplitude = amplitude_deg / RAD_TO_DEG
+        self.gyro_noise = gyro_noise
+        self.accel_noise = accel_noise
+        self.gyro_bias = gyro_bias
+        self.bias_per_c = bias_per_c
+        self.temp_start = temp_start
+        self.temp_end = temp_end
+        self.warmup_s = warmup_s
+        self._rng = random.Random(seed)
+
+    def temperature(self, t: float) -> float:
+        return self.temp_end - (self.temp_end - self.temp_start) * exp(-t / self.warmup_s)
+
+    def __call__(self, t: float) -> tuple:
+        """Returns ((gx, gy, gz), (ax, ay, az), temp) at t seconds after power on."""
+        temp = self.temperature(t)
+        drift = (temp - self.temp_start) * self.bias_per_c
+        m = max(0.0, t - self.still_s)
+        a = self.amplitude if t > self.still_s else 0.0
+
+        roll = a * sin(2 * pi * 0.3 * m)
+        pitch = 0.7 * a * sin(2 * pi * 0.17 * m)
+        roll_rate = a * 2 * pi * 0.3 * cos(2 * pi * 0.3 * m)
+        pitch_rate = 0.7 * a * 2 * pi * 0.17 * cos(2 * pi * 0.17 * m)
+
+        # body rates for ZYX Euler angles with constant yaw
+        rates = (roll_rate, pitch_rate * cos(roll), -pitch_rate * sin(roll))
+        gauss = self._rng.gauss
+
+        gyro = tuple(r * RAD_TO_DEG + b + drift + gauss(0, self.gyro_noise)
+                     for r, b in zip(rates, self.gyro_bias))
+        accel = (
+            -sin(pitch) + gauss(0, self.accel_noise),
+            sin(roll) * cos(pitch) + gauss(0, self.accel_noise),
+            cos(roll) * cos(pitch) + gauss(0, self.accel_noise),
+        )
+
+        return gyro, accel, temp
+
+
+class SimMPU6050:
+    def __init__(self, address: int = 0x68, motion=None, int_pin=None,
+                 factory_accel_offsets=(-2410, 1208, 1592), clock=time.perf_counter):
+        """
+        Args:
+            address (int, optional): I2C address. Defaults to 0x68.
+            motion (callable, optional): t -> ((gx, gy, gz), (ax, ay, az), temp). Defaults to Motion().
+            int_pin (optional): Id of the pin in sim.pins the INT output drives, None for none. Defaults to None.
+            factory_accel_offsets (tuple, optional): XA_OFFS after reset. Defaults to (-2410, 1208, 1592).
+            clock (callable, optional): Seconds, monotonic. Defaults to time.perf_counter.
+        """
+        self.address = address
+        self.motion = motion if motion else Motion()
+        self.int_pin = int_pin
+        self.factory_accel_offsets = factory_accel_offsets
+        self.clock = clock
+        self.regs = bytearray(128)
+        self.fifo = bytearray()
+        self.samples = 0
+
+        self._power_on = clock()
+        self._int_thread = None
+        self._int_stop = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Power-on register values, as after DEVICE_RESET."""
+        regs = self.regs
+        regs[:] = bytes(len(regs))
+        regs[PWR_MGMT_1] = 0x40
+        regs[WHO_AM_I] = 0x68
+        struct.pack_into(">hhh", regs, XA_OFFS, *self.factory_accel_offsets)
+        self.fifo = bytearray()
+        self._rebase()
+        self._update_int_thread()
+
+    def rate_hz(self) -> float:
+        dlpf = self.regs[CONFIG] & 0x07
+        base = 8000 if dlpf in (0, 7) else 1000
+        return base / (1 + self.regs[SMPLRT_DIV])
+
+    def read(self, register: int, n: int) -> bytes:
+        self._update()
+        struct.pack_into(">H", self.regs, FIFO_COUNTH, len(self.fifo))
+
+        if register == FIFO_R_W:
+            data = bytes(self.fifo[:n])
+            del self.fifo[:n]
+            # reads past the end get zeros
+            return data + bytes(n - len(data))
+
+        data = bytes(self.regs[register:register + n])
+
+        if register <= INT_STATUS < register + n:
+            self.regs[INT_STATUS] = 0
+
+        return data
+
+    def write(self, register: int, data) -> None:
+        self._update()
+
+        for i, value in enumerate(data):
+            self._write_register(register + i, value)
+
+    def _write_register(self, register: int, value: int) -> None:
+        if register == PWR_MGMT_1 and value & 0x80:
+            self.reset()
+            return
+
+        if register == FIFO_R_W:
+            return
+
+        previous = self.regs[register]
+        self.regs[register] = value
+
+        if register == USER_CTRL and value & 0x04:
+            # FIFO_RESET clears itself
+            self.fifo = bytearray()
+            self.regs[USER_CTRL] = value & ~0x04
+            self.regs[INT_STATUS] &= ~INT_FIFO_OFLOW
+        elif register in (SMPLRT_DIV, CONFIG) and value != previous:
+            self._rebase()
+        elif register == PWR_MGMT_1 and (previous ^ value) & 0x40:
+            self._rebase()
+        elif register == INT_ENABLE:
+            self._update_int_thread()
+
+    def _rebase(self) -> None:
+        """Restarts the sample clock, after a rate change or wake up."""
+        self._base = self.clock()
+        self._emitted = 0
+
+    def _update(self) -> None:
+        """Produces the samples due since the last access."""
+        regs = self.regs
+
+        if regs[PWR_MGMT_1] & 0x40:
+            return
+
+        rate = self.rate_hz()
+        due = int((self.clock() - self._base) * rate)
+        new = due - self._emitted
+
+        if new <= 0:
+            return
+
+        fifo_on = regs[USER_CTRL] & 0x40 and regs[FIFO_EN]
+        # samples beyond what the FIFO (12-byte frames at least) holds only overflow it
+        skip = max(0, new - (FIFO_SIZE // 12 + 1 if fifo_on else 1))
+
+        if skip and fifo_on:
+            regs[INT_STATUS] |= INT_FIFO_OFLOW
+
+        for k in range(self._emitted + skip + 1, due + 1):
+            t = self._base - self._power_on + k / rate
+            self._sample(t, fifo_on)
+
+        self._emitted = due
+        self.samples += new
+        regs[INT_STATUS] |= INT_DATA_RDY
+
+    def _sample(self, t: float, fifo_on: bool) -> None:
+        regs = self.regs
+        gyro, accel, temp = self.motion(t)
+        accel_scale = ACCEL_SCALES[(regs[ACCEL_CONFIG] >> 3) & 3]
+        gyro_scale = GYRO_SCALES[(regs[GYRO_CONFIG] >> 3) & 3]
+        xa = struct.unpack_from(">hhh", regs, XA_OFFS)
+        xg = struct.unpack_from(">hhh", regs, XG_OFFS_USR)
+
+        values = [
+            accel[i] * accel_scale
+            + ((xa[i] & ~1) - (self.factory_accel_offsets[i] & ~1)) * accel_scale / 2048.0
+            for i in range(3)
+        ]
+        values.append((temp - 36.53) * 340.0)
+        values += [gyro[i] * gyro_scale + xg[i] * gyro_scale / 32.8 for i in range(3)]
+
+        raw = struct.pack(">7h", *(max(-32768, min(32767, int(round(v)))) for v in values))
+        regs[ACCEL_XOUT_H:ACCEL_XOUT_H + 14] = raw
+
+        if not fifo_on:
+            return
+
+        enabled = regs[FIFO_EN]
+        frame = b""
+
+        if enabled & 0x08:
+            frame += raw[0:6]
+        if enabled & 0x80:
+            frame += raw[6:8]
+        for bit, start in ((0x40, 8), (0x20, 10), (0x10, 12)):
+            if enabled & bit:
+                frame += raw[start:start + 2]
+
+        if len(self.fifo) + len(frame) > FIFO_SIZE:
+            regs[INT_STATUS] |= INT_FIFO_OFLOW
+            return
+
+        self.fifo += frame
+
+    def _update_int_thread(self) -> None:
+        enabled = self.regs[INT_ENABLE] & INT_DATA_RDY and self.int_pin is not None
+
+        if enabled and self._int_thread is None:
+            self._int_stop = threading.Event()
+            self._int_thread = threading.Thread(
+                target=self._drive_int, args=(self._int_stop,), daemon=True)
+            self._int_thread.start()
+        elif not enabled and self._int_thread is not None:
+            self._int_stop.set()
+            self._int_thread = None
+
+    def _drive_int(self, stop) -> None:
+        import sim
+
+        while not stop.is_set():
+            rate = self.rate_hz()
+            elapsed = self.clock() - self._base
+            next_sample = (int(elapsed * rate) + 1) / rate
+            time.sleep(max(0.0, next_sample - elapsed))
+
+            if stop.is_set() or self.regs[PWR_MGMT_1] & 0x40:
+                continue
+
+            pin = sim.pins.get(self.int_pin)
+
+            if pin is not None:
+                pin.fire()
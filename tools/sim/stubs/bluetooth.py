@@ -0,0 +1,169 @@
+"""
+bluetooth module for the simulated board, see sim/__init__.py.
+
+There is no radio, a test plays the central with the sim_* methods of
+BLE: sim_connect() connects and reports the MTU and connection interval,
+sim_write() writes a characteristic. Notifications go to on_notify(conn,
+handle, data) if set. The stack queues NOTIFY_QUEUE notifications per
+connection interval and refuses more with OSError, like NimBLE does when
+it runs out of buffers.
+"""
+
+import time
+
+FLAG_BROADCAST = 0x0001
+FLAG_READ = 0x0002
+FLAG_WRITE_NO_RESPONSE = 0x0004
+FLAG_WRITE = 0x0008
+FLAG_NOTIFY = 0x0010
+FLAG_INDICATE = 0x0020
+
+ENOMEM = 12
+
+_IRQ_CENTRAL_CONNECT = 1
+_IRQ_CENTRAL_DISCONNECT = 2
+_IRQ_GATTS_WRITE = 3
+_IRQ_MTU_EXCHANGED = 21
+_IRQ_CONNECTION_UPDATE = 27
+
+NOTIFY_QUEUE = 4
+
+
+class UUID:
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return "UUID({!r})".format(self.value)
+
+
+class BLE:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            ble = super().__new__(cls)
+            ble._active = False
+            ble._config = {"mtu": 23, "gap_name": "MPY"}
+            ble._handler = None
+            ble._values = {}
+            ble._append = set()
+            ble._next_handle = 1
+            # conn_handle -> [mtu, interval_ms, interval start, notifications in it]
+            ble._connections = {}
+            ble.advertising = None
+            ble.on_notify = None
+            ble.notifications = 0
+            ble.refused = 0
+            cls._instance = ble
+
+        return cls._instance
+
+    def active(self, active=None):
+        if active is None:
+            return self._active
+
+        self._active = bool(active)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config[args[0]]
+
+        self._config.update(kwargs)
+
+    def irq(self, handler):
+        self._handler = handler
+
+    def gatts_register_services(self, services):
+        handles = []
+
+        for _, characteristics in services:
+            service = []
+
+            for _ in characteristics:
+                service.append(self._next_handle)
+                self._values[self._next_handle] = b""
+                self._next_handle += 1
+
+            handles.append(tuple(service))
+
+        return tuple(handles)
+
+    def gatts_set_buffer(self, value_handle, len, append=False):
+        if append:
+            self._append.add(value_handle)
+
+    def gatts_read(self, value_handle):
+        value = self._values[value_handle]
+
+        if value_handle in self._append:
+            # append mode buffers writes until they are read
+            self._values[value_handle] = b""
+
+        return value
+
+    def gatts_write(self, value_handle, data, send_update=False):
+        self._values[value_handle] = bytes(data)
+
+    def gatts_notify(self, conn_handle, value_handle, data=None):
+        connection = self._connections[conn_handle]
+        now = time.monotonic()
+
+        if (now - connection[2]) * 1000 >= connection[1]:
+            connection[2] = now
+            connection[3] = 0
+
+        if connection[3] >= NOTIFY_QUEUE:
+            self.refused += 1
+            raise OSError(ENOMEM)
+
+        connection[3] += 1
+        self.notifications += 1
+        payload = bytes(data if data is not None else self._values[value_handle])
+
+        if len(payload) > connection[0] - 3:
+            raise ValueError("notification larger than the MTU")
+
+        if self.on_notify:
+            self.on_notify(conn_handle, value_handle, payload)
+
+    def gap_advertise(self, interval_us, adv_data=None, resp_data=None, connectable=True):
+        self.advertising = interval_us
+
+    def gap_disconnect(self, conn_handle):
+        if self._connections.pop(conn_handle, None) is None:
+            return False
+
+        self._irq(_IRQ_CENTRAL_DISCONNECT, (conn_handle, 0, b"\x00" * 6))
+        return True
+
+    def gattc_exchange_mtu(self, conn_handle):
+        connection = self._connections[conn_handle]
+        connection[0] = min(self._config["mtu"], connection[0])
+        self._irq(_IRQ_MTU_EXCHANGED, (conn_handle, connection[0]))
+
+    def sim_connect(self, conn_handle=0, mtu=247, interval_ms=30):
+        """Connects a central that accepts up to mtu."""
+        self._connections[conn_handle] = [mtu, interval_ms, time.monotonic(), 0]
+        self.advertising = None
+        self._irq(_IRQ_CENTRAL_CONNECT, (conn_handle, 0, b"\x00" * 6))
+        self._irq(_IRQ_CONNECTION_UPDATE, (conn_handle, interval_ms * 4 // 5, 0, 400, 0))
+
+    def sim_write(self, conn_handle, value_handle, data):
+        """Writes a characteristic from the central."""
+        if value_handle in self._append:
+            self._values[value_handle] += bytes(data)
+        else:
+            self._values[value_handle] = bytes(data)
+
+        self._irq(_IRQ_GATTS_WRITE, (conn_handle, value_handle))
+
+    def _irq(self, event, data):
+        if self._handler:
+            self._handler(event, data)
@@ -0,0 +1,139 @@
+"""machine module for the simulated board, see sim/__init__.py."""
+
+import threading
+import time
+
+import sim
+
+_freq = 240000000
+
+
+def freq(hz=None):
+    global _freq
+
+    if hz is None:
+        return _freq
+
+    _freq = hz
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def unique_id():
+    return b"\x24\x0a\xc4\x00\x00\x01"
+
+
+def idle():
+    time.sleep(0)
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = value or 0
+        self._handler = None
+        self._trigger = 0
+        sim.pins[id] = self
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+
+        self._value = 1 if value else 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self._handler = handler
+        self._trigger = trigger
+
+    def fire(self):
+        """Pulses the pin high and low, as the sensor's INT output does."""
+        handler = self._handler
+
+        if handler and self._trigger & self.IRQ_RISING:
+            handler(self)
+
+
+class I2C:
+    def __init__(self, id=0, *, scl=None, sda=None, freq=400000, timeout=50000):
+        self.bus = sim.bus
+
+    def scan(self):
+        return self.bus.scan()
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
+        return self.bus.readfrom_mem(addr, memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        self.bus.readfrom_mem_into(addr, memaddr, buf)
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        self.bus.writeto_mem(addr, memaddr, buf)
+
+
+class SoftI2C(I2C):
+    def __init__(self, scl=None, sda=None, *, freq=400000, timeout=50000):
+        super().__init__(scl=scl, sda=sda, freq=freq, timeout=timeout)
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.id = id
+        self._stop = None
+
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, *, mode=PERIODIC, period=-1, freq=None, callback=None):
+        self.deinit()
+
+        if freq:
+            period = 1000 / freq
+
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(self._stop, mode, period / 1000, callback),
+                         daemon=True).start()
+
+    def deinit(self):
+        if self._stop:
+            self._stop.set()
+            self._stop = None
+
+    def _run(self, stop, mode, period, callback):
+        deadline = time.perf_counter()
+
+        while True:
+            # deadlines do not drift with the callback's run time, like the hardware timer
+            deadline += period
+            delay = deadline - time.perf_counter()
+
+            if delay > 0:
+                time.sleep(delay)
+
+            if stop.is_set():
+                return
+
+            if callback:
+                callback(self)
+
+            if mode == self.ONE_SHOT:
+                return
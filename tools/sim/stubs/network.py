@@ -0,0 +1,75 @@
+"""network module for the simulated board, see sim/__init__.py."""
+
+import time
+
+STA_IF = 0
+AP_IF = 1
+
+AUTH_OPEN = 0
+AUTH_WEP = 1
+AUTH_WPA_PSK = 2
+AUTH_WPA2_PSK = 3
+AUTH_WPA_WPA2_PSK = 4
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+
+# time a station takes to join, roughly what the ESP32 needs
+CONNECT_DELAY_S = 0.5
+
+_interfaces = {}
+
+
+class WLAN:
+    def __new__(cls, interface=STA_IF):
+        # one object per interface, like the firmware
+        if interface not in _interfaces:
+            wlan = super().__new__(cls)
+            wlan._interface = interface
+            wlan._active = False
+            wlan._connected_at = None
+            wlan._config = {"essid": "", "channel": 1, "mac": b"\x24\x0a\xc4\x00\x00\x01"}
+            _interfaces[interface] = wlan
+
+        return _interfaces[interface]
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._active
+
+        self._active = bool(is_active)
+
+        if not self._active:
+            self._connected_at = None
+
+    def connect(self, ssid=None, key=None, *, bssid=None):
+        self._config["essid"] = ssid
+        self._connected_at = time.monotonic() + CONNECT_DELAY_S
+
+    def disconnect(self):
+        self._connected_at = None
+
+    def isconnected(self):
+        if self._interface == AP_IF:
+            return self._active
+
+        return self._connected_at is not None and time.monotonic() >= self._connected_at
+
+    def status(self, param=None):
+        if self.isconnected():
+            return STAT_GOT_IP
+
+        return STAT_CONNECTING if self._connected_at else STAT_IDLE
+
+    def scan(self):
+        return [(b"sim", b"\x00\x11\x22\x33\x44\x55", 1, -40, AUTH_WPA2_PSK, False)]
+
+    def ifconfig(self, config=None):
+        return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config.get(args[0])
+
+        self._config.update(kwargs)